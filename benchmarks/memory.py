@@ -0,0 +1,111 @@
+"""
+Reports the bytes taken per Node and per Edge when building the het.io graph, for the current slotted classes ("after")
+and for the previous layout that kept one metadata dict per object ("before").
+
+    python -m benchmarks.memory --hetio integrate/data/hetnet.json.bz2
+"""
+import argparse
+import gc
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from utils.hetio import build_nodes, build_edges
+from utils.logger import log
+from utils.sources import load_hetio
+
+HETIO_FILE_PATH = "integrate/data/hetnet.json.bz2"
+
+
+class LegacyNode(object):
+    def __init__(self, identifier, name, kind, sources, license, source_url):
+        if type(sources) == str:
+            sources = [sources]
+
+        self._metadata = {
+            "identifier": identifier,
+            "name": name,
+            "kind": kind,
+            "sources": sources,
+            "license": license,
+            "source_url": source_url,
+            "mesh_ids": [],
+            "umls_cuis": []
+        }
+
+
+class LegacyEdge(object):
+    def __init__(self, source, destination, kind, sources):
+        if type(sources) == str:
+            sources = [sources]
+
+        self._metadata = {
+            "source": source,
+            "destination": destination,
+            "kind": kind,
+            "sources": sources
+        }
+
+
+def build_legacy_nodes(hetio: Dict) -> List[LegacyNode]:
+    return [LegacyNode(h["identifier"], h["name"], h["kind"],
+                       h["data"].get("source", None) or h["data"].get("sources", []),
+                       h["data"].get("license", None),
+                       h["data"].get("url", None))
+            for h in hetio["nodes"]]
+
+
+def build_legacy_edges(hetio: Dict, nodes: List[LegacyNode]) -> List[LegacyEdge]:
+    node_dict = {(n._metadata["kind"], n._metadata["identifier"]): n for n in nodes}
+    edges = []
+
+    for hetio_edge in hetio["edges"]:
+        src_node = node_dict[tuple(hetio_edge["source_id"])]
+        dst_node = node_dict[tuple(hetio_edge["target_id"])]
+        kind = hetio_edge["kind"]
+        sources = hetio_edge["data"].get("source", None) or hetio_edge["data"].get("sources", [])
+
+        edges.append(LegacyEdge(src_node, dst_node, kind, sources))
+        if hetio_edge["direction"] == "both":
+            edges.append(LegacyEdge(dst_node, src_node, kind + "_inv", sources))
+
+    return edges
+
+
+def measure(build: Callable[[], List[object]]) -> Tuple[List[object], int]:
+    """
+    Returns the built objects and the number of bytes still allocated by the build once it has returned.
+    """
+    gc.collect()
+    before, _ = tracemalloc.get_traced_memory()
+    objects = build()
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+
+    return objects, after - before
+
+
+def main(hetio_path: str):
+    hetio = load_hetio(hetio_path, stream=True)
+    tracemalloc.start()
+
+    legacy_nodes, legacy_node_bytes = measure(lambda: build_legacy_nodes(hetio))
+    legacy_edges, legacy_edge_bytes = measure(lambda: build_legacy_edges(hetio, legacy_nodes))
+    del legacy_nodes, legacy_edges
+
+    nodes, node_bytes = measure(lambda: build_nodes(hetio, force_rebuild=True, save_checkpoint=False))
+    edges, edge_bytes = measure(lambda: build_edges(hetio, nodes, force_rebuild=True, save_checkpoint=False))
+
+    tracemalloc.stop()
+
+    log.info(f"{len(nodes)} nodes: {legacy_node_bytes / len(nodes):.1f} bytes/node before, "
+             f"{node_bytes / len(nodes):.1f} bytes/node after.")
+    log.info(f"{len(edges)} edges: {legacy_edge_bytes / len(edges):.1f} bytes/edge before, "
+             f"{edge_bytes / len(edges):.1f} bytes/edge after.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory taken by het.io nodes and edges.")
+    parser.add_argument("--hetio", default=HETIO_FILE_PATH)
+    args = parser.parse_args()
+
+    main(args.hetio)
@@ -0,0 +1,36 @@
+"""
+Times repodb.build_nodes and repodb.build_edges on synthetic repoDB data at several multiples of the real size.
+
+    python -m benchmarks.repodb --scales 1 10 100
+"""
+import argparse
+import time
+from typing import List
+
+from benchmarks.synthetic import synthetic_repodb
+from utils.logger import log
+from utils.repodb import build_nodes, build_edges
+
+
+def main(scales: List[float]):
+    for scale in scales:
+        repodb = synthetic_repodb(scale)
+
+        start = time.time()
+        nodes = build_nodes(repodb, force_rebuild=True, save_checkpoint=False)
+        node_time = time.time() - start
+
+        start = time.time()
+        edges = build_edges(repodb, nodes, force_rebuild=True, save_checkpoint=False, include_inverse=True)
+        edge_time = time.time() - start
+
+        log.info(f"{scale}x ({len(repodb)} rows): {len(nodes)} nodes in {node_time:.2f}s, "
+                 f"{len(edges)} edges in {edge_time:.2f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="repoDB builders on synthetic data.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+
+    main(args.scales)
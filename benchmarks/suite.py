@@ -0,0 +1,279 @@
+"""
+Times the builders, checkpoint round-trips, build_graph and overlap.py on synthetic inputs (see benchmarks/synthetic)
+at several multiples of the real size, and saves the timings to BENCHMARK_DIR/<commit>.<time>.json so that runs can be
+compared across commits.
+
+    python -m benchmarks.suite --scales 0.01 0.1
+    python -m benchmarks.suite --compare outputs/benchmarks/<before>.json outputs/benchmarks/<after>.json
+
+Inputs are generated, and every checkpoint is written, in a temporary directory, so the checkpoints in outputs are left
+untouched. With the same seed the inputs are the same on every run.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List, Dict, Callable, NamedTuple, Optional, Tuple
+
+from benchmarks.synthetic import synthetic_hetio, synthetic_repodb, write_hetio, write_mrconso, \
+    write_disease_ontology
+from overlap import overlap
+from utils import hetio, repodb
+from utils.checkpoint import CHECKPOINT_FORMATS, checkpoint_path
+from utils.edge import Edge
+from utils.graph import build_graph
+from utils.logger import log
+from utils.node import Node
+from utils.sources import load_hetio, load_umls, load_repodb, load_disease_ontology
+
+BENCHMARK_DIR = "outputs/benchmarks"
+
+
+class BenchmarkResult(NamedTuple):
+    """
+    Timings of one benchmark at one scale: the fastest and median of its repeats, in seconds, and the number of records
+    it produced.
+    """
+    name: str
+    scale: float
+    records: Optional[int]
+    best: float
+    median: float
+    times: List[float]
+
+
+def timed(function: Callable[[], object], repeat: int) -> Tuple[object, List[float]]:
+    """
+    Runs function repeat times, after a garbage collection each, and returns its last result and every wall time.
+    """
+    times = []
+    result = None
+
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+
+    return result, times
+
+
+def count(result: object) -> Optional[int]:
+    """
+    Number of records of a benchmark's result, the result itself for counts returned by the save functions.
+    """
+    if isinstance(result, int):
+        return result
+
+    return len(result) if hasattr(result, "__len__") else None
+
+
+def generate_inputs(data_dir: str, scale: float, seed: int) -> Dict[str, str]:
+    """
+    Writes synthetic het.io, MRCONSO, Disease Ontology and repoDB files to data_dir and returns their paths.
+    """
+    start = time.time()
+    paths = {
+        "hetio": os.path.join(data_dir, "hetnet.json.bz2"),
+        "umls": os.path.join(data_dir, "MRCONSO.RRF"),
+        "do": os.path.join(data_dir, "doid.obo"),
+        "repodb": os.path.join(data_dir, "repodb.csv")
+    }
+
+    hetio_json = synthetic_hetio(scale, seed)
+    write_hetio(hetio_json, paths["hetio"])
+    write_mrconso(paths["umls"], hetio_json, scale, seed)
+    write_disease_ontology(paths["do"], hetio_json, scale, seed)
+    synthetic_repodb(scale, seed).to_csv(paths["repodb"], index=False)
+
+    log.info(f"Generated {scale}x inputs in {time.time() - start:.2f}s.")
+
+    return paths
+
+
+def run_scale(scale: float,
+              seed: int = 0,
+              repeat: int = 3,
+              formats: List[str] = None,
+              processes: int = None) -> List[BenchmarkResult]:
+    """
+    Runs every benchmark at one scale, in a temporary working directory. The sharded edge build uses processes workers,
+    one per CPU by default.
+    """
+    processes = processes or os.cpu_count() or 1
+    formats = CHECKPOINT_FORMATS if formats is None else formats
+    results = []
+
+    def run(name: str, function: Callable[[], object], records: Callable[[object], Optional[int]] = None) -> object:
+        result, times = timed(function, repeat)
+        ordered = sorted(times)
+        results.append(BenchmarkResult(name, scale, (records or count)(result), ordered[0], ordered[len(ordered) // 2],
+                                       times))
+        log.info(f"{name} at {scale}x: {ordered[0]:.3f}s best of {repeat}.")
+
+        return result
+
+    working_dir = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            os.makedirs("outputs")
+            paths = generate_inputs(temp_dir, scale, seed)
+
+            hetio_json = run("sources.load_hetio", lambda: load_hetio(paths["hetio"]),
+                             lambda h: len(h["nodes"]) + len(h["edges"]))
+            umls = run("sources.load_umls",
+                       lambda: load_umls(paths["umls"], sabs=hetio.UMLS_SABS, use_cache=False))
+            do = run("sources.load_disease_ontology", lambda: load_disease_ontology(paths["do"], use_cache=False))
+            repodb_csv = run("sources.load_repodb", lambda: load_repodb(paths["repodb"]))
+
+            hetio_nodes = run("hetio.build_nodes", lambda: hetio.build_nodes(hetio_json, umls=umls, do=do,
+                                                                            force_rebuild=True, save_checkpoint=False))
+            hetio_edges = run("hetio.build_edges", lambda: hetio.build_edges(hetio_json, hetio_nodes,
+                                                                            force_rebuild=True, save_checkpoint=False))
+            run("hetio.build_edges.sharded",
+                lambda: hetio.build_edges(hetio_json, hetio_nodes, processes=max(2, processes), force_rebuild=True,
+                                          save_checkpoint=False))
+            repodb_nodes = run("repodb.build_nodes",
+                               lambda: repodb.build_nodes(repodb_csv, force_rebuild=True, save_checkpoint=False))
+            run("repodb.build_edges", lambda: repodb.build_edges(repodb_csv, repodb_nodes, include_inverse=True,
+                                                                force_rebuild=True, save_checkpoint=False))
+
+            index = Node.index_bunch(hetio_nodes)
+            for checkpoint_format in formats:
+                nodes_path = checkpoint_path(hetio.NODES_CHECKPOINT, checkpoint_format)
+                edges_path = checkpoint_path(hetio.EDGES_CHECKPOINT, checkpoint_format)
+
+                run(f"checkpoint.save_nodes.{checkpoint_format}",
+                    lambda: Node.save_checkpoint(hetio_nodes, nodes_path, checkpoint_format))
+                run(f"checkpoint.load_nodes.{checkpoint_format}",
+                    lambda: Node.load_checkpoint(nodes_path, checkpoint_format))
+                run(f"checkpoint.save_edges.{checkpoint_format}",
+                    lambda: Edge.save_checkpoint(hetio_edges, edges_path, checkpoint_format, hetio_nodes))
+                run(f"checkpoint.load_edges.{checkpoint_format}",
+                    lambda: Edge.load_checkpoint(edges_path, index, checkpoint_format))
+
+            # lazy views over columnar checkpoints, only creating the objects touched
+            nodes_path = checkpoint_path(hetio.NODES_CHECKPOINT, "columnar")
+            edges_path = checkpoint_path(hetio.EDGES_CHECKPOINT, "columnar")
+            repodb_nodes_path = checkpoint_path(repodb.NODES_CHECKPOINT, "columnar")
+            Node.save_checkpoint(hetio_nodes, nodes_path, "columnar")
+            Edge.save_checkpoint(hetio_edges, edges_path, "columnar", hetio_nodes)
+            Node.save_checkpoint(repodb_nodes, repodb_nodes_path, "columnar")
+
+            node_view = run("checkpoint.open_nodes.columnar",
+                            lambda: Node.load_checkpoint(nodes_path, "columnar", lazy=True))
+            run("checkpoint.open_edges.columnar",
+                lambda: Edge.load_checkpoint(edges_path, node_view, "columnar", lazy=True))
+            run("overlap.lazy", lambda: overlap(Node.load_checkpoint(nodes_path, "columnar", lazy=True),
+                                                Node.load_checkpoint(repodb_nodes_path, "columnar", lazy=True)),
+                lambda counts: counts["drug_overlap"] + counts["disease_overlap"])
+
+            for engine in ["networkx", "csr"]:
+                run(f"build_graph.{engine}",
+                    lambda: build_graph(hetio_nodes, hetio_edges, engine=engine, force_rebuild=True),
+                    lambda g: g.num_edges if engine == "csr" else g.number_of_edges())
+
+            run("overlap", lambda: overlap(hetio_nodes, repodb_nodes),
+                lambda counts: counts["drug_overlap"] + counts["disease_overlap"])
+        finally:
+            os.chdir(working_dir)
+
+    return results
+
+
+def git_revision() -> Tuple[Optional[str], bool]:
+    """
+    Commit checked out in the repository, and whether its working tree has uncommitted changes.
+    """
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=repository).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                text=True, check=True, cwd=repository).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+    return commit, len(status) > 0
+
+
+def save_results(results: List[BenchmarkResult], seed: int, repeat: int, output_dir: str = BENCHMARK_DIR) -> str:
+    commit, dirty = git_revision()
+    started = datetime.now()
+    name = f"{(commit or 'unknown')[:12]}{'-dirty' if dirty else ''}.{started.strftime('%Y%m%d-%H%M%S')}.json"
+    output_path = os.path.join(output_dir, name)
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(output_path, "w") as file:
+        json.dump({
+            "commit": commit,
+            "dirty": dirty,
+            "started": started.isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed,
+            "repeat": repeat,
+            "results": [r._asdict() for r in results]
+        }, file, indent=2)
+
+    log.info(f"Saved {len(results)} benchmark results to {output_path}.")
+
+    return output_path
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """
+    Prints the best time of every benchmark of two result files side by side, with the speedup of the second.
+    """
+    runs = []
+    for path in [before_path, after_path]:
+        with open(path) as file:
+            runs.append(json.load(file))
+
+    before, after = ({(r["name"], r["scale"]): r for r in run["results"]} for run in runs)
+
+    print(f"{'benchmark':<40} {'scale':>8} {'before':>10} {'after':>10} {'speedup':>8}")
+    for key in sorted(set(before) | set(after), key=lambda k: (k[1], k[0])):
+        times = [f"{run[key]['best']:.3f}s" if key in run else "-" for run in (before, after)]
+        speedup = f"{before[key]['best'] / after[key]['best']:.2f}x" \
+            if key in before and key in after and after[key]["best"] > 0 else "-"
+        print(f"{key[0]:<40} {key[1]:>8g} {times[0]:>10} {times[1]:>10} {speedup:>8}")
+
+
+def main(scales: List[float], seed: int, repeat: int, formats: List[str], processes: int, output_dir: str):
+    results = []
+
+    for scale in scales:
+        results += run_scale(scale, seed, repeat, formats, processes)
+
+    save_results(results, seed, repeat, output_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks on synthetic het.io, repoDB, UMLS and Disease Ontology "
+                                                 "data.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.01, 0.1])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--formats", nargs="+", default=CHECKPOINT_FORMATS, choices=CHECKPOINT_FORMATS)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output-dir", default=BENCHMARK_DIR)
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="Compare two saved result files instead of running the benchmarks.")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        main(args.scales, args.seed, args.repeat, args.formats, args.processes, os.path.abspath(args.output_dir))
@@ -0,0 +1,326 @@
+"""
+Generators for synthetic inputs shaped like the real ones, so the builders can be benchmarked without the licensed or
+remote data files.
+"""
+import bz2
+import csv
+import json
+from typing import Dict, Iterator, Union
+
+import numpy as np
+import pandas as pd
+
+# Size of repoDB (http://apps.chiragjpgroup.org/repoDB/) at the time of writing
+REPODB_ROWS = 10787
+REPODB_DRUGS = 1571
+REPODB_DISEASES = 2051
+REPODB_STATUSES = ["Approved", "Terminated", "Withdrawn", "Suspended"]
+REPODB_STATUS_WEIGHTS = [0.62, 0.28, 0.06, 0.04]
+
+
+def synthetic_repodb(scale: float = 1.0, seed: int = 0) -> pd.DataFrame:
+    """
+    repoDB-shaped DataFrame with scale times the rows, drugs and indications of the real file.
+    """
+    rng = np.random.RandomState(seed)
+    num_rows = int(REPODB_ROWS * scale)
+    num_drugs = max(1, int(REPODB_DRUGS * scale))
+    num_diseases = max(1, int(REPODB_DISEASES * scale))
+
+    drugs = rng.randint(0, num_drugs, size=num_rows)
+    diseases = rng.randint(0, num_diseases, size=num_rows)
+    statuses = rng.choice(REPODB_STATUSES, size=num_rows, p=REPODB_STATUS_WEIGHTS)
+
+    return pd.DataFrame({
+        "drug_name": [f"drug {i}" for i in drugs],
+        "drug_id": [f"DB{i:07d}" for i in drugs],
+        "ind_name": [f"indication {i}" for i in diseases],
+        "ind_id": [f"C{i:07d}" for i in diseases],
+        "NCT": [f"NCT{i:08d}" if s != "Approved" else np.nan for i, s in enumerate(statuses)],
+        "status": statuses,
+        "phase": [f"Phase {rng.randint(1, 4)}" if s != "Approved" else np.nan for s in statuses],
+        "DetailedStatus": np.nan
+    })
+
+
+# Node and edge counts of het.io v1.0 (https://github.com/hetio/hetionet), edges as (source kind, kind, target kind,
+# direction, count), "regulates" being the only directed metaedge
+HETIO_NODE_COUNTS = {
+    "Anatomy": 402,
+    "Biological Process": 11381,
+    "Cellular Component": 1391,
+    "Compound": 1552,
+    "Disease": 137,
+    "Gene": 20945,
+    "Molecular Function": 2884,
+    "Pathway": 1822,
+    "Pharmacologic Class": 345,
+    "Side Effect": 5734,
+    "Symptom": 438
+}
+HETIO_METAEDGES = [
+    ("Anatomy", "downregulates", "Gene", "both", 102240),
+    ("Anatomy", "expresses", "Gene", "both", 526407),
+    ("Anatomy", "upregulates", "Gene", "both", 97848),
+    ("Compound", "binds", "Gene", "both", 11571),
+    ("Compound", "causes", "Side Effect", "both", 138944),
+    ("Compound", "downregulates", "Gene", "both", 21102),
+    ("Compound", "palliates", "Disease", "both", 390),
+    ("Compound", "resembles", "Compound", "both", 6486),
+    ("Compound", "treats", "Disease", "both", 755),
+    ("Compound", "upregulates", "Gene", "both", 18756),
+    ("Disease", "associates", "Gene", "both", 12623),
+    ("Disease", "downregulates", "Gene", "both", 7623),
+    ("Disease", "localizes", "Anatomy", "both", 3602),
+    ("Disease", "presents", "Symptom", "both", 3357),
+    ("Disease", "resembles", "Disease", "both", 543),
+    ("Disease", "upregulates", "Gene", "both", 7731),
+    ("Gene", "covaries", "Gene", "both", 61690),
+    ("Gene", "interacts", "Gene", "both", 147164),
+    ("Gene", "participates", "Biological Process", "both", 559504),
+    ("Gene", "participates", "Cellular Component", "both", 73566),
+    ("Gene", "participates", "Molecular Function", "both", 97222),
+    ("Gene", "participates", "Pathway", "both", 84372),
+    ("Gene", "regulates", "Gene", "forward", 265672),
+    ("Pharmacologic Class", "includes", "Compound", "both", 1029)
+]
+HETIO_SOURCES = {
+    "Anatomy": ("Uberon", "CC BY 3.0"),
+    "Biological Process": ("Gene Ontology", "CC BY 4.0"),
+    "Cellular Component": ("Gene Ontology", "CC BY 4.0"),
+    "Compound": ("DrugBank", "CC BY-NC 4.0"),
+    "Disease": ("Disease Ontology", "CC BY 3.0"),
+    "Gene": ("Entrez Gene", "CC0 1.0"),
+    "Molecular Function": ("Gene Ontology", "CC BY 4.0"),
+    "Pathway": ("Pathway Commons", "CC BY 4.0"),
+    "Pharmacologic Class": ("FDA via DrugCentral", "CC BY 4.0"),
+    "Side Effect": ("UMLS via SIDER 4.1", "CC BY-NC-SA 4.0"),
+    "Symptom": ("MeSH", "CC0 1.0")
+}
+# Share of anatomies with a MeSH ID, of compounds and pharmacologic classes listed in UMLS, and of diseases with
+# cross-references in the Disease Ontology
+HETIO_XREF_FRACTION = 0.75
+
+# Size of MRCONSO.RRF in the 2020AA release and of the Disease Ontology
+MRCONSO_ROWS = 15000000
+MRCONSO_LANGUAGES = ["ENG", "SPA", "FRE", "GER", "JPN"]
+MRCONSO_LANGUAGE_WEIGHTS = [0.7, 0.1, 0.08, 0.07, 0.05]
+MRCONSO_SABS = ["MSH", "SNOMEDCT_US", "RXNORM", "MDR", "NCI", "LNC"]
+MRCONSO_COLUMNS = ["CUI", "LAT", "TS", "LUI", "STT", "SUI", "ISPREF", "AUI", "SAUI", "SCUI", "SDUI", "SAB", "TTY",
+                   "CODE", "STR", "SRL", "SUPPRESS", "CVF"]
+DISEASE_ONTOLOGY_TERMS = 11000
+
+# CUIs of compounds and of diseases absent from repoDB are drawn from ranges repoDB CUIs (C0000000 onwards) never reach
+COMPOUND_CUI_OFFSET = 5000000
+DISEASE_CUI_OFFSET = 8000000
+
+
+def scaled(count: int, scale: float) -> int:
+    return max(1, int(round(count * scale)))
+
+
+def hetio_identifier(kind: str, i: int) -> Union[str, int]:
+    """
+    Identifier of the i-th synthetic node of a kind, in the format het.io uses for it. Compounds are named like the
+    drugs of synthetic_repodb, so the two overlap.
+    """
+    if kind == "Anatomy":
+        return f"UBERON:{i:07d}"
+    if kind in ("Biological Process", "Cellular Component", "Molecular Function"):
+        offset = {"Biological Process": 0, "Cellular Component": 1000000, "Molecular Function": 2000000}[kind]
+        return f"GO:{offset + i:07d}"
+    if kind == "Compound":
+        return f"DB{i:07d}"
+    if kind == "Disease":
+        return f"DOID:{i}"
+    if kind == "Gene":
+        return i + 1
+    if kind == "Pathway":
+        return f"PC7_{i}"
+    if kind == "Pharmacologic Class":
+        return f"N{i:010d}"
+    if kind == "Side Effect":
+        return f"C{i:07d}"
+    if kind == "Symptom":
+        return f"D{i:06d}"
+
+    raise ValueError(f"Unknown het.io node kind {kind}.")
+
+
+def disease_cui(i: int) -> str:
+    """
+    UMLS CUI the Disease Ontology lists for the i-th synthetic disease. Three in four are repoDB indication IDs, see
+    synthetic_repodb.
+    """
+    return f"C{i:07d}" if i % 4 != 3 else f"C{DISEASE_CUI_OFFSET + i:07d}"
+
+
+def synthetic_hetio(scale: float = 1.0, seed: int = 0) -> Dict:
+    """
+    het.io-shaped JSON tree with scale times the nodes of every kind and the edges of every metaedge of the real
+    network. Identifiers follow the het.io format of each kind (see hetio_identifier), node data carries the fields the
+    enrichers read, e.g. the MeSH ID of anatomies, and edges have the het.io directions.
+    """
+    rng = np.random.RandomState(seed)
+    counts = {kind: scaled(count, scale) for kind, count in HETIO_NODE_COUNTS.items()}
+    nodes = []
+
+    for kind, count in counts.items():
+        source, license = HETIO_SOURCES[kind]
+        has_xref = rng.random_sample(count) < HETIO_XREF_FRACTION
+
+        for i in range(count):
+            identifier = hetio_identifier(kind, i)
+            data = {"source": source, "license": license, "url": f"http://identifiers.org/{identifier}"}
+            if kind == "Anatomy" and has_xref[i]:
+                data["mesh_id"] = f"D{500000 + i:06d}"
+            elif kind == "Pharmacologic Class":
+                data["class_type"] = "Chemical/Ingredient"
+
+            nodes.append({"kind": kind, "identifier": identifier, "name": f"{kind.lower()} {i}", "data": data})
+
+    edges = []
+
+    for source_kind, kind, target_kind, direction, count in HETIO_METAEDGES:
+        num_sources, num_targets = counts[source_kind], counts[target_kind]
+        count = min(scaled(count, scale), num_sources * num_targets)
+
+        # distinct pairs, as het.io has no parallel edges of the same metaedge
+        keys = np.unique(rng.randint(0, num_sources * num_targets, size=2 * count))
+        keys = rng.permutation(keys)[:count]
+
+        for key in keys.tolist():
+            edges.append({
+                "source_id": [source_kind, hetio_identifier(source_kind, key // num_targets)],
+                "target_id": [target_kind, hetio_identifier(target_kind, key % num_targets)],
+                "kind": kind,
+                "direction": direction,
+                "data": {"source": f"{source_kind} {kind} {target_kind}", "unbiased": bool(key % 2)}
+            })
+
+    return {
+        "metanode_kinds": list(counts.keys()),
+        "metaedge_tuples": [[s, t, k, d] for s, k, t, d, _ in HETIO_METAEDGES],
+        "nodes": nodes,
+        "edges": edges
+    }
+
+
+def write_hetio(hetio: Dict, file_path: str) -> None:
+    """
+    Writes a het.io JSON tree as hetnet.json.bz2 does, for sources.load_hetio.
+    """
+    with bz2.open(file_path, "wt", encoding="utf-8") as file:
+        json.dump(hetio, file)
+
+
+def mrconso_chunks(hetio: Dict,
+                   scale: float = 1.0,
+                   seed: int = 0,
+                   chunk_size: int = 1000000) -> Iterator[pd.DataFrame]:
+    """
+    MRCONSO-shaped rows, chunk_size at a time, about scale times as many as in the real file. The het.io compounds and
+    pharmacologic classes are listed, mostly, under the DRUGBANK and NDFRT/MED-RT sources with one to three CUIs each,
+    and the rest are filler rows of other sources and languages.
+    """
+    rng = np.random.RandomState(seed)
+    codes, sabs, cuis, names = [], [], [], []
+
+    for i, node in enumerate(hetio["nodes"]):
+        if node["kind"] not in ("Compound", "Pharmacologic Class") or rng.random_sample() >= HETIO_XREF_FRACTION:
+            continue
+
+        for j in range(rng.randint(1, 4)):
+            codes.append(node["identifier"])
+            sabs.append("DRUGBANK" if node["kind"] == "Compound" else ["NDFRT", "MED-RT"][j % 2])
+            cuis.append(f"C{COMPOUND_CUI_OFFSET + 3 * i + j:07d}")
+            names.append(node["name"])
+
+    mapped = _mrconso_frame(np.array(cuis, dtype=object), np.full(len(cuis), "ENG", dtype=object),
+                            np.array(sabs, dtype=object), np.array(codes, dtype=object),
+                            np.array(names, dtype=object), 0)
+    total = max(len(mapped), int(MRCONSO_ROWS * scale))
+
+    yield mapped
+
+    for start in range(len(mapped), total, chunk_size):
+        size = min(chunk_size, total - start)
+        concepts = rng.randint(0, max(1, total // 3), size=size)
+        cuis = np.char.add("C", np.char.zfill(concepts.astype(str), 7)).astype(object)
+        languages = rng.choice(MRCONSO_LANGUAGES, size=size, p=MRCONSO_LANGUAGE_WEIGHTS).astype(object)
+        sabs = rng.choice(MRCONSO_SABS, size=size).astype(object)
+        codes = np.char.add("X", np.arange(start, start + size).astype(str)).astype(object)
+        names = np.char.add("concept ", concepts.astype(str)).astype(object)
+
+        yield _mrconso_frame(cuis, languages, sabs, codes, names, start)
+
+
+def _mrconso_frame(cuis: np.ndarray,
+                   languages: np.ndarray,
+                   sabs: np.ndarray,
+                   codes: np.ndarray,
+                   names: np.ndarray,
+                   start: int) -> pd.DataFrame:
+    atoms = np.arange(start, start + len(cuis)).astype(str)
+
+    return pd.DataFrame({
+        "CUI": cuis,
+        "LAT": languages,
+        "TS": "P",
+        "LUI": np.char.add("L", np.char.zfill(atoms, 7)),
+        "STT": "PF",
+        "SUI": np.char.add("S", np.char.zfill(atoms, 7)),
+        "ISPREF": "Y",
+        "AUI": np.char.add("A", np.char.zfill(atoms, 8)),
+        "SAUI": "",
+        "SCUI": "",
+        "SDUI": "",
+        "SAB": sabs,
+        "TTY": "PT",
+        "CODE": codes,
+        "STR": names,
+        "SRL": "0",
+        "SUPPRESS": "N",
+        "CVF": ""
+    }, columns=MRCONSO_COLUMNS)
+
+
+def write_mrconso(file_path: str, hetio: Dict, scale: float = 1.0, seed: int = 0) -> int:
+    """
+    Writes the rows of mrconso_chunks as MRCONSO.RRF does, pipe-delimited with a trailing pipe and no header, for
+    sources.load_umls. Returns the number of rows written.
+    """
+    count = 0
+
+    with open(file_path, "w", encoding="utf-8") as file:
+        for chunk in mrconso_chunks(hetio, scale, seed):
+            chunk["MISC"] = ""
+            chunk.to_csv(file, sep="|", header=False, index=False, quoting=csv.QUOTE_NONE)
+            count += len(chunk)
+
+    return count
+
+
+def write_disease_ontology(file_path: str, hetio: Dict, scale: float = 1.0, seed: int = 0) -> int:
+    """
+    Writes an OBO file shaped like doid.obo, with a term for every het.io disease, most of them with UMLS_CUI (see
+    disease_cui) and MESH cross-references, and filler terms up to scale times the size of the real ontology. Returns
+    the number of terms written.
+    """
+    rng = np.random.RandomState(seed)
+    diseases = [n for n in hetio["nodes"] if n["kind"] == "Disease"]
+    num_terms = max(len(diseases), scaled(DISEASE_ONTOLOGY_TERMS, scale))
+
+    with open(file_path, "w", encoding="utf-8") as file:
+        file.write("format-version: 1.2\nontology: doid\n")
+
+        for i in range(num_terms):
+            file.write(f"\n[Term]\nid: DOID:{i}\nname: disease {i}\n")
+            if i > 0:
+                file.write(f"is_a: DOID:{rng.randint(0, i)} ! disease\n")
+            if rng.random_sample() < HETIO_XREF_FRACTION:
+                file.write(f"xref: UMLS_CUI:{disease_cui(i)}\n")
+            if rng.random_sample() < HETIO_XREF_FRACTION:
+                file.write(f"xref: MESH:D{i:06d}\n")
+
+    return num_terms
@@ -1,12 +1,34 @@
 from utils import Node, Edge
+from utils.build_cache import BuildCache
 from utils.graph import build_graph
+from utils.instrumentation import write_report
 from utils.hetio import NODES_CHECKPOINT as HETIO_NODES_CHECKPOINT, EDGES_CHECKPOINT as HETIO_EDGE_CHECKPOINT
 from utils.logger import log
+from utils.merge import GraphSource, merge_graphs
+from utils.repodb import NODES_CHECKPOINT as REPODB_NODES_CHECKPOINT, EDGES_CHECKPOINT as REPODB_EDGE_CHECKPOINT
 
 if __name__ == "__main__":
-    nodes = Node.deserialize_bunch(HETIO_NODES_CHECKPOINT)
-    edges = Edge.deserialize_bunch(HETIO_EDGE_CHECKPOINT)
+    hetio_nodes = Node.deserialize_bunch(HETIO_NODES_CHECKPOINT)
+    hetio_edges = Edge.deserialize_bunch(HETIO_EDGE_CHECKPOINT, hetio_nodes)
+    repodb_nodes = Node.deserialize_bunch(REPODB_NODES_CHECKPOINT)
+    repodb_edges = Edge.deserialize_bunch(REPODB_EDGE_CHECKPOINT, repodb_nodes)
+
+    log.info("Merging het.io and repoDB...")
+    merged = merge_graphs([GraphSource("hetio", hetio_nodes, hetio_edges),
+                           GraphSource("repodb", repodb_nodes, repodb_edges)])
+    merged.save_provenance()
 
     log.info("Building graph...")
-    graph = build_graph(nodes, edges)
+    # the node checkpoints change whenever an enricher or the crosswalk adds IDs, which the graph store's node table
+    # holds, so a new MRCONSO reaches the graph stage through them
+    cache = BuildCache()
+    digests = {
+        "hetio_nodes": cache.digest_file(HETIO_NODES_CHECKPOINT),
+        "hetio_edges": cache.digest_file(HETIO_EDGE_CHECKPOINT),
+        "repodb_nodes": cache.digest_file(REPODB_NODES_CHECKPOINT),
+        "repodb_edges": cache.digest_file(REPODB_EDGE_CHECKPOINT)
+    }
+    graph = build_graph(merged.nodes, merged.edges, cache=cache, digests=digests)
     log.info("Finished building graph.")
+
+    write_report()
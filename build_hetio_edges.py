@@ -13,28 +13,48 @@ Node types:
      'Pharmacologic Class',
      'Side Effect',
      'Symptom']
+
+Inputs:
+    HETIO_FILE_PATH and UMLS_FILE_PATH (MRCONSO.RRF from a UMLS release) must exist locally. The Disease Ontology is
+    read from DISEASE_ONTOLOGY_FILE_PATH if present, and otherwise downloaded once from DISEASE_ONTOLOGY_URL.
 """
+import os
+
 from utils import load_hetio, load_umls, load_disease_ontology, log
-from utils.hetio import build_nodes, build_edges
+from utils.build_cache import BuildCache
+from utils.instrumentation import write_report
+from utils.hetio import build_nodes, build_edges, UMLS_SABS
+from utils.ontology import fetch_ontology
+from utils.sources import DISEASE_ONTOLOGY_URL
 
 UMLS_FILE_PATH = "MRCONSO.RRF"
 HETIO_FILE_PATH = "integrate/data/hetnet.json.bz2"
+DISEASE_ONTOLOGY_FILE_PATH = "doid.obo"
 
 force_build = False
+processes = 4
 
 if __name__ == "__main__":
-    log.info("Building het.io from file.")
-    hetio = load_hetio(HETIO_FILE_PATH)
-    log.info("Finished building het.io from file.")
-
-    log.info("Initializing Disease Ontology.")
-    do = load_disease_ontology()
-    log.info("Finished initializing Disease Ontology.")
-
-    umls = load_umls(UMLS_FILE_PATH)
+    # the sources are only loaded if a stage using them has to be rebuilt
+    cache = BuildCache()
+    do_path = DISEASE_ONTOLOGY_FILE_PATH
+    if not os.path.exists(do_path):
+        do_path = fetch_ontology(DISEASE_ONTOLOGY_URL)
+    digests = {
+        "hetio": cache.digest_file(HETIO_FILE_PATH),
+        "umls": cache.digest_file(UMLS_FILE_PATH),
+        "do": cache.digest_file(do_path)
+    }
+    hetio = load_hetio(HETIO_FILE_PATH, stream=True)
 
     log.info("Building het.io nodes.")
-    hetio_nodes = build_nodes(hetio, force_rebuild=force_build, umls=umls, do=do)
+    hetio_nodes = build_nodes(hetio, force_rebuild=force_build,
+                              umls=lambda: load_umls(UMLS_FILE_PATH, sabs=UMLS_SABS),
+                              do=lambda: load_disease_ontology(do_path),
+                              cache=cache, digests=digests, processes=processes)
 
     log.info("Building het.io edges.")
-    hetio_edges = build_edges(hetio, hetio_nodes, force_rebuild=force_build)
+    hetio_edges = build_edges(hetio, hetio_nodes, force_rebuild=force_build, cache=cache, digests=digests,
+                              processes=processes)
+
+    write_report()
@@ -1,11 +1,40 @@
+import os
+
+from utils.build_cache import BuildCache
+from utils.crosswalk import build_crosswalk, CROSSWALK_SABS
+from utils.instrumentation import write_report
 from utils.repodb import build_nodes, build_edges
-from utils.sources import load_repodb
+from utils.sources import load_repodb, load_umls, load_disease_ontology, load_gene_ontology
 
 REPODB_FILE_PATH = "repodb.csv"
+UMLS_FILE_PATH = "MRCONSO.RRF"
+DISEASE_ONTOLOGY_FILE_PATH = "doid.obo"
+GENE_ONTOLOGY_FILE_PATH = "go.obo"
 
 if __name__ == "__main__":
+    cache = BuildCache()
+    digests = {"repodb": cache.digest_file(REPODB_FILE_PATH)}
+
+    # the crosswalk is only re-indexed from the sources whose files changed, and from those that are present
+    crosswalk_sources = {}
+    crosswalk_digests = {}
+    if os.path.exists(UMLS_FILE_PATH):
+        crosswalk_sources["UMLS"] = lambda: load_umls(UMLS_FILE_PATH, sabs=CROSSWALK_SABS)
+        crosswalk_digests["UMLS"] = cache.digest_file(UMLS_FILE_PATH)
+    if os.path.exists(DISEASE_ONTOLOGY_FILE_PATH):
+        crosswalk_sources["DOID"] = lambda: load_disease_ontology(DISEASE_ONTOLOGY_FILE_PATH)
+        crosswalk_digests["DOID"] = cache.digest_file(DISEASE_ONTOLOGY_FILE_PATH)
+    if os.path.exists(GENE_ONTOLOGY_FILE_PATH):
+        crosswalk_sources["GO"] = lambda: load_gene_ontology(GENE_ONTOLOGY_FILE_PATH)
+        crosswalk_digests["GO"] = cache.digest_file(GENE_ONTOLOGY_FILE_PATH)
+    crosswalk = build_crosswalk(crosswalk_sources, crosswalk_digests) if len(crosswalk_sources) > 0 else None
+
     repodb = load_repodb(REPODB_FILE_PATH)
-    nodes = build_nodes(repodb, force_rebuild=False)
+    nodes = build_nodes(repodb, force_rebuild=False, cache=cache, digests=digests, crosswalk=crosswalk)
     print(f"Loaded {len(nodes)} nodes from repoDB checkpoint.")
-    edges = build_edges(repodb, nodes, force_rebuild=False)
+    edges = build_edges(repodb, nodes, force_rebuild=False, cache=cache, digests=digests)
     print(f"Loaded {len(edges)} edges from repoDB checkpoint.")
+
+    if crosswalk is not None:
+        crosswalk.close()
+    write_report()
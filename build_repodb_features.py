@@ -0,0 +1,21 @@
+from utils import Node, Edge, log
+from utils.features import extract_features, edge_pairs
+from utils.graph import GraphStore
+from utils.instrumentation import write_report
+from utils.repodb import NODES_CHECKPOINT as REPODB_NODES_CHECKPOINT, EDGES_CHECKPOINT as REPODB_EDGE_CHECKPOINT
+
+processes = 4
+
+if __name__ == "__main__":
+    repodb_nodes = Node.deserialize_bunch(REPODB_NODES_CHECKPOINT)
+    repodb_edges = Edge.deserialize_bunch(REPODB_EDGE_CHECKPOINT, repodb_nodes)
+    treats = [e for e in repodb_edges if e.kind == "treats"]
+
+    log.info("Mapping repoDB pairs onto the graph...")
+    source_ids, target_ids = edge_pairs(treats, GraphStore().nodes)
+
+    log.info(f"Extracting features of {len(source_ids)} repoDB pairs...")
+    names, features = extract_features(source_ids, target_ids, processes=processes)
+    log.info(f"Wrote a {features.shape[0]} x {features.shape[1]} feature matrix.")
+
+    write_report()
@@ -1,33 +1,62 @@
+from typing import List, Dict, Sequence, Union
+
 from utils import Node
+from utils.alignment import align, matched_pairs
+from utils.checkpoint import checkpoint_path, checkpoint_exists
 from utils.hetio import NODES_CHECKPOINT as HETIO_NODES_CHECKPOINT
+from utils.node import NodeView
 from utils.repodb import NODES_CHECKPOINT as REPODB_NODES_CHECKPOINT
 from pdb import set_trace
 
-if __name__ == "__main__":
-    hetio_nodes = Node.deserialize_bunch(HETIO_NODES_CHECKPOINT)
-    repodb_nodes = Node.deserialize_bunch(REPODB_NODES_CHECKPOINT)
 
-    hetio_drugs = list(filter(lambda x: x.kind == "Compound", hetio_nodes))
-    repodb_drugs = list(filter(lambda x: x.kind == "Compound", repodb_nodes))
-    hetio_diseases = list(filter(lambda x: x.kind == "Disease", hetio_nodes))
-    repodb_diseases = list(filter(lambda x: x.kind == "Disease", repodb_nodes))
+def overlap(hetio_nodes: Sequence[Node], repodb_nodes: Sequence[Node]) -> Dict[str, int]:
+    """
+    Number of het.io and repoDB drugs and diseases, and of matched pairs of each between the two.
+    """
+    hetio_drugs = of_kind(hetio_nodes, "Compound")
+    repodb_drugs = of_kind(repodb_nodes, "Compound")
+    hetio_diseases = of_kind(hetio_nodes, "Disease")
+    repodb_diseases = of_kind(repodb_nodes, "Disease")
+
+    return {
+        "hetio_drugs": len(hetio_drugs),
+        "repodb_drugs": len(repodb_drugs),
+        "drug_overlap": len(matched_pairs(align(hetio_drugs, repodb_drugs))),
+        "hetio_diseases": len(hetio_diseases),
+        "repodb_diseases": len(repodb_diseases),
+        "disease_overlap": len(matched_pairs(align(repodb_diseases, hetio_diseases)))
+    }
+
+
+def of_kind(nodes: Sequence[Node], kind: str) -> List[Node]:
+    """
+    Nodes of one kind. The nodes of a NodeView are selected on its columns, so only those of that kind are created.
+    """
+    if isinstance(nodes, NodeView):
+        return nodes.filter(kinds=[kind]).materialize()
 
-    drug_overlap = 0
+    return list(filter(lambda x: x.kind == kind, nodes))
 
-    for hetio_drug in hetio_drugs:
-        for repodb_drug in repodb_drugs:
-            if hetio_drug == repodb_drug:
-                drug_overlap += 1
 
-    disease_overlap = 0
+def open_nodes(json_path: str) -> Union[List[Node], NodeView]:
+    """
+    The columnar checkpoint of json_path opened lazily if there is one, the JSON checkpoint otherwise.
+    """
+    columnar_path = checkpoint_path(json_path, "columnar")
+    if checkpoint_exists(columnar_path, "columnar"):
+        return Node.load_checkpoint(columnar_path, "columnar", lazy=True)
+
+    return Node.deserialize_bunch(json_path)
+
+
+if __name__ == "__main__":
+    hetio_nodes = open_nodes(HETIO_NODES_CHECKPOINT)
+    repodb_nodes = open_nodes(REPODB_NODES_CHECKPOINT)
 
-    for repodb_disease in repodb_diseases:
-        for hetio_disease in hetio_diseases:
-            if repodb_disease == hetio_disease:
-                disease_overlap += 1
+    counts = overlap(hetio_nodes, repodb_nodes)
 
-    print(f"There are {len(hetio_drugs)} het.io drugs, {len(repodb_drugs)} repoDB drugs, and the overlap is "
-          f"{drug_overlap}.")
+    print(f"There are {counts['hetio_drugs']} het.io drugs, {counts['repodb_drugs']} repoDB drugs, and the overlap is "
+          f"{counts['drug_overlap']}.")
 
-    print(f"There are {len(hetio_diseases)} het.io diseases, {len(repodb_diseases)} repoDB diseases, and the overlap "
-          f"is {disease_overlap}.")
+    print(f"There are {counts['hetio_diseases']} het.io diseases, {counts['repodb_diseases']} repoDB diseases, and the "
+          f"overlap is {counts['disease_overlap']}.")
@@ -0,0 +1,60 @@
+from typing import List, Tuple
+
+import pytest
+
+from utils.edge import Edge
+from utils.node import Node
+
+# (source, kind, destination) of a toy het.io-like graph, every edge also added as its "_inv"
+TOY_EDGES = [
+    ("C1", "binds", "G1"), ("C1", "binds", "G2"), ("C2", "binds", "G2"), ("C3", "binds", "G1"),
+    ("D1", "associates", "G1"), ("D1", "associates", "G2"), ("D2", "associates", "G2"),
+    ("C1", "resembles", "C2"), ("C2", "resembles", "C3"),
+    ("C1", "treats", "D1"), ("C2", "treats", "D1"), ("C3", "treats", "D2"),
+    ("D1", "resembles", "D2")
+]
+
+KINDS = {"C": "Compound", "D": "Disease", "G": "Gene"}
+
+
+def toy_graph() -> Tuple[List[Node], List[Edge]]:
+    nodes = {}
+    for source, _, destination in TOY_EDGES:
+        for identifier in (source, destination):
+            if identifier not in nodes:
+                nodes[identifier] = Node(identifier, identifier.lower(), KINDS[identifier[0]], ["toy"], "CC0",
+                                         f"https://example.org/{identifier}")
+
+    edges = []
+    for source, kind, destination in TOY_EDGES:
+        edges.append(Edge(nodes[source], nodes[destination], kind, ["toy"]))
+        edges.append(Edge(nodes[destination], nodes[source], kind + "_inv", ["toy"]))
+
+    return list(nodes.values()), edges
+
+
+@pytest.fixture
+def toy():
+    return toy_graph()
+
+
+@pytest.fixture
+def outputs(tmp_path, monkeypatch):
+    """
+    Runs the test in an empty working directory with an outputs directory, where the builders write their checkpoints.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "outputs").mkdir()
+
+    return tmp_path / "outputs"
+
+
+@pytest.fixture
+def records():
+    """
+    Metadata of every node or edge of an iterable, to compare nodes and edges read back from a checkpoint or a view.
+    """
+    def metadata(items):
+        return [item.metadata for item in items]
+
+    return metadata
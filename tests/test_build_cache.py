@@ -0,0 +1,82 @@
+import importlib
+import linecache
+import os
+import sys
+
+from utils.build_cache import BuildCache, digest_inputs, digest_keys, function_digest
+
+ENRICHER_SOURCE = '''
+SABS = {sabs!r}
+
+
+def normalize(code):
+    return code.{method}()
+
+
+def enricher(records):
+    return {{r: normalize(r) for r in records if r in SABS}}
+'''
+
+
+def test_file_digests_are_memoized_and_follow_content(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_text("a")
+    cache = BuildCache(str(tmp_path / "manifest.json"))
+
+    digest = cache.digest_file(str(path))
+    assert BuildCache(str(tmp_path / "manifest.json")).digest_file(str(path)) == digest
+
+    path.write_text("b")
+    os.utime(path, ns=(0, 0))
+    assert cache.digest_file(str(path)) != digest
+
+    (tmp_path / "columnar").mkdir()
+    (tmp_path / "columnar" / "a.npy").write_text("a")
+    directory = cache.digest_file(str(tmp_path / "columnar"))
+    (tmp_path / "columnar" / "b.npy").write_text("b")
+    assert cache.digest_file(str(tmp_path / "columnar")) != directory
+
+
+def test_stages_are_fresh_until_their_inputs_or_outputs_change(tmp_path):
+    output = tmp_path / "nodes.json"
+    output.write_text("[]")
+    cache = BuildCache(str(tmp_path / "manifest.json"))
+    inputs = digest_inputs({"hetio": "1", "format": "json"})
+
+    assert not cache.is_fresh("nodes", inputs)
+    cache.record("nodes", inputs, [str(output)])
+
+    # the manifest is persisted
+    cache = BuildCache(str(tmp_path / "manifest.json"))
+    assert cache.is_fresh("nodes", inputs)
+    assert cache.is_fresh("nodes", digest_inputs({"format": "json", "hetio": "1"}))
+    assert not cache.is_fresh("nodes", digest_inputs({"hetio": "2", "format": "json"}))
+
+    output.write_text("[{}]")
+    assert not cache.is_fresh("nodes", inputs)
+    output.unlink()
+    assert not cache.is_fresh("nodes", inputs)
+
+
+def test_digest_keys_follow_order():
+    assert digest_keys([["a", "b", "Gene"], [1, "c", "Gene"]]) != digest_keys([[1, "c", "Gene"], ["a", "b", "Gene"]])
+
+
+def test_function_digest_follows_source_constants_and_callees(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    # imported from its source every time, never from a cached .pyc of an earlier version
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    path = tmp_path / "toy_enricher.py"
+
+    def load(**kwargs):
+        path.write_text(ENRICHER_SOURCE.format(**kwargs))
+        linecache.checkcache(str(path))
+        sys.modules.pop("toy_enricher", None)
+        return function_digest(importlib.import_module("toy_enricher").enricher)
+
+    digest = load(sabs=["MSH"], method="upper")
+
+    assert load(sabs=["MSH"], method="upper") == digest
+    assert load(sabs=["MSH", "NDFRT"], method="upper") != digest
+    assert load(sabs=["MSH"], method="lower") != digest
+    sys.modules.pop("toy_enricher", None)
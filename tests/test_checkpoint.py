@@ -0,0 +1,154 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from utils.checkpoint import CHECKPOINT_FORMATS, COLUMNAR_HEADER, checkpoint_exists, string_arrays, \
+    string_list_arrays, StringColumn, StringListColumn
+from utils.edge import Edge
+from utils.graph import GraphStore, build_graph, load_graph
+from utils.hetero_graph import encode_edges
+from utils.node import Node, NodeIntegrityError, intern_sources
+
+
+@pytest.fixture
+def graph(toy):
+    nodes, edges = toy
+    # identifiers and source URLs that are not strings, and names that are not ASCII
+    gene = Node(5345, "SERPINF2", "Gene", "Entrez Gene", "CC0", None)
+    disease = Node("DOID:14227", "Sjögren’s syndrome", "Disease", ["Disease Ontology", "RepoDB"], None, "")
+    disease.add_mesh_id(["D012859", "D000001"])
+    disease.add_cui("C1527336")
+
+    return nodes + [gene, disease], edges + [Edge(disease, gene, "associates", ["DISEASES"]),
+                                             Edge(nodes[0], disease, "treats", None)]
+
+
+@pytest.mark.parametrize("checkpoint_format", CHECKPOINT_FORMATS)
+def test_nodes_and_edges_round_trip(graph, outputs, checkpoint_format, records):
+    nodes, edges = graph
+    nodes_path = str(outputs / f"nodes.{checkpoint_format}")
+    edges_path = str(outputs / f"edges.{checkpoint_format}")
+
+    Node.save_checkpoint(nodes, nodes_path, checkpoint_format)
+    Edge.save_checkpoint(edges, edges_path, checkpoint_format, nodes)
+    assert checkpoint_exists(nodes_path, checkpoint_format) and checkpoint_exists(edges_path, checkpoint_format)
+
+    loaded_nodes = Node.load_checkpoint(nodes_path, checkpoint_format)
+    loaded_edges = Edge.load_checkpoint(edges_path, Node.index_bunch(loaded_nodes), checkpoint_format)
+
+    assert records(loaded_nodes) == records(nodes)
+    assert records(loaded_edges) == records(edges)
+    assert loaded_edges[0].source is loaded_nodes[0]
+
+
+@pytest.mark.parametrize("checkpoint_format", ["jsonl", "jsonl.gz"])
+def test_json_lines_append_and_filter_by_kind(graph, outputs, checkpoint_format, records):
+    nodes, edges = graph
+    nodes_path = str(outputs / f"nodes.{checkpoint_format}")
+    edges_path = str(outputs / f"edges.{checkpoint_format}")
+
+    Node.serialize_json_lines(nodes[:3], nodes_path)
+    Node.serialize_json_lines(nodes[3:], nodes_path, append=True)
+    Edge.serialize_json_lines(edges, edges_path)
+
+    assert records(Node.deserialize_json_lines(nodes_path)) == records(nodes)
+    assert records(Node.deserialize_json_lines(nodes_path, kinds=["Disease"])) == \
+        records([n for n in nodes if n.kind == "Disease"])
+    assert records(Edge.deserialize_json_lines(edges_path, nodes, kinds=["treats"])) == \
+        records([e for e in edges if e.kind == "treats"])
+
+
+def test_columnar_edges_must_be_read_with_their_nodes(graph, outputs):
+    nodes, edges = graph
+    Edge.save_checkpoint(edges, str(outputs / "edges.columnar"), "columnar", nodes)
+
+    with pytest.raises(NodeIntegrityError):
+        Edge.load_checkpoint(str(outputs / "edges.columnar"), Node.index_bunch(nodes[::-1]), "columnar")
+    with pytest.raises(ValueError):
+        Edge.save_checkpoint(edges, str(outputs / "other.columnar"), "columnar")
+
+
+def test_columnar_checkpoints_of_another_version_are_not_loaded(graph, outputs):
+    nodes, _ = graph
+    path = str(outputs / "nodes.columnar")
+    Node.save_checkpoint(nodes, path, "columnar")
+
+    with open(os.path.join(path, COLUMNAR_HEADER)) as file:
+        header = json.load(file)
+    header["version"] = 1
+    with open(os.path.join(path, COLUMNAR_HEADER), "w") as file:
+        json.dump(header, file)
+
+    assert not checkpoint_exists(path, "columnar")
+
+
+def test_string_columns():
+    values = ["a", "", None, 5345, "Sjögren’s"]
+    lists = [[], ["D1", "D2"], ["ä"]]
+    arrays = {**string_arrays("s", values), **string_list_arrays("l", lists)}
+
+    assert all(isinstance(array, np.ndarray) for array in arrays.values())
+    assert StringColumn(arrays, "s").tolist() == values
+    assert [StringColumn(arrays, "s")[i] for i in range(len(values))] == values
+    assert StringListColumn(arrays, "l").tolist() == lists
+    assert StringListColumn(arrays, "l")[1] == ["D1", "D2"]
+
+
+def test_graph_store_round_trip(graph, outputs, records):
+    nodes, edges = graph
+    built = build_graph(nodes, edges, engine="csr")
+
+    store = load_graph(lazy=True)
+    assert isinstance(store, GraphStore)
+    assert records(store.nodes) == records(nodes)
+    assert all(np.array_equal(built.arrays[name], store.arrays[name]) for name in built.arrays)
+    assert sorted(map(str, records(e for _, _, e in load_graph().edges(keys=True)))) == \
+        sorted(map(str, records(edges)))
+
+
+def test_nodes_and_edges_share_interned_sources(graph):
+    nodes, edges = graph
+
+    assert not hasattr(nodes[0], "__dict__") and not hasattr(edges[0], "__dict__")
+    assert intern_sources(None) is None
+    assert intern_sources("toy") == ("toy",)
+    assert intern_sources(["Disease Ontology", "RepoDB"]) is nodes[-1].sources
+    assert all(e.sources is edges[0].sources for e in edges[:-2])
+    assert Edge(nodes[0], nodes[1], "".join(["bin", "ds"])).kind is edges[0].kind
+
+
+def test_metadata_views_share_state_and_copies_do_not(graph):
+    nodes, edges = graph
+    disease = nodes[-1]
+
+    view = disease.metadata_view
+    with pytest.raises(TypeError):
+        view["name"] = "other"
+    disease.add_cui("C0000001")
+    assert view["umls_cuis"] == ["C1527336", "C0000001"]
+
+    copy = disease.metadata
+    copy["mesh_ids"].append("D999999")
+    assert disease.mesh_ids == ["D012859", "D000001"]
+    assert edges[-2].metadata_view["source"] == disease.key
+    assert edges[-2].metadata["source"] == list(disease.key)
+
+
+def test_edges_must_refer_to_indexed_nodes(graph, outputs):
+    nodes, edges = graph
+    path = str(outputs / "edges.json")
+    Edge.save_checkpoint(edges, path)
+
+    assert [e.source for e in Edge.deserialize_bunch(path, nodes)] == [e.source for e in edges]
+    with pytest.raises(NodeIntegrityError):
+        Node.index_bunch(nodes + [Node(*nodes[0].key[:2], nodes[0].kind, None, None, None)])
+    with pytest.raises(NodeIntegrityError):
+        Edge.deserialize_bunch(path, nodes[:-1])
+    with pytest.raises(NodeIntegrityError):
+        Edge.save_checkpoint(edges, str(outputs / "edges.columnar"), "columnar", nodes[:-1])
+    with pytest.raises(NodeIntegrityError):
+        encode_edges(nodes + nodes[:1], edges)
+    with pytest.raises(NodeIntegrityError):
+        encode_edges(nodes[:-1], edges)
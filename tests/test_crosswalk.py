@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+
+from utils.crosswalk import Crosswalk, build_crosswalk
+from utils.node import Node
+from utils.ontology import CompactOntology, CompactTerm
+
+MRCONSO = pd.DataFrame({
+    "CUI": ["C0000001", "C0000001", "C0000002", "C0000003"],
+    "SAB": ["DRUGBANK", "MSH", "DRUGBANK", "MSH"],
+    "CODE": ["DB00001", "D000001", "DB00002", "D000003"]
+})
+
+DISEASE_ONTOLOGY = CompactOntology([
+    CompactTerm("DOID:1", "a disease", {"xref": ["UMLS_CUI:C0000003", "MESH:D000004"]}, []),
+    CompactTerm("DOID:2", "another disease", {}, ["DOID:1"])
+], digest="do")
+
+
+@pytest.fixture
+def crosswalk(tmp_path):
+    with Crosswalk(str(tmp_path / "crosswalk.sqlite")) as crosswalk:
+        crosswalk.add_umls(MRCONSO, "UMLS", "umls")
+        crosswalk.add_ontology(DISEASE_ONTOLOGY, "DOID")
+        yield crosswalk
+
+
+def test_lookup_returns_direct_links_both_ways(crosswalk):
+    assert crosswalk.lookup(["DB00001"]) == {"DB00001": [("C0000001", "UMLS_CUI")]}
+    assert crosswalk.lookup(["C0000003"], ["DOID"]) == {"C0000003": [("DOID:1", "DOID")]}
+    assert crosswalk.lookup(["C0000001"], ["MESH"], "UMLS_CUI") == {"C0000001": [("D000001", "MESH")]}
+    assert crosswalk.lookup(["DB99999"]) == {}
+
+
+def test_mappings_follow_umls_cuis_one_hop(crosswalk):
+    mappings = crosswalk.mappings(["DB00001", "DB00002", "DB99999"], "DRUGBANK")
+
+    assert mappings["umls_cuis"] == {"DB00001": ["C0000001"], "DB00002": ["C0000002"]}
+    # DB00001 -> C0000001 -> D000001
+    assert mappings["mesh_ids"] == {"DB00001": ["D000001"]}
+
+
+def test_only_identifiers_found_map_to_themselves(crosswalk):
+    mappings = crosswalk.mappings(["C0000003", "C9999999"], "UMLS_CUI")
+
+    assert mappings["umls_cuis"] == {"C0000003": ["C0000003"]}
+    # the MeSH ID of the CUI and, through DOID:1, that of the Disease Ontology do not share a hop
+    assert mappings["mesh_ids"] == {"C0000003": ["D000003"]}
+
+
+def test_enrich_nodes_counts_only_new_ids(crosswalk):
+    nodes = [Node("DB00001", "a", "Compound"), Node("DB99999", "b", "Compound"), Node("C0000003", "c", "Disease")]
+    namespaces = {"Compound": "DRUGBANK", "Disease": "UMLS_CUI"}
+
+    compounds, diseases = crosswalk.enrich_nodes(nodes, namespaces)
+
+    assert (compounds.enriched, compounds.unmatched, compounds.unchanged) == (1, ["DB99999"], 0)
+    assert (diseases.enriched, diseases.unmatched) == (1, [])
+    assert nodes[0].umls_cuis == ["C0000001"] and nodes[0].mesh_ids == ["D000001"]
+    assert nodes[2].umls_cuis == ["C0000003"] and nodes[2].mesh_ids == ["D000003"]
+
+    # a rerun finds the same IDs, which the nodes already have
+    compounds, diseases = crosswalk.enrich_nodes(nodes, namespaces)
+
+    assert (compounds.enriched, compounds.unmatched, compounds.unchanged) == (0, ["DB99999"], 1)
+    assert (diseases.enriched, diseases.unchanged) == (0, 1)
+    assert nodes[0].umls_cuis == ["C0000001"]
+
+
+def test_build_crosswalk_only_loads_changed_sources(tmp_path):
+    path = str(tmp_path / "crosswalk.sqlite")
+    loaded = []
+
+    def loader(name, source):
+        return lambda: loaded.append(name) or source
+
+    sources = {"UMLS": loader("UMLS", MRCONSO), "DOID": loader("DOID", DISEASE_ONTOLOGY)}
+    build_crosswalk(sources, {"UMLS": "1", "DOID": "1"}, path).close()
+    with build_crosswalk(sources, {"UMLS": "1", "DOID": "2"}, path) as crosswalk:
+        assert crosswalk.is_indexed("DOID", "2")
+
+    assert loaded == ["UMLS", "DOID", "DOID"]
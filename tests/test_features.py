@@ -0,0 +1,50 @@
+import numpy as np
+
+from utils.features import FeatureExtractor, extract_features, load_features
+from utils.graph import build_graph
+from utils.hetero_graph import HeteroGraph
+
+# the metapaths of METAPATHS over the edge kinds of the toy graph
+TOY_METAPATHS = {
+    "CbGaD": ["Compound", "binds", "Gene", "associates_inv", "Disease"],
+    "CrCtD": ["Compound", "resembles", "Compound", "treats", "Disease"],
+    "CtDrD": ["Compound", "treats", "Disease", "resembles", "Disease"]
+}
+
+
+def ids(graph, *identifiers):
+    return [graph.node_id(next(n for n in graph.nodes if n.identifier == i)) for i in identifiers]
+
+
+def test_features_do_not_see_the_label_of_scored_pairs(toy, outputs):
+    nodes, edges = toy
+    graph = build_graph(nodes, edges, engine="csr")
+    source_ids, target_ids = ids(graph, "C1", "C3"), ids(graph, "D1", "D2")
+
+    names, features = extract_features(source_ids, target_ids, output_dir=str(outputs / "features"),
+                                       metapaths=TOY_METAPATHS)
+
+    unlabeled = [e for e in edges if not (e.kind.startswith("treats") and
+                                          {e.source.identifier, e.destination.identifier} in ({"C1", "D1"},
+                                                                                              {"C3", "D2"}))]
+    expected = FeatureExtractor(HeteroGraph.from_edges(nodes, unlabeled), TOY_METAPATHS).compute(source_ids, target_ids)
+
+    for i, name in enumerate(names):
+        assert np.allclose(features[:, i], expected[name]), name
+    # C1 still treats D1 through C2, which resembles C1, CrCtD is not all zeros
+    assert features[0, names.index("CrCtD_count")] == 1
+    assert features[0, names.index("source_degree")] == 2 * 3
+
+
+def test_features_are_the_same_with_processes(toy, outputs):
+    nodes, edges = toy
+    graph = build_graph(nodes, edges, engine="csr")
+    source_ids, target_ids = ids(graph, "C1", "C2", "C3", "C1"), ids(graph, "D1", "D1", "D2", "D2")
+
+    _, serial = extract_features(source_ids, target_ids, output_dir=str(outputs / "serial"),
+                                  metapaths=TOY_METAPATHS)
+    _, parallel = extract_features(source_ids, target_ids, output_dir=str(outputs / "parallel"), batch_size=1,
+                                   processes=2, metapaths=TOY_METAPATHS)
+
+    assert np.array_equal(serial, parallel)
+    assert np.array_equal(load_features(str(outputs / "parallel"))[1], parallel)
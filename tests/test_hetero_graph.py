@@ -0,0 +1,75 @@
+import numpy as np
+
+from utils.build_cache import BuildCache
+from utils.graph import GraphStore, build_graph
+from utils.hetero_graph import HeteroGraph
+
+
+def test_adjacency_matches_the_edges(toy):
+    nodes, edges = toy
+    graph = HeteroGraph.from_edges(nodes, edges)
+
+    assert graph.num_nodes == len(nodes) and graph.num_edges == len(edges)
+    for kind in graph.kinds:
+        source_ids, destination_ids, _ = graph.edge_arrays(kind)
+        expected = sorted((graph.node_id(e.source), graph.node_id(e.destination)) for e in edges if e.kind == kind)
+        assert sorted(zip(source_ids.tolist(), destination_ids.tolist())) == expected
+
+    degree = graph.degree(direction="both")
+    assert degree.tolist() == [sum(n in (e.source, e.destination) for e in edges) for n in nodes]
+    c1 = graph.node_id(nodes[0])
+    assert sorted(graph.neighbors(c1, "binds").tolist()) == sorted(graph.node_id(n) for n in graph.nodes
+                                                                   if n.identifier in ("G1", "G2"))
+
+
+def test_networkx_round_trip(toy):
+    graph = HeteroGraph.from_edges(*toy)
+    again = HeteroGraph.from_networkx(graph.to_networkx())
+
+    assert all(np.array_equal(graph.edge_arrays(k)[0], again.edge_arrays(k)[0]) for k in graph.kinds)
+
+
+def test_subgraph_and_without_pairs(toy):
+    nodes, edges = toy
+    graph = HeteroGraph.from_edges(nodes, edges)
+
+    compounds = graph.subgraph(edge_kinds=["resembles"], node_kinds=["Compound"])
+    assert [n.identifier for n in compounds.nodes] == ["C1", "C2", "C3"]
+    assert compounds.num_edges == 2
+
+    c1, d1 = graph.node_id(nodes[0]), next(graph.node_id(n) for n in nodes if n.identifier == "D1")
+    without = graph.without_pairs([c1], [d1], ["treats", "treats_inv"])
+    assert without.num_edges == graph.num_edges - 2
+    assert d1 not in without.neighbors(c1, "treats").tolist()
+    assert c1 not in without.neighbors(d1, "treats_inv").tolist()
+
+
+def test_fresh_graph_store_is_loaded_without_encoding(toy, outputs, monkeypatch):
+    nodes, edges = toy
+    cache = BuildCache(str(outputs / "manifest.json"))
+    built = build_graph(nodes, edges, engine="csr", cache=cache, digests={"edges": "1"})
+
+    def fail(*args):
+        raise AssertionError("the graph was encoded")
+
+    monkeypatch.setattr("utils.graph.encode_graph", fail)
+    loaded = build_graph(nodes, edges, engine="csr", cache=cache, digests={"edges": "1"})
+
+    assert all(np.array_equal(built.arrays[name], loaded.arrays[name]) for name in built.arrays)
+
+
+def test_re_enriched_nodes_rewrite_the_graph_store(toy, outputs):
+    nodes, edges = toy
+    build_graph(nodes, edges, engine="csr")
+    nodes[0].add_cui("C0000001")
+
+    build_graph(nodes, edges, engine="csr")
+    assert GraphStore().nodes[0].umls_cuis == ["C0000001"]
+
+    # the same with a cache, whose digests of the inputs do not change
+    cache = BuildCache(str(outputs / "manifest.json"))
+    build_graph(nodes, edges, engine="csr", cache=cache, digests={"nodes": "1"})
+    nodes[0].add_mesh_id("D000001")
+    build_graph(nodes, edges, engine="csr", cache=cache, digests={"nodes": "1"})
+
+    assert GraphStore().nodes[0].mesh_ids == ["D000001"]
@@ -0,0 +1,59 @@
+import os
+
+import pandas as pd
+import pytest
+from pronto import Ontology
+
+from benchmarks.synthetic import synthetic_hetio
+from utils import hetio
+from utils.checkpoint import checkpoint_path
+from utils.edge import Edge, EdgeView
+from utils.node import Node
+from utils.ontology import CompactOntology, CompactTerm
+
+
+def test_sharded_edges_are_the_serial_edges(outputs, records):
+    hetio_json = synthetic_hetio(0.002, 0)
+    nodes = hetio.build_nodes(hetio_json, save_checkpoint=False)
+
+    serial = hetio.build_edges(hetio_json, nodes, save_checkpoint=False)
+    sharded = hetio.build_edges(hetio_json, nodes, processes=2, shard_size=500, checkpoint_format="columnar")
+
+    assert isinstance(sharded, EdgeView)
+    assert records(sharded) == records(serial)
+    path = checkpoint_path(hetio.EDGES_CHECKPOINT, "columnar")
+    assert records(Edge.load_checkpoint(path, Node.index_bunch(nodes), "columnar")) == records(serial)
+    # the shards of the run are removed
+    assert os.listdir(outputs) == [os.path.basename(path)]
+
+
+def test_compound_xrefs_group_drugbank_cuis():
+    umls = pd.DataFrame({
+        "CUI": ["C1", "C2", "C1", "C3", "C4"],
+        "SAB": ["DRUGBANK", "DRUGBANK", "DRUGBANK", "MSH", "DRUGBANK"],
+        "CODE": ["DB00001", "DB00001", "DB00001", "DB00001", "DB00009"]
+    }).astype("category")
+    compounds = [{"kind": "Compound", "identifier": "DB00001"}, {"kind": "Compound", "identifier": "DB00002"}]
+
+    assert hetio.compound_xrefs(compounds, umls) == {"umls_cuis": {"DB00001": ["C1", "C2"]}}
+
+
+@pytest.mark.parametrize("ontology", ["compact", "pronto"])
+def test_disease_and_anatomy_xrefs(ontology, tmp_path):
+    terms = [CompactTerm("DOID:162", "cancer", {"xref": ["UMLS_CUI:C0006826", "MESH:D009369", "ICD10CM:C80.1"]}, []),
+             CompactTerm("DOID:1324", "lung cancer", {"xref": ["UMLS_CUI:C0242379"]}, ["DOID:162"])]
+    do = CompactOntology(terms)
+    if ontology == "pronto":
+        path = tmp_path / "doid.obo"
+        path.write_text("format-version: 1.2\n" + "".join(
+            f"\n[Term]\nid: {t.id}\nname: {t.name}\n" + "".join(f"xref: {x}\n" for x in t.xrefs) for t in terms))
+        do = Ontology(str(path))
+    diseases = [{"kind": "Disease", "identifier": "DOID:162"}, {"kind": "Disease", "identifier": "DOID:9999"}]
+
+    assert hetio.disease_xrefs(diseases, do) == {
+        "umls_cuis": {"DOID:162": ["C0006826"], "DOID:1324": ["C0242379"]},
+        "mesh_ids": {"DOID:162": ["D009369"]}
+    }
+    anatomies = [{"identifier": "UBERON:0002048", "data": {"mesh_id": "D008168"}},
+                 {"identifier": "UBERON:0000001", "data": {}}]
+    assert hetio.anatomy_xrefs(anatomies) == {"mesh_ids": {"UBERON:0002048": ["D008168"]}}
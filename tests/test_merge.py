@@ -0,0 +1,44 @@
+import pytest
+
+from utils.alignment import Match, align, matched_pairs
+from utils.edge import Edge
+from utils.merge import GraphSource, merge_graphs
+from utils.node import Node, NodeIntegrityError
+
+
+def compound(identifier, name, cuis=()):
+    node = Node(identifier, name, "Compound", ["DrugBank"], "CC0", None)
+    node.add_cui(list(cuis))
+    return node
+
+
+def test_merges_nodes_sharing_a_cui_and_collapses_edges():
+    a, b = compound("DB1", "a", ["C1"]), compound("DB2", "b")
+    c, d = compound("X1", "c", ["C1"]), compound("DB2", "b")
+
+    merged = merge_graphs([GraphSource("hetio", [a, b], [Edge(a, b, "resembles", "hetio")]),
+                           GraphSource("repodb", [c, d], [Edge(c, d, "resembles", "repodb")])])
+
+    assert [n.key for n in merged.nodes] == [a.key, b.key]
+    assert len(merged.edges) == 1
+    assert sorted(merged.edges[0].sources) == ["hetio", "repodb"]
+    assert merged.node_provenance[a.key] == [("hetio", a.key), ("repodb", c.key)]
+
+
+def test_duplicate_node_keys_within_a_source_raise():
+    nodes = [compound("DB1", "a", ["C1"]), compound("DB1", "a", ["C2"])]
+
+    with pytest.raises(NodeIntegrityError):
+        merge_graphs([GraphSource("hetio", nodes, [])])
+
+
+def test_align_matches_the_pairs_node_eq_matches():
+    left = [compound("DB1", "a", ["C1", "C1"]), compound("DB2", "b"), compound("DB3", "c", ["C3"])]
+    right = [compound("X1", "a", ["C1"]), compound("DB2", "b", ["C1"]), compound("X3", "c")]
+    right[2].add_mesh_id("C3")
+
+    matches = align(left, right)
+
+    assert sorted(matches) == [Match(0, 0, "C1", "umls_cui", "umls_cui"), Match(0, 1, "C1", "umls_cui", "umls_cui"),
+                               Match(1, 1, "DB2", "identifier", "identifier"), Match(2, 2, "C3", "umls_cui", "mesh_id")]
+    assert matched_pairs(matches) == set((i, j) for i, a in enumerate(left) for j, b in enumerate(right) if a == b)
@@ -0,0 +1,69 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from utils.hetero_graph import HeteroGraph
+from utils.metapath import MetapathQuery
+
+METAPATHS = [
+    ["Compound", "binds", "Gene", "associates_inv", "Disease"],
+    ["Compound", "resembles", "Compound", "treats", "Disease"],
+    ["Compound", "binds", "Gene", "binds_inv", "Compound", "treats", "Disease"],
+    ["Disease", "treats_inv", "Compound", "resembles_inv", "Compound"]
+]
+
+
+def brute_force(nodes, edges, metapath, damping):
+    """
+    (walk count, DWPC) of every (source, target) pair, enumerating every walk and weighting it edge by edge.
+    """
+    steps = [(metapath[i], metapath[i + 1], metapath[i + 2]) for i in range(0, len(metapath) - 1, 2)]
+    relations = [{(e.source.key, e.destination.key) for e in edges
+                  if e.kind == kind and e.source.kind == source and e.destination.kind == target}
+                 for source, kind, target in steps]
+
+    def degrees(relation, side):
+        counts = {}
+        for pair in relation:
+            counts[pair[side]] = counts.get(pair[side], 0) + 1
+        return counts
+
+    out_degrees = [degrees(relation, 0) for relation in relations]
+    in_degrees = [degrees(relation, 1) for relation in relations]
+
+    counts, dwpc = {}, {}
+    for walk in itertools.product(*(sorted(relation) for relation in relations)):
+        if any(walk[i][1] != walk[i + 1][0] for i in range(len(walk) - 1)):
+            continue
+
+        weight = np.prod([(out_degrees[i][u] * in_degrees[i][v]) ** -damping for i, (u, v) in enumerate(walk)])
+        pair = (walk[0][0], walk[-1][1])
+        counts[pair] = counts.get(pair, 0) + 1
+        dwpc[pair] = dwpc.get(pair, 0.0) + weight
+
+    return counts, dwpc
+
+
+@pytest.mark.parametrize("metapath", METAPATHS, ids=lambda m: "-".join(m[1::2]))
+def test_path_counts_and_dwpc_match_brute_force(toy, metapath):
+    nodes, edges = toy
+    graph = HeteroGraph.from_edges(nodes, edges)
+    query = MetapathQuery(graph)
+    counts, dwpc = brute_force(nodes, edges, metapath, 0.4)
+
+    source_ids, target_ids = zip(*itertools.product(query.node_ids(metapath[0]), query.node_ids(metapath[-1])))
+    pairs = [(nodes[s].key, nodes[t].key) for s, t in zip(source_ids, target_ids)]
+
+    assert query.path_counts(metapath, source_ids, target_ids).tolist() == [counts.get(p, 0) for p in pairs]
+    assert np.allclose(query.dwpc(metapath, source_ids, target_ids, 0.4), [dwpc.get(p, 0.0) for p in pairs])
+    assert sum(counts.values()) > 0
+
+
+def test_inverse_kinds_missing_from_the_graph_are_transposes(toy):
+    nodes, edges = toy
+    with_inverses = MetapathQuery(HeteroGraph.from_edges(nodes, edges))
+    without_inverses = MetapathQuery(HeteroGraph.from_edges(nodes, [e for e in edges if not e.kind.endswith("_inv")]))
+    metapath = METAPATHS[0]
+
+    assert (with_inverses.path_count_matrix(metapath) != without_inverses.path_count_matrix(metapath)).nnz == 0
@@ -0,0 +1,115 @@
+import gzip
+import io
+import json
+import os
+
+import pytest
+from pronto import Ontology
+
+from utils import ontology
+from utils.ontology import file_digest, load_ontology, parse_obo
+
+TOY_OBO = """format-version: 1.2
+ontology: doid
+
+[Term]
+id: DOID:4
+name: disease
+xref: UMLS_CUI:C0012634
+
+[Term]
+id: DOID:162
+name: cancer
+def: "A disease of cellular proliferation." [url:http://en.wikipedia.org/wiki/Cancer]
+xref: MESH:D009369 {source="MESH:D009369"}
+xref: UMLS_CUI:C0006826 "cancer"
+is_a: DOID:4 ! disease
+
+[Term]
+id: DOID:1324
+name: lung cancer
+xref: UMLS_CUI:C0242379
+is_a: DOID:162 ! cancer
+is_a: DOID:4 {source="DOID"} ! disease
+
+[Term]
+id: DOID:9999
+name: obsolete lung disease
+is_obsolete: true
+xref: MESH:D000001
+
+[Typedef]
+id: has_symptom
+name: has symptom
+xref: RO:0002452
+"""
+
+
+@pytest.fixture
+def toy_obo(tmp_path):
+    path = tmp_path / "doid.obo"
+    path.write_text(TOY_OBO, encoding="utf-8")
+    return str(path)
+
+
+def test_terms_are_parsed_like_pronto(toy_obo):
+    terms = {term.id: term for term in parse_obo(toy_obo)}
+
+    # typedefs are skipped, obsolete terms are kept as pronto's Ontology.terms() does
+    assert list(terms) == ["DOID:4", "DOID:162", "DOID:1324", "DOID:9999"]
+    assert terms["DOID:162"].name == "cancer"
+    assert terms["DOID:162"].xrefs == ["MESH:D009369", "UMLS_CUI:C0006826"]
+    assert terms["DOID:1324"].parents == ["DOID:162", "DOID:4"]
+    assert terms["DOID:9999"].xrefs == ["MESH:D000001"]
+
+    for term in Ontology(toy_obo).terms():
+        assert terms[term.id].name == term.name
+        assert sorted(terms[term.id].xrefs) == sorted(xref.id for xref in term.xrefs)
+
+
+def test_ontologies_are_cached_by_content(toy_obo, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    os.mkdir(cache_dir)
+    digest = file_digest(toy_obo)
+
+    loaded = load_ontology(toy_obo, cache_dir=cache_dir)
+    cache_path = os.path.join(cache_dir, f"ontology.{digest}.json.gz")
+    assert loaded.digest == digest
+    assert os.path.exists(cache_path)
+
+    def parse(_):
+        raise AssertionError("parsed a cached ontology")
+
+    monkeypatch.setattr(ontology, "parse_obo", parse)
+    cached = load_ontology(toy_obo, cache_dir=cache_dir)
+    assert list(cached) == list(loaded)
+    assert "DOID:1324" in cached and cached["DOID:1324"].xrefs == ["UMLS_CUI:C0242379"]
+
+    # a cache of an older version is parsed again
+    with gzip.open(cache_path, "wt", encoding="utf-8") as file:
+        json.dump({"version": ontology.ONTOLOGY_CACHE_VERSION - 1, "terms": []}, file)
+    with pytest.raises(AssertionError):
+        load_ontology(toy_obo, cache_dir=cache_dir)
+
+
+def test_urls_are_downloaded_once(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path)
+    downloads = []
+
+    def urlopen(url):
+        downloads.append(url)
+        return io.BytesIO(TOY_OBO.encode("utf-8"))
+
+    monkeypatch.setattr(ontology.urllib.request, "urlopen", urlopen)
+    url = "http://purl.obolibrary.org/obo/doid.obo"
+
+    first = load_ontology(url, cache_dir=cache_dir)
+    second = load_ontology(url, cache_dir=cache_dir)
+
+    assert downloads == [url]
+    assert os.path.exists(os.path.join(cache_dir, "doid.obo"))
+    assert first.digest == second.digest == file_digest(os.path.join(cache_dir, "doid.obo"))
+    assert len(second) == 4
+
+    with pytest.raises(FileNotFoundError):
+        load_ontology(str(tmp_path / "missing.obo"), cache_dir=cache_dir)
@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from utils.instrumentation import INSTRUMENTATION, Instrumentation, instrumented
+from utils.node import Node
+from utils.pipeline import Enricher, enrich_nodes
+from utils.processes import process_pool, worker_state
+
+RECORDS = [
+    {"kind": "Compound", "identifier": "DB00001"},
+    {"kind": "Compound", "identifier": "DB00002"},
+    {"kind": "Disease", "identifier": "DOID:162"},
+    {"kind": "Gene", "identifier": "1017"}
+]
+
+
+def compound_xrefs(records, drugbank):
+    return {"umls_cuis": {r["identifier"]: drugbank[r["identifier"]] for r in records if r["identifier"] in drugbank}}
+
+
+def disease_xrefs(records, do):
+    return {"mesh_ids": {r["identifier"]: do.get(r["identifier"], []) for r in records}}
+
+
+def gene_xrefs(records, missing):
+    raise AssertionError("ran an enricher whose source is missing")
+
+
+ENRICHERS = [
+    Enricher("Compound", compound_xrefs, ["drugbank"], "Compound CUIs"),
+    Enricher("Disease", disease_xrefs, ["do"], "Disease MeSH IDs"),
+    Enricher("Gene", gene_xrefs, ["missing"], "Gene xrefs")
+]
+
+
+def toy_nodes():
+    return [Node(r["identifier"], r["identifier"].lower(), r["kind"], ["toy"], "CC0", "") for r in RECORDS]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_enrichers_run_with_their_sources(processes):
+    loaded = []
+
+    def drugbank():
+        loaded.append("drugbank")
+        return {"DB00001": ["C0000001"], "DB00002": ["C0000002", "C0000003"]}
+
+    sources = {"drugbank": drugbank, "do": {"DOID:162": ["D009369"]}, "missing": None}
+    stages = len(INSTRUMENTATION.stages)
+    nodes = enrich_nodes(RECORDS, toy_nodes(), ENRICHERS, sources, processes=processes)
+
+    assert [(n.umls_cuis, n.mesh_ids) for n in nodes] == [
+        (["C0000001"], []), (["C0000002", "C0000003"], []), ([], ["D009369"]), ([], [])
+    ]
+    # loaders are called once, and the stages of enrichers run by workers are recorded here
+    assert loaded == ["drugbank"]
+    names = [record.name for record in INSTRUMENTATION.stages[stages:]]
+    assert "enricher.Compound" in names and "enricher.Disease" in names
+    assert worker_state() is None
+
+
+def test_pool_state_is_restored():
+    with process_pool(1, {"outer": 1}) as pool:
+        assert pool.submit(worker_state).result() == {"outer": 1}
+
+        with process_pool(1, {"inner": 2}) as inner:
+            assert inner.submit(worker_state).result() == {"inner": 2}
+
+        assert pool.submit(worker_state).result() == {"outer": 1}
+
+    assert worker_state() is None
+
+
+def test_instrumentation_report(outputs, monkeypatch):
+    instrumentation = Instrumentation()
+    monkeypatch.setattr("utils.instrumentation.INSTRUMENTATION", instrumentation)
+    instrumentation.profile_stage("count", output_dir=str(outputs))
+
+    @instrumented("count")
+    def count(items):
+        return list(items)
+
+    with instrumentation.stage("build") as handle:
+        count(range(3))
+        handle.records = 10
+
+    path = instrumentation.write_report(str(outputs / "report.json"))
+    with open(path) as file:
+        report = json.load(file)
+
+    stages = {record["name"]: record for record in report["stages"]}
+    assert [record["name"] for record in report["stages"]] == ["count", "build"]
+    assert stages["count"]["parent"] == "build" and stages["build"]["parent"] is None
+    assert stages["count"]["records"] == 3 and stages["build"]["records"] == 10
+    assert stages["build"]["wall_time"] >= stages["count"]["wall_time"]
+    assert os.path.exists(stages["count"]["profile"]) and stages["build"]["profile"] is None
+    with pytest.raises(ValueError):
+        instrumentation.profile_stage("build", "perf")
@@ -0,0 +1,48 @@
+import numpy as np
+
+from utils.hetero_graph import HeteroGraph
+from utils.sampling import NegativeSampler, split_edges
+
+
+def pairs(graph, triples):
+    """
+    Every triple as (unordered endpoints, kind without "_inv"), the same for an edge and its inverse.
+    """
+    return [(frozenset((int(s), int(d))), graph.kinds[k].replace("_inv", ""))
+            for s, d, k in zip(triples.source, triples.destination, triples.kind)]
+
+
+def test_split_edges_does_not_leak_between_splits(toy):
+    nodes, edges = toy
+    graph = HeteroGraph.from_edges(nodes, edges)
+
+    split = split_edges(graph, relations=["treats"], validation_fraction=0.34, test_fraction=0.34, seed=1)
+    train, validation, test = (pairs(graph, triples) for triples in split)
+
+    assert len(train) + len(validation) + len(test) == len(edges)
+    assert set(train).isdisjoint(validation) and set(train).isdisjoint(test) and set(validation).isdisjoint(test)
+    # only treats edges are withheld, each with its treats_inv partner
+    assert {kind for _, kind in validation + test} == {"treats"}
+    assert len(validation) == len(test) == 2
+    assert sum(kind == "treats" for _, kind in train) == 2
+
+
+def test_split_edges_is_reproducible(toy):
+    graph = HeteroGraph.from_edges(*toy)
+
+    first, second = split_edges(graph, seed=3), split_edges(graph, seed=3)
+
+    for a, b in zip(first, second):
+        assert all(np.array_equal(x, y) for x, y in zip(a, b))
+
+
+def test_negatives_are_not_edges(toy):
+    graph = HeteroGraph.from_edges(*toy)
+    sampler = NegativeSampler(graph, seed=0)
+    positives = sampler.triples(["binds", "treats"])
+
+    negatives = sampler.corrupt(positives, num_negatives=3)
+
+    assert len(negatives) > 0
+    assert not sampler.contains(negatives).any()
+    assert sampler.contains(positives).all()
@@ -0,0 +1,107 @@
+import bz2
+import io
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from utils.sources import HetioRecords, _JsonArrayStream, _umls_cache_path, load_umls
+
+# (CUI, LAT, SAB, CODE, STR) of MRCONSO rows, "NA" being a code and a string rather than missing values
+MRCONSO_ROWS = [
+    ("C0000001", "ENG", "MSH", "D000001", "Calcimycin"),
+    ("C0000002", "FRE", "MSH", "D000002", "Temefos"),
+    ("C0000003", "ENG", "NCI", "NA", "NA"),
+    ("C0000004", "ENG", "SNOMEDCT_US", "123", "Lung cancer"),
+    ("C0000005", "ENG", "MSH", "D000005", "Abattoirs"),
+    ("C0000003", "ENG", "MSH", "D000003", "Sodium"),
+    ("C0000006", "SPA", "NCI", "C6", "Cancer")
+]
+
+DOCUMENTS = [
+    '{"nodes": [1.5e-3]}',
+    '{"nodes": [-3e5]}',
+    '{"nodes": [0, -0.25, 12E+2, true, false, null]}',
+    '{"nodes": []}',
+    '{"metagraph": {"kinds": ["Gene", "Disease"]}, "kind_to_abbrev": [1, [2.5, 3]], "nodes": ['
+    '{"kind": "Gene", "identifier": 1017, "name": "CDK2", "data": {"source": "Entrez Gene", "score": 0.125e1}}, '
+    '{"kind": "Disease", "identifier": "DOID:1324", "name": "lung cancer \\u00e9 \\"quoted\\"", "data": {}}'
+    '], "edges": [{"source_id": ["Gene", 1017], "target_id": ["Disease", "DOID:1324"], "kind": "associates"}]}'
+]
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5, 1 << 20])
+def test_stream_decodes_values_split_across_chunks(document, chunk_size):
+    stream = _JsonArrayStream(io.StringIO(document), chunk_size=chunk_size)
+
+    assert list(stream.iter_array("nodes")) == json.loads(document)["nodes"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 20])
+def test_stream_reports_missing_keys_and_truncated_documents(chunk_size):
+    with pytest.raises(KeyError):
+        list(_JsonArrayStream(io.StringIO('{"edges": [1, 2]}'), chunk_size=chunk_size).iter_array("nodes"))
+
+    with pytest.raises(ValueError):
+        list(_JsonArrayStream(io.StringIO('{"nodes": [1, 2'), chunk_size=chunk_size).iter_array("nodes"))
+
+
+def test_hetio_records_are_re_iterable(tmp_path):
+    path = str(tmp_path / "hetnet.json.bz2")
+    with bz2.open(path, "wt", encoding="utf-8") as file:
+        file.write(DOCUMENTS[-1])
+
+    expected = json.loads(DOCUMENTS[-1])
+    nodes = HetioRecords(path, "nodes")
+    assert list(nodes) == expected["nodes"]
+    assert list(nodes) == expected["nodes"]
+    assert list(HetioRecords(path, "edges")) == expected["edges"]
+
+
+def write_mrconso(path):
+    with open(path, "w", encoding="utf-8") as file:
+        for i, (cui, lat, sab, code, string) in enumerate(MRCONSO_ROWS):
+            fields = [cui, lat, "P", f"L{i}", "PF", f"S{i}", "Y", f"A{i}", "", "", "", sab, "PT", code, string, "0",
+                      "N", "", ""]
+            file.write("|".join(fields) + "|\n")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 100])
+def test_umls_chunks_are_filtered_and_compacted(tmp_path, chunk_size):
+    path = str(tmp_path / "MRCONSO.RRF")
+    write_mrconso(path)
+
+    umls = load_umls(path, sabs=["MSH", "NCI"], chunk_size=chunk_size, use_cache=False)
+
+    expected = [row for row in MRCONSO_ROWS if row[1] == "ENG" and row[2] in ("MSH", "NCI")]
+    assert [tuple(row) for row in umls[["CUI", "LAT", "SAB", "CODE", "STR"]].itertuples(index=False)] == expected
+    for column in ["LAT", "SAB", "CUI", "CODE"]:
+        assert isinstance(umls[column].dtype, pd.CategoricalDtype)
+    assert load_umls(path, languages=["FRE", "SPA"], chunk_size=chunk_size, use_cache=False)["CUI"].tolist() == \
+        ["C0000002", "C0000006"]
+
+
+def test_umls_cache_is_keyed_on_the_file_and_filters(tmp_path):
+    path = str(tmp_path / "MRCONSO.RRF")
+    write_mrconso(path)
+    cache_dir = str(tmp_path)
+
+    cache_path = _umls_cache_path(path, cache_dir, ["ENG"], ["MSH", "NCI"])
+    assert _umls_cache_path(path, cache_dir, ["ENG"], ["NCI", "MSH"]) == cache_path
+    assert _umls_cache_path(path, cache_dir, ["ENG"], ["MSH"]) != cache_path
+    assert _umls_cache_path(path, cache_dir, ["ENG", "FRE"], ["MSH", "NCI"]) != cache_path
+    assert _umls_cache_path(path, cache_dir, ["ENG"]) != cache_path
+
+    umls = load_umls(path, sabs=["MSH", "NCI"], cache_dir=cache_dir)
+    assert os.path.exists(cache_path)
+    pd.testing.assert_frame_equal(load_umls(path, sabs=["NCI", "MSH"], cache_dir=cache_dir), umls)
+
+    # a rewritten file, even of the same size, is parsed again
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert _umls_cache_path(path, cache_dir, ["ENG"], ["MSH", "NCI"]) != cache_path
+    with open(path, "a", encoding="utf-8") as file:
+        file.write("C0000007|ENG|P|L7|PF|S7|Y|A7||||MSH|PT|D000007|Acetone|0|N|||\n")
+    assert len(load_umls(path, sabs=["MSH", "NCI"], cache_dir=cache_dir)) == len(umls) + 1
@@ -0,0 +1,52 @@
+import gc
+
+from utils.edge import Edge, EdgeView
+from utils.enrichment import apply_ids, index_nodes
+from utils.node import Node, NodeView
+
+
+def test_node_view_reads_every_node(toy, outputs, records):
+    nodes, _ = toy
+    Node.save_checkpoint(nodes, str(outputs / "nodes.columnar"), "columnar")
+
+    view = Node.load_checkpoint(str(outputs / "nodes.columnar"), "columnar", lazy=True)
+
+    assert isinstance(view, NodeView)
+    assert len(view) == len(nodes)
+    assert records(view) == records(nodes)
+    assert records(view[2:4]) == records(nodes[2:4])
+    assert records(view.filter(kinds=["Disease"])) == records([n for n in nodes if n.kind == "Disease"])
+    assert view.kind_counts() == {"Compound": 3, "Gene": 2, "Disease": 2}
+    assert view.key_rows() == {n.key: i for i, n in enumerate(nodes)}
+
+
+def test_edge_view_reads_every_edge(toy, outputs, records):
+    nodes, edges = toy
+    Node.save_checkpoint(nodes, str(outputs / "nodes.columnar"), "columnar")
+    Edge.save_checkpoint(edges, str(outputs / "edges.columnar"), "columnar", nodes)
+
+    node_view = Node.load_checkpoint(str(outputs / "nodes.columnar"), "columnar", lazy=True)
+    view = Edge.load_checkpoint(str(outputs / "edges.columnar"), node_view, "columnar", lazy=True)
+
+    assert isinstance(view, EdgeView)
+    assert records(view) == records(edges)
+    assert records(view.filter(kinds=["treats"])) == records([e for e in edges if e.kind == "treats"])
+    # endpoints are the nodes of the node view
+    assert view[0].source is node_view[0]
+
+
+def test_changes_to_view_nodes_are_kept(toy, outputs):
+    nodes, _ = toy
+    Node.save_checkpoint(nodes, str(outputs / "nodes.columnar"), "columnar")
+    view = Node.load_checkpoint(str(outputs / "nodes.columnar"), "columnar", lazy=True)
+
+    view[0].add_cui("C0000001")
+    apply_ids(index_nodes(view), "Disease", ["D1"], {"mesh_ids": {"D1": ["D000001"]}})
+    gc.collect()
+
+    disease = next(n for n in view if n.identifier == "D1")
+    assert view[0].umls_cuis == ["C0000001"]
+    assert disease.mesh_ids == ["D000001"]
+    assert [n.identifier for n in view.edited] == ["C1", "D1"]
+    # the filtered views share the changed nodes
+    assert view.filter(kinds=["Compound"])[0].umls_cuis == ["C0000001"]
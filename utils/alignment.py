@@ -0,0 +1,69 @@
+from collections import defaultdict
+from typing import List, Dict, Tuple, Iterator, NamedTuple, Set
+
+from utils.node import Node
+
+
+class Match(NamedTuple):
+    """
+    left and right are positions in the aligned node lists, value is the attribute they share, and left_field and
+    right_field say which attribute it is on each side ("identifier", "mesh_id" or "umls_cui").
+    """
+    left: int
+    right: int
+    value: str
+    left_field: str
+    right_field: str
+
+
+def node_attributes(node: Node) -> Iterator[Tuple[str, str]]:
+    """
+    (field, value) pairs of the attributes Node.__eq__ compares.
+    """
+    yield "identifier", node.identifier
+
+    for mesh_id in node.mesh_ids:
+        yield "mesh_id", mesh_id
+
+    for cui in node.umls_cuis:
+        yield "umls_cui", cui
+
+
+def build_attribute_index(nodes: List[Node]) -> Dict[str, List[Tuple[int, str]]]:
+    """
+    Inverted index from every attribute value to the (position, field) of the nodes carrying it.
+    """
+    index = defaultdict(list)
+
+    for i, node in enumerate(nodes):
+        for field, value in node_attributes(node):
+            index[value].append((i, field))
+
+    return index
+
+
+def align(left: List[Node], right: List[Node]) -> List[Match]:
+    """
+    Finds every pair of nodes across left and right that share an identifier, MeSH ID or UMLS CUI, i.e. the pairs for
+    which Node.__eq__ is True, in time linear in the number of attributes (plus the number of matches). A pair sharing
+    several attributes yields one Match per shared attribute.
+    """
+    index = build_attribute_index(right)
+    matches = []
+
+    for i, node in enumerate(left):
+        seen = set()
+        for left_field, value in node_attributes(node):
+            # the same CUI or MeSH ID may be listed twice on a node
+            if value in seen:
+                continue
+            seen.add(value)
+
+            for j, right_field in index.get(value, []):
+                matches.append(Match(i, j, value, left_field, right_field))
+
+    return matches
+
+
+def matched_pairs(matches: List[Match]) -> Set[Tuple[int, int]]:
+    return set((m.left, m.right) for m in matches)
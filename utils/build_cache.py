@@ -0,0 +1,134 @@
+import hashlib
+import inspect
+import json
+import os
+from types import FunctionType, CodeType
+from typing import List, Dict, Iterable, Set
+
+from utils.logger import log
+
+BUILD_MANIFEST = "outputs/build_manifest.json"
+
+
+class BuildCache(object):
+    """
+    Records, for every build stage, a digest of its inputs (source files, upstream checkpoints, parameters) and of the
+    outputs it wrote. A stage is fresh if its inputs digest is unchanged and its outputs are still the ones it wrote, in
+    which case its checkpoint can be loaded instead of rebuilt. Stale checkpoints must not be loaded.
+
+    File digests are SHA-1 of the content, memoized by path, size and mtime so unchanged files are not read again.
+    """
+
+    def __init__(self, manifest_path: str = BUILD_MANIFEST):
+        self.manifest_path = manifest_path
+
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as file:
+                self._manifest = json.load(file)
+        else:
+            self._manifest = {"files": {}, "stages": {}}
+
+    def digest_file(self, path: str) -> str:
+        """
+        Content digest of a file, or of every file in a directory such as a columnar checkpoint.
+        """
+        if os.path.isdir(path):
+            digest = hashlib.sha1()
+            for name in sorted(os.listdir(path)):
+                digest.update(name.encode("utf-8"))
+                digest.update(self.digest_file(os.path.join(path, name)).encode("utf-8"))
+            return digest.hexdigest()
+
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        memo = self._manifest["files"].get(key, None)
+
+        if memo is not None and memo["size"] == stat.st_size and memo["mtime"] == stat.st_mtime_ns:
+            return memo["digest"]
+
+        digest = hashlib.sha1()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+
+        self._manifest["files"][key] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "digest": digest.hexdigest()}
+        self._save()
+
+        return digest.hexdigest()
+
+    def is_fresh(self, stage: str, inputs_digest: str) -> bool:
+        record = self._manifest["stages"].get(stage, None)
+
+        if record is None:
+            log.info(f"Stage {stage} has not been built yet.")
+            return False
+
+        if record["inputs"] != inputs_digest:
+            log.info(f"Inputs of stage {stage} changed, rebuilding it.")
+            return False
+
+        for path, digest in record["outputs"].items():
+            if not os.path.exists(path) or self.digest_file(path) != digest:
+                log.info(f"Output {path} of stage {stage} is missing or was modified, rebuilding it.")
+                return False
+
+        return True
+
+    def record(self, stage: str, inputs_digest: str, outputs: Iterable[str]) -> None:
+        self._manifest["stages"][stage] = {
+            "inputs": inputs_digest,
+            "outputs": {path: self.digest_file(path) for path in outputs}
+        }
+        self._save()
+
+    def _save(self) -> None:
+        temporary_path = self.manifest_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self._manifest, file)
+        os.replace(temporary_path, self.manifest_path)
+
+
+def digest_inputs(inputs: Dict[str, object]) -> str:
+    """
+    Digest of a stage's inputs, e.g. {"hetio": <file digest>, "include_inverse": True}. Values must be
+    JSON-serializable.
+    """
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def digest_keys(keys: List[object]) -> str:
+    """
+    Digest of a list of node keys, for stages such as edges that depend on which nodes exist but not on their metadata.
+    """
+    return hashlib.sha1(json.dumps(keys).encode("utf-8")).hexdigest()
+
+
+def function_digest(function: FunctionType, _seen: Set[FunctionType] = None) -> str:
+    """
+    Digest of what a function computes: its source, the values of the module-level constants it reads, e.g. UMLS_SABS,
+    and the digests of the functions of this package it calls. Editing any of them changes the digest.
+    """
+    seen = set() if _seen is None else _seen
+    seen.add(function)
+
+    digest = hashlib.sha1(inspect.getsource(function).encode("utf-8"))
+
+    for name in sorted(_global_names(function.__code__)):
+        value = function.__globals__.get(name, None)
+
+        if isinstance(value, FunctionType) and value not in seen and \
+                value.__module__.split(".")[0] == function.__module__.split(".")[0]:
+            digest.update(f"{name}:{function_digest(value, seen)};".encode("utf-8"))
+        elif isinstance(value, (str, int, float, bool, list, tuple, dict)):
+            digest.update(f"{name}={value!r};".encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def _global_names(code: CodeType) -> Set[str]:
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, CodeType):
+            names |= _global_names(constant)
+
+    return names
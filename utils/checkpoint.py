@@ -0,0 +1,511 @@
+import gzip
+import json
+import os
+import zlib
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, Hashable, Tuple, List, Optional, Set, Callable
+
+import numpy as np
+
+from utils.logger import log
+
+CHECKPOINT_FORMATS = ["json", "columnar", "jsonl", "jsonl.gz"]
+COLUMNAR_VERSION = 2
+COLUMNAR_HEADER = "header.json"
+JSON_LINES_VERSION = 1
+JSON_LINES_BLOCK_SIZE = 10000
+
+# [offset, length in bytes, number of records, {kind: number of records}] of a block of a JSON-lines file
+Block = List[object]
+
+
+def checkpoint_path(json_path: str, checkpoint_format: str) -> str:
+    """
+    Maps the path of a JSON checkpoint to the path of the same checkpoint in checkpoint_format, e.g.
+    outputs/hetio_nodes.checkpoint.json -> outputs/hetio_nodes.checkpoint.columnar
+    """
+    if checkpoint_format not in CHECKPOINT_FORMATS:
+        raise ValueError(f"Unknown checkpoint format {checkpoint_format}, expecting one of {CHECKPOINT_FORMATS}.")
+
+    return os.path.splitext(json_path)[0] + "." + checkpoint_format
+
+
+def checkpoint_exists(path: str, checkpoint_format: str) -> bool:
+    if checkpoint_format == "columnar":
+        # a checkpoint in an older version of the format has to be rebuilt
+        header_path = os.path.join(path, COLUMNAR_HEADER)
+        if not os.path.exists(header_path):
+            return False
+        with open(header_path, "r") as file:
+            return json.load(file).get("version", None) == COLUMNAR_VERSION
+
+    if checkpoint_format in ("jsonl", "jsonl.gz"):
+        # a file without an index is an interrupted write
+        return os.path.exists(path) and read_json_lines_index(path) is not None
+
+    return os.path.exists(path)
+
+
+def dump_json_records(records: Iterable[Dict[str, object]], output_path: str, stream: bool = True) -> int:
+    """
+    Writes records as one JSON array. With stream=True the records are encoded and written one at a time as they are
+    produced, so the whole array is never held in memory. Returns the number of records written.
+    """
+    count = 0
+
+    with open(output_path, "w") as file:
+        if not stream:
+            records = list(records)
+            json.dump(records, file)
+            return len(records)
+
+        file.write("[")
+        for record in records:
+            if count > 0:
+                file.write(", ")
+            file.write(json.dumps(record))
+            count += 1
+        file.write("]")
+
+    return count
+
+
+class DictionaryEncoder(object):
+    """
+    Assigns consecutive integer codes to hashable values in order of first appearance.
+    """
+
+    def __init__(self):
+        self._codes = {}
+        self.vocabulary = []
+
+    def encode(self, value: Hashable) -> int:
+        code = self._codes.get(value, None)
+
+        if code is None:
+            code = len(self.vocabulary)
+            self._codes[value] = code
+            self.vocabulary.append(value)
+
+        return code
+
+
+def vocabulary_codes(vocabulary: List[object], values: Iterable[str], contains: bool = False) -> List[int]:
+    """
+    Codes of the entries of a DictionaryEncoder vocabulary that are in values or, with contains=True, of the entries,
+    e.g. lists of sources, that contain one of values.
+    """
+    values = set(values)
+
+    if contains:
+        return [code for code, entry in enumerate(vocabulary) if entry is not None and not values.isdisjoint(entry)]
+
+    return [code for code, entry in enumerate(vocabulary) if entry in values]
+
+
+def write_columnar(output_dir: str, header: Dict[str, object], arrays: Dict[str, np.ndarray]) -> None:
+    """
+    Writes a columnar checkpoint as a directory holding one .npy file per array and a header.json file. The header is
+    written last, so a directory without one is an interrupted write.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    header_path = os.path.join(output_dir, COLUMNAR_HEADER)
+    if os.path.exists(header_path):
+        os.remove(header_path)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(output_dir, f"{name}.npy"), array)
+
+    write_columnar_header(output_dir, header, list(arrays.keys()))
+
+
+def write_columnar_header(output_dir: str, header: Dict[str, object], array_names: List[str]) -> None:
+    """
+    Completes a columnar checkpoint whose arrays, e.g. filled in place through np.lib.format.open_memmap, are already
+    in output_dir as <name>.npy.
+    """
+    header = dict(header, version=COLUMNAR_VERSION, arrays=array_names)
+    with open(os.path.join(output_dir, COLUMNAR_HEADER), "w") as file:
+        json.dump(header, file)
+
+
+def read_columnar(input_dir: str, mmap: bool = True) -> Tuple[Dict[str, object], Dict[str, np.ndarray]]:
+    """
+    Reads a checkpoint written by write_columnar, memory-mapping the arrays unless mmap is False.
+    """
+    header_path = os.path.join(input_dir, COLUMNAR_HEADER)
+    if not os.path.exists(header_path):
+        raise FileNotFoundError(f"Columnar checkpoint at {input_dir} does not exist or is incomplete!")
+
+    with open(header_path, "r") as file:
+        header = json.load(file)
+
+    if header["version"] != COLUMNAR_VERSION:
+        raise ValueError(f"Columnar checkpoint at {input_dir} has version {header['version']}, "
+                         f"expecting {COLUMNAR_VERSION}.")
+
+    mmap_mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(input_dir, f"{name}.npy"), mmap_mode=mmap_mode) for name in header["arrays"]}
+
+    return header, arrays
+
+
+def code_dtype(vocabulary_size: int) -> np.dtype:
+    return np.dtype(np.int16) if vocabulary_size < np.iinfo(np.int16).max else np.dtype(np.int32)
+
+
+# Type codes of the values of a string column, integers (e.g. Entrez gene IDs) being stored as their decimal strings
+STRING_TYPES = [str, int, type(None)]
+
+
+def string_arrays(name: str, values: Iterable[object]) -> Dict[str, np.ndarray]:
+    """
+    Arrays of a string column of a columnar checkpoint: <name>.data, the UTF-8 bytes of all values back to back,
+    <name>.offsets, where value i starts and ends in data (offsets[i] to offsets[i + 1]), and <name>.types, the
+    STRING_TYPES code of every value, so that integers and None come back as such. See StringColumn.
+    """
+    type_codes = {t: code for code, t in enumerate(STRING_TYPES)}
+    encoded = []
+    types = []
+
+    for value in values:
+        types.append(type_codes[type(value)])
+        encoded.append(b"" if value is None else str(value).encode("utf-8"))
+
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded], dtype=np.int64)
+
+    return {
+        f"{name}.data": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        f"{name}.offsets": offsets,
+        f"{name}.types": np.array(types, dtype=np.int8)
+    }
+
+
+def string_list_arrays(name: str, lists: Iterable[List[object]]) -> Dict[str, np.ndarray]:
+    """
+    Arrays of a column holding a list of strings per row: the values of all lists as the string column name (see
+    string_arrays), and <name>.lists, where the values of row i start and end among them. See StringListColumn.
+    """
+    lengths = []
+    values = []
+
+    for values_of_row in lists:
+        lengths.append(len(values_of_row))
+        values += values_of_row
+
+    bounds = np.zeros(len(lengths) + 1, dtype=np.int64)
+    bounds[1:] = np.cumsum(lengths, dtype=np.int64)
+
+    return dict(string_arrays(name, values), **{f"{name}.lists": bounds})
+
+
+class StringColumn(Sequence):
+    """
+    String column of a columnar checkpoint, see string_arrays. Values are decoded from the (memory-mapped) arrays when
+    indexed, tolist decodes all of them at once.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], name: str):
+        self._data = arrays[f"{name}.data"]
+        self._offsets = arrays[f"{name}.offsets"]
+        self._types = arrays[f"{name}.types"]
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    def __getitem__(self, row: int) -> object:
+        value_type = STRING_TYPES[self._types[row]]
+        if value_type is type(None):
+            return None
+
+        return value_type(self._data[self._offsets[row]:self._offsets[row + 1]].tobytes().decode("utf-8"))
+
+    def tolist(self) -> List[object]:
+        data = self._data.tobytes()
+        offsets = self._offsets.tolist()
+        values = [data[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+
+        for row in np.flatnonzero(self._types != 0).tolist():
+            value_type = STRING_TYPES[self._types[row]]
+            values[row] = None if value_type is type(None) else value_type(values[row])
+
+        return values
+
+
+class StringListColumn(Sequence):
+    """
+    Column of a columnar checkpoint holding a list of strings per row, see string_list_arrays.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], name: str):
+        self._values = StringColumn(arrays, name)
+        self._bounds = arrays[f"{name}.lists"]
+
+    def __len__(self) -> int:
+        return len(self._bounds) - 1
+
+    def __getitem__(self, row: int) -> List[object]:
+        return [self._values[i] for i in range(self._bounds[row], self._bounds[row + 1])]
+
+    def tolist(self) -> List[List[object]]:
+        values = self._values.tolist()
+        bounds = self._bounds.tolist()
+
+        return [values[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+class JsonLinesWriter(object):
+    """
+    Writes records to a JSON-lines file as they are produced, gzip-compressed if the path ends with .gz. Records are
+    written in blocks of block_size, each one flushed as a whole (and compressed as its own gzip member), so an
+    interrupted write loses at most the block in progress and the rest of the file stays readable.
+
+    Closing the writer appends an index of the blocks, with the number of records of every kind (the "kind" field of
+    the records) they hold, followed by a fixed-size footer pointing at the index. read_json_lines uses it to skip the
+    blocks without any of the requested kinds. With append=True, records are added to an existing file and its index is
+    extended, or rebuilt if the file was not closed properly.
+    """
+
+    def __init__(self, path: str, append: bool = False, block_size: int = JSON_LINES_BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+        self.count = 0
+        self._compressed = path.endswith(".gz")
+        self._lines = []
+        self._kinds = {}
+
+        if append and os.path.exists(path):
+            self._blocks, end = _existing_blocks(path)
+            self._file = open(path, "r+b")
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self._blocks = []
+            self._file = open(path, "wb")
+
+    def __enter__(self) -> 'JsonLinesWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(self, record: Dict[str, object]) -> None:
+        self._lines.append(json.dumps(record))
+        kind = str(record.get("kind", None))
+        self._kinds[kind] = self._kinds.get(kind, 0) + 1
+        self.count += 1
+
+        if len(self._lines) >= self.block_size:
+            self._flush()
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+
+        self._flush()
+
+        index_offset = self._file.tell()
+        self._file.write(self._encode(json.dumps({"jsonl_blocks": self._blocks, "version": JSON_LINES_VERSION}) + "\n"))
+        self._file.write(_json_lines_footer(index_offset, self._compressed))
+        self._file.close()
+
+    def _flush(self) -> None:
+        if len(self._lines) == 0:
+            return
+
+        data = self._encode("\n".join(self._lines) + "\n")
+        self._blocks.append([self._file.tell(), len(data), len(self._lines), self._kinds])
+        self._file.write(data)
+        self._file.flush()
+
+        self._lines = []
+        self._kinds = {}
+
+    def _encode(self, text: str) -> bytes:
+        data = text.encode("utf-8")
+
+        return gzip.compress(data, compresslevel=6, mtime=0) if self._compressed else data
+
+
+def dump_json_lines(records: Iterable[Dict[str, object]], output_path: str, append: bool = False) -> int:
+    """
+    Writes records with a JsonLinesWriter, see there. Returns the number of records written.
+    """
+    with JsonLinesWriter(output_path, append=append) as writer:
+        for record in records:
+            writer.write(record)
+
+    return writer.count
+
+
+def read_json_lines(input_path: str,
+                    kinds: Optional[Iterable[str]] = None,
+                    where: Optional[Callable[[Dict[str, object]], bool]] = None) -> Iterator[Dict[str, object]]:
+    """
+    Yields the records of a file written by JsonLinesWriter, one block at a time. With kinds, only the records of those
+    kinds are yielded, and the blocks holding none of them are not read at all. where is an optional predicate the
+    records must also satisfy. A file without an index, e.g. from an interrupted write, is read up to its last complete
+    block.
+    """
+    kinds = set(kinds) if kinds is not None else None
+    index = read_json_lines_index(input_path)
+
+    if index is None:
+        log.warning(f"JSON-lines file at {input_path} has no index, reading it up to its last complete block.")
+        units = (text for _, _, text in _scan_json_lines(input_path))
+    else:
+        units = _read_blocks(input_path, index, kinds)
+
+    for text in units:
+        for line in text.splitlines():
+            record = json.loads(line)
+
+            if "jsonl_blocks" in record or "jsonl_index" in record:
+                continue
+            if kinds is not None and record.get("kind", None) not in kinds:
+                continue
+            if where is not None and not where(record):
+                continue
+
+            yield record
+
+
+def read_json_lines_index(input_path: str) -> Optional[List[Block]]:
+    """
+    The block index of a file written by JsonLinesWriter, or None if it has none.
+    """
+    compressed = input_path.endswith(".gz")
+    footer_size = len(_json_lines_footer(0, compressed))
+    size = os.path.getsize(input_path)
+
+    if size < footer_size:
+        return None
+
+    with open(input_path, "rb") as file:
+        file.seek(size - footer_size)
+        try:
+            footer = json.loads(_decode(file.read(), compressed))
+            index_offset = int(footer["jsonl_index"])
+
+            file.seek(index_offset)
+            index = json.loads(_decode(file.read(size - footer_size - index_offset), compressed))
+        except (ValueError, KeyError, OSError, EOFError, zlib.error):
+            return None
+
+    if index.get("version", None) != JSON_LINES_VERSION:
+        return None
+
+    return index["jsonl_blocks"]
+
+
+def _json_lines_footer(index_offset: int, compressed: bool) -> bytes:
+    data = (json.dumps({"jsonl_index": f"{index_offset:020d}"}) + "\n").encode("utf-8")
+
+    # stored without compression, so that the footer has the same size whatever the offset
+    return gzip.compress(data, compresslevel=0, mtime=0) if compressed else data
+
+
+def _decode(data: bytes, compressed: bool) -> str:
+    return (gzip.decompress(data) if compressed else data).decode("utf-8")
+
+
+def _read_blocks(input_path: str, blocks: List[Block], kinds: Optional[Set[str]]) -> Iterator[str]:
+    compressed = input_path.endswith(".gz")
+
+    with open(input_path, "rb") as file:
+        for offset, length, _, block_kinds in blocks:
+            if kinds is not None and len(kinds.intersection(block_kinds)) == 0:
+                continue
+
+            file.seek(offset)
+            yield _decode(file.read(length), compressed)
+
+
+def _scan_json_lines(input_path: str, chunk_size: int = 1 << 20) -> Iterator[Tuple[int, int, str]]:
+    """
+    Yields the (offset, length, text) of every complete unit of a JSON-lines file without relying on its index: lines of
+    a plain file, gzip members of a compressed one. Stops at the first incomplete unit.
+    """
+    with open(input_path, "rb") as file:
+        if not input_path.endswith(".gz"):
+            offset = 0
+            for line in file:
+                if not line.endswith(b"\n"):
+                    return
+                text = line.decode("utf-8")
+                try:
+                    json.loads(text)
+                except ValueError:
+                    return
+                yield offset, len(line), text
+                offset += len(line)
+            return
+
+        offset = 0
+        buffer = b""
+        while True:
+            member = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            start = offset
+            parts = []
+
+            while not member.eof:
+                chunk = buffer or file.read(chunk_size)
+                if len(chunk) == 0:
+                    return
+                try:
+                    parts.append(member.decompress(chunk))
+                except zlib.error:
+                    return
+
+                if member.eof:
+                    buffer = member.unused_data
+                    offset += len(chunk) - len(buffer)
+                else:
+                    buffer = b""
+                    offset += len(chunk)
+
+            yield start, offset - start, b"".join(parts).decode("utf-8")
+
+
+def _existing_blocks(input_path: str) -> Tuple[List[Block], int]:
+    """
+    Blocks of an existing JSON-lines file and the offset new blocks go to. Without an index, the blocks are rebuilt by
+    scanning the file, and whatever follows the last complete one is dropped.
+    """
+    index = read_json_lines_index(input_path)
+    compressed = input_path.endswith(".gz")
+
+    if index is not None:
+        end = index[-1][0] + index[-1][1] if len(index) > 0 else 0
+        return index, end
+
+    log.warning(f"JSON-lines file at {input_path} has no index, rebuilding it.")
+    blocks = []
+    end = 0
+
+    for offset, length, text in _scan_json_lines(input_path):
+        records = [json.loads(line) for line in text.splitlines()]
+        if any("jsonl_blocks" in r or "jsonl_index" in r for r in records):
+            break
+
+        kinds = {}
+        for record in records:
+            kind = str(record.get("kind", None))
+            kinds[kind] = kinds.get(kind, 0) + 1
+
+        if not compressed and len(blocks) > 0 and blocks[-1][0] + blocks[-1][1] == offset and \
+                blocks[-1][2] < JSON_LINES_BLOCK_SIZE:
+            # plain files are scanned line by line, group the lines back into blocks
+            block = blocks[-1]
+            block[1] += length
+            block[2] += len(records)
+            for kind, count in kinds.items():
+                block[3][kind] = block[3].get(kind, 0) + count
+        else:
+            blocks.append([offset, length, len(records), kinds])
+
+        end = offset + length
+
+    return blocks, end
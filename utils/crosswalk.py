@@ -0,0 +1,271 @@
+import hashlib
+import os
+import sqlite3
+import time
+from typing import List, Dict, Iterable, Tuple, Callable, Optional, Union
+
+import pandas as pd
+from pronto import Ontology
+
+from utils.enrichment import EnrichmentSummary, apply_ids, index_nodes, ontology_xrefs
+from utils.instrumentation import instrumented
+from utils.logger import log
+from utils.node import Node
+from utils.ontology import CompactOntology
+from utils.pipeline import Mappings
+
+CROSSWALK_PATH = "outputs/crosswalk.sqlite"
+CROSSWALK_VERSION = 1
+CROSSWALK_BATCH_SIZE = 100000
+
+# UMLS sources worth indexing: DrugBank, MeSH, and NDF-RT/MED-RT for pharmacologic classes
+CROSSWALK_SABS = ["DRUGBANK", "MSH", "NDFRT", "MED-RT"]
+# UMLS source abbreviations and ontology xref prefixes naming the same namespace
+NAMESPACE_ALIASES = {"MSH": "MESH", "UMLS": "UMLS_CUI"}
+# Namespace of the IDs each enrichable Node field holds, see utils/enrichment.ENRICHABLE_FIELDS
+FIELD_NAMESPACES = {"umls_cuis": "UMLS_CUI", "mesh_ids": "MESH"}
+
+
+class Crosswalk(object):
+    """
+    Persistent index of equivalent identifiers across vocabularies, e.g. DrugBank ID <-> UMLS CUI from MRCONSO, or
+    DOID <-> MeSH ID from the Disease Ontology xrefs, kept in a SQLite database so that it is built once and shared by
+    every run and every source of nodes.
+
+    Every identifier belongs to a namespace (UMLS_CUI, MESH, DRUGBANK, DOID, GO, UBERON, ...) and every link is stored
+    in both directions. lookup returns the direct links of an identifier, mappings also follows its UMLS CUIs one
+    hop further, e.g. DRUGBANK -> UMLS_CUI -> MESH.
+
+    Sources are indexed under a name ("UMLS", "DOID", ...) together with the digest of the file they were loaded from,
+    indexing a source again replaces its links.
+    """
+
+    def __init__(self, path: str = CROSSWALK_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path)
+
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != CROSSWALK_VERSION:
+            if version != 0:
+                log.info(f"Crosswalk at {path} has version {version}, expecting {CROSSWALK_VERSION}, rebuilding it.")
+            self._create()
+
+    def __enter__(self) -> 'Crosswalk':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def is_indexed(self, name: str, digest: str = None) -> bool:
+        """
+        Whether the source called name is indexed, and was loaded from a file with this digest if one is given.
+        """
+        row = self._connection.execute("SELECT digest FROM sources WHERE name = ?", (name,)).fetchone()
+
+        return row is not None and (digest is None or row[0] == digest)
+
+    def digest(self) -> str:
+        """
+        Digest of the indexed sources and of the files they were loaded from, which changes whenever a lookup could.
+        """
+        digest = hashlib.sha1()
+        for name, source_digest in self._connection.execute("SELECT name, digest FROM sources ORDER BY name"):
+            digest.update(f"{name}:{source_digest};".encode("utf-8"))
+
+        return digest.hexdigest()
+
+    @instrumented("Crosswalk.add_umls")
+    def add_umls(self, umls: pd.DataFrame, name: str = "UMLS", digest: str = None) -> int:
+        """
+        Links the CODE of every MRCONSO row, in the namespace of its SAB, to its CUI. Rows without a code are skipped.
+        Returns the number of links added.
+        """
+        rows = umls.loc[umls["CODE"].notna() & (umls["CODE"] != "NOCODE"), ["CUI", "SAB", "CODE"]].drop_duplicates()
+        namespaces = rows["SAB"].astype(str).map(lambda sab: NAMESPACE_ALIASES.get(sab, sab))
+
+        links = pd.DataFrame({
+            "identifier": rows["CODE"].values,
+            "namespace": namespaces.values,
+            "equivalent": rows["CUI"].values,
+            "equivalent_namespace": "UMLS_CUI"
+        })
+
+        return self._replace_source(name, digest, links)
+
+    @instrumented("Crosswalk.add_ontology")
+    def add_ontology(self, ontology: Union[Ontology, CompactOntology], name: str, digest: str = None) -> int:
+        """
+        Links every term of the ontology, in the namespace of its ID prefix (e.g. DOID for DOID:14227), to each of its
+        xrefs, e.g. UMLS_CUI:C0004509. Returns the number of links added.
+        """
+        if digest is None:
+            digest = getattr(ontology, "digest", None)
+
+        _, xrefs = ontology_xrefs(ontology)
+
+        links = pd.DataFrame({
+            "identifier": xrefs["term"].values,
+            "namespace": xrefs["term"].str.split(":", n=1).str[0].values,
+            "equivalent": xrefs["value"].values,
+            "equivalent_namespace": xrefs["prefix"].map(lambda prefix: NAMESPACE_ALIASES.get(prefix, prefix)).values
+        }).drop_duplicates()
+
+        return self._replace_source(name, digest, links)
+
+    def lookup(self,
+               identifiers: Iterable[object],
+               namespaces: Iterable[str] = None,
+               identifier_namespace: str = None) -> Dict[object, List[Tuple[str, str]]]:
+        """
+        (equivalent, namespace) pairs of every identifier found, in a few queries whatever the number of identifiers.
+        namespaces restricts the equivalents to those namespaces, and identifier_namespace the identifiers to one, e.g.
+        "UMLS_CUI" so that an NCI code looking like a CUI is not mistaken for one. Identifiers that are not strings,
+        e.g. Entrez gene IDs, are looked up as strings and returned as given.
+        """
+        queried = {str(identifier): identifier for identifier in identifiers}
+        found = {}
+
+        cursor = self._connection.cursor()
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS query (identifier TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM query")
+        cursor.executemany("INSERT OR IGNORE INTO query VALUES (?)", ((identifier,) for identifier in queried))
+
+        sql = "SELECT l.identifier, l.equivalent, l.equivalent_namespace FROM query q " \
+              "JOIN links l ON l.identifier = q.identifier"
+        conditions = []
+        parameters = []
+
+        if identifier_namespace is not None:
+            conditions.append("l.namespace = ?")
+            parameters.append(identifier_namespace)
+        if namespaces is not None:
+            namespaces = list(namespaces)
+            conditions.append(f"l.equivalent_namespace IN ({', '.join('?' * len(namespaces))})")
+            parameters += namespaces
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+
+        for identifier, equivalent, namespace in cursor.execute(sql + " ORDER BY l.rowid", parameters):
+            found.setdefault(queried[identifier], []).append((equivalent, namespace))
+
+        cursor.execute("DELETE FROM query")
+
+        return found
+
+    def mappings(self, identifiers: Iterable[object], identifier_namespace: str = None) -> Mappings:
+        """
+        Cross-references of identifiers as the Mappings of an enricher, keyed by Node field (see FIELD_NAMESPACES).
+        Identifiers found in the crosswalk in the namespace of a field map to themselves too, e.g. a CUI is its own UMLS
+        CUI. The UMLS CUIs of an identifier are followed one hop further, so that e.g. a DrugBank ID linked to a CUI
+        gets the MeSH IDs of that CUI.
+        """
+        identifiers = list(identifiers)
+        found = self.lookup(identifiers, FIELD_NAMESPACES.values(), identifier_namespace)
+
+        for identifier, equivalents in found.items():
+            if identifier_namespace in FIELD_NAMESPACES.values():
+                equivalents.insert(0, (identifier, identifier_namespace))
+
+        # second hop, through the UMLS CUIs of every identifier
+        cuis = {equivalent for equivalents in found.values() for equivalent, n in equivalents if n == "UMLS_CUI"}
+        through_cuis = self.lookup(cuis, FIELD_NAMESPACES.values(), "UMLS_CUI")
+
+        mappings = {field: {} for field in FIELD_NAMESPACES}
+
+        for identifier, equivalents in found.items():
+            equivalents = equivalents + [pair for equivalent, n in equivalents if n == "UMLS_CUI"
+                                         for pair in through_cuis.get(equivalent, [])]
+
+            for field, namespace in FIELD_NAMESPACES.items():
+                ids = [equivalent for equivalent, n in equivalents if n == namespace]
+                if len(ids) > 0:
+                    mappings[field][identifier] = list(dict.fromkeys(ids))
+
+        return mappings
+
+    @instrumented("Crosswalk.enrich_nodes", records=lambda summaries: sum(s.enriched for s in summaries))
+    def enrich_nodes(self, nodes: List[Node], namespaces: Dict[str, str]) -> List[EnrichmentSummary]:
+        """
+        Adds the UMLS CUIs and MeSH IDs of the nodes of every kind in namespaces, whose identifiers are in the namespace
+        it maps the kind to, e.g. {"Compound": "DRUGBANK", "Disease": "UMLS_CUI"} for repoDB nodes. IDs a node already
+        has are not added again, and nodes that had them all are counted as unchanged rather than unmatched.
+        """
+        node_index = index_nodes(nodes)
+        summaries = []
+
+        for kind, namespace in namespaces.items():
+            identifiers = [n.identifier for n in nodes if n.kind == kind]
+            summary = apply_ids(node_index, kind, identifiers, self.mappings(identifiers, namespace))
+            summary.log("UMLS CUIs or MeSH IDs")
+            summaries.append(summary)
+
+        return summaries
+
+    def _create(self) -> None:
+        with self._connection:
+            self._connection.execute("DROP TABLE IF EXISTS links")
+            self._connection.execute("DROP TABLE IF EXISTS sources")
+            self._connection.execute("CREATE TABLE links (identifier TEXT NOT NULL, namespace TEXT NOT NULL, "
+                                     "equivalent TEXT NOT NULL, equivalent_namespace TEXT NOT NULL, "
+                                     "source TEXT NOT NULL)")
+            self._connection.execute("CREATE INDEX links_identifier ON links (identifier)")
+            self._connection.execute("CREATE INDEX links_source ON links (source)")
+            self._connection.execute("CREATE TABLE sources (name TEXT PRIMARY KEY, digest TEXT, links INTEGER)")
+            self._connection.execute(f"PRAGMA user_version = {CROSSWALK_VERSION}")
+
+    def _replace_source(self, name: str, digest: Optional[str], links: pd.DataFrame) -> int:
+        """
+        Replaces the links of the source called name by links, in both directions, in one transaction.
+        """
+        start = time.time()
+        columns = [links[c].astype(str).tolist() for c in ["identifier", "namespace", "equivalent",
+                                                           "equivalent_namespace"]]
+        forward = zip(columns[0], columns[1], columns[2], columns[3])
+        backward = zip(columns[2], columns[3], columns[0], columns[1])
+
+        with self._connection:
+            self._connection.execute("DELETE FROM links WHERE source = ?", (name,))
+
+            for rows in (forward, backward):
+                batch = []
+                for row in rows:
+                    batch.append(row + (name,))
+                    if len(batch) == CROSSWALK_BATCH_SIZE:
+                        self._connection.executemany("INSERT INTO links VALUES (?, ?, ?, ?, ?)", batch)
+                        batch = []
+                self._connection.executemany("INSERT INTO links VALUES (?, ?, ?, ?, ?)", batch)
+
+            self._connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (name, digest, 2 * len(links)))
+
+        log.info(f"Indexed {2 * len(links)} {name} links in the crosswalk in {time.time() - start:.2f}s.")
+
+        return 2 * len(links)
+
+
+def build_crosswalk(sources: Dict[str, Callable[[], object]],
+                    digests: Dict[str, str],
+                    path: str = CROSSWALK_PATH) -> Crosswalk:
+    """
+    Opens the crosswalk at path and (re)indexes every source whose file changed. sources maps a source name to a
+    function loading it, "UMLS" for MRCONSO (see sources.load_umls and CROSSWALK_SABS) and the ontology prefix for an
+    ontology, e.g. "DOID" or "GO". digests holds the digest of each source's file under the same name, so that a
+    source is only loaded when it is not indexed yet or its file changed.
+    """
+    crosswalk = Crosswalk(path)
+
+    for name, loader in sources.items():
+        if crosswalk.is_indexed(name, digests.get(name, None)):
+            log.info(f"Crosswalk already indexes {name}.")
+            continue
+
+        source = loader()
+        if isinstance(source, pd.DataFrame):
+            crosswalk.add_umls(source, name, digests.get(name, None))
+        else:
+            crosswalk.add_ontology(source, name, digests.get(name, None))
+
+    return crosswalk
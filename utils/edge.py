@@ -1,82 +1,166 @@
 import json
 import os
-from copy import deepcopy
-from typing import Union, List, Dict
+from collections.abc import Sequence
+from types import MappingProxyType
+from typing import Union, List, Dict, Tuple, Iterable, Iterator, Mapping, Callable
+from weakref import WeakValueDictionary
 from pdb import set_trace
 
-from utils.node import Node
+import numpy as np
+
+from utils.build_cache import digest_keys
+from utils.checkpoint import dump_json_records, dump_json_lines, read_json_lines, write_columnar, read_columnar, \
+    DictionaryEncoder, code_dtype, vocabulary_codes
+from utils.instrumentation import instrumented
+from utils.logger import log
+from utils.node import Node, NodeKey, NodeView, NodeIntegrityError, intern_string, intern_sources
 
 
 class Edge(object):
+    # __weakref__ lets EdgeView cache the edges it creates weakly
+    __slots__ = ["_source", "_destination", "_kind", "_sources", "__weakref__"]
+
     def __init__(self,
                  source: Node = None,
                  destination: Node = None,
                  kind: str = None,
                  sources: Union[str, List[str]] = None,
                  metadata: Dict[str, object] = None):
-        if type(sources) == str:
-            sources = [sources]
-
         if metadata is not None:
-            self._metadata = metadata
-        else:
-            self._metadata = {
-                "source": source,
-                "destination": destination,
-                "kind": kind,
-                "sources": sources
-            }
+            source = metadata["source"]
+            destination = metadata["destination"]
+            kind = metadata["kind"]
+            sources = metadata.get("sources", None)
+
+        self._source = source
+        self._destination = destination
+        self._kind = intern_string(kind)
+        self._sources = intern_sources(sources)
 
     @property
     def source(self) -> Node:
-        return self._metadata["source"]
+        return self._source
 
     @property
     def destination(self) -> Node:
-        return self._metadata["destination"]
+        return self._destination
 
     @property
     def kind(self) -> str:
-        return self._metadata["kind"]
+        return self._kind
+
+    @property
+    def sources(self) -> Tuple[str, ...]:
+        return self._sources
 
     @property
     def metadata(self) -> Dict[str, object]:
-        metadata = deepcopy(self._metadata)
-        metadata["source"] = [self.source.identifier, self.source.name, self.source.kind]
-        metadata["destination"] = [self.destination.identifier, self.destination.name, self.destination.kind]
+        """
+        Defensive copy of the edge's metadata, with the endpoints as [identifier, name, kind] lists.
+        """
+        return {
+            "source": list(self._source.key),
+            "destination": list(self._destination.key),
+            "kind": self._kind,
+            "sources": list(self._sources) if self._sources is not None else None
+        }
+
+    @property
+    def metadata_view(self) -> Mapping[str, object]:
+        """
+        Read-only view of the edge's metadata, with the endpoints as (identifier, name, kind) tuples.
+        """
+        return MappingProxyType(self._record())
 
-        return metadata
+    def _record(self) -> Dict[str, object]:
+        return {
+            "source": self._source.key,
+            "destination": self._destination.key,
+            "kind": self._kind,
+            "sources": self._sources
+        }
 
     @classmethod
-    def serialize_bunch(cls, edges: List['Edge'], output_path: str) -> None:
-        metadata_set = list(map(lambda x: x.metadata, edges))
-        with open(output_path, "w") as file:
-            json.dump(metadata_set, file)
+    @instrumented("Edge.serialize_bunch")
+    def serialize_bunch(cls, edges: Iterable['Edge'], output_path: str, stream: bool = True) -> int:
+        """
+        Writes the edges' records straight from their internal state, one at a time unless stream is False. Returns
+        the number of records written.
+        """
+        return dump_json_records(map(lambda x: x._record(), edges), output_path, stream=stream)
 
     @classmethod
-    def deserialize_bunch(cls, json_path: str, nodes: List[Node]) -> List['Edge']:
+    @instrumented("Edge.deserialize_bunch")
+    def deserialize_bunch(cls,
+                          json_path: str,
+                          nodes: List[Node] = None,
+                          node_index: Dict[NodeKey, Node] = None) -> List['Edge']:
+        """
+        Resolves the endpoints of each serialized edge through a (identifier, name, kind) index. Pass node_index to
+        share an index already built with Node.index_bunch, otherwise one is built from nodes. Edges referring to nodes
+        that are not in the index are reported and raised as a NodeIntegrityError.
+        """
         if not os.path.exists(json_path):
             raise FileNotFoundError(f"Edge file at {json_path} does not exist!")
 
+        if node_index is None:
+            if nodes is None:
+                raise ValueError("Either nodes or node_index is required to deserialize edges.")
+            node_index = Node.index_bunch(nodes)
+
         with open(json_path, "r") as file:
             metadata_set = json.load(file)
+
+        return cls._from_records(metadata_set, node_index, json_path)
+
+    @classmethod
+    def serialize_json_lines(cls, edges: Iterable['Edge'], output_path: str, append: bool = False) -> int:
+        """
+        Writes the edges as a JSON-lines checkpoint, compressed if output_path ends with .gz, see
+        utils/checkpoint.JsonLinesWriter. With append=True they are added to an existing checkpoint.
+        """
+        return dump_json_lines(map(lambda x: x._record(), edges), output_path, append=append)
+
+    @classmethod
+    def deserialize_json_lines(cls,
+                               input_path: str,
+                               nodes: List[Node] = None,
+                               node_index: Dict[NodeKey, Node] = None,
+                               kinds: Iterable[str] = None) -> List['Edge']:
+        """
+        Same as deserialize_bunch for a JSON-lines checkpoint, only the edges of the given kinds if kinds is not None,
+        e.g. kinds=["treats"]. The blocks of the file holding none of them are skipped.
+        """
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Edge file at {input_path} does not exist!")
+
+        if node_index is None:
+            if nodes is None:
+                raise ValueError("Either nodes or node_index is required to deserialize edges.")
+            node_index = Node.index_bunch(nodes)
+
+        return cls._from_records(read_json_lines(input_path, kinds=kinds), node_index, input_path)
+
+    @classmethod
+    def _from_records(cls,
+                      metadata_set: Iterable[Dict[str, object]],
+                      node_index: Dict[NodeKey, Node],
+                      json_path: str) -> List['Edge']:
         edges = []
+        missing = set()
 
         for metadata in metadata_set:
-            source_node = list(filter(lambda x:
-                                      x.identifier == metadata["source"][0] and
-                                      x.name == metadata["source"][1] and
-                                      x.kind == metadata["source"][2], nodes))
-            destination_node = list(filter(lambda x:
-                                           x.identifier == metadata["destination"][0] and
-                                           x.name == metadata["destination"][1] and
-                                           x.kind == metadata["destination"][2], nodes))
-
-            assert len(source_node) == 1, f"Expecting 1 source node, found {len(source_node)}."
-            assert len(destination_node) == 1, f"Expecting 1 destination node, found {len(destination_node)}."
+            source_key = tuple(metadata["source"])
+            destination_key = tuple(metadata["destination"])
+            source_node = node_index.get(source_key, None)
+            destination_node = node_index.get(destination_key, None)
 
-            source_node = source_node[0]
-            destination_node = destination_node[0]
+            if source_node is None:
+                missing.add(source_key)
+            if destination_node is None:
+                missing.add(destination_key)
+            if source_node is None or destination_node is None:
+                continue
 
             metadata["source"] = source_node
             metadata["destination"] = destination_node
@@ -84,4 +168,238 @@ class Edge(object):
             edge = cls(metadata=metadata)
             edges.append(edge)
 
+        if len(missing) > 0:
+            log.error(f"{len(missing)} nodes referenced by {json_path} are missing, e.g. {list(missing)[:5]}.")
+            raise NodeIntegrityError(f"Edges in {json_path} refer to {len(missing)} nodes that do not exist.")
+
         return edges
+
+    @classmethod
+    @instrumented("Edge.save_checkpoint")
+    def save_checkpoint(cls,
+                        edges: Iterable['Edge'],
+                        path: str,
+                        checkpoint_format: str = "json",
+                        nodes: List[Node] = None) -> None:
+        """
+        nodes are required for columnar checkpoints, whose endpoints are rows of nodes, see serialize_columnar.
+        """
+        if checkpoint_format == "columnar":
+            if nodes is None:
+                raise ValueError("The nodes of the edges are required to save a columnar checkpoint.")
+            cls.serialize_columnar(edges, path, nodes)
+        elif checkpoint_format in ("jsonl", "jsonl.gz"):
+            cls.serialize_json_lines(edges, path)
+        else:
+            cls.serialize_bunch(edges, path)
+
+    @classmethod
+    @instrumented("Edge.load_checkpoint")
+    def load_checkpoint(cls,
+                        path: str,
+                        node_index: Union[Dict[NodeKey, Node], NodeView],
+                        checkpoint_format: str = "json",
+                        lazy: bool = False) -> Union[List['Edge'], 'EdgeView']:
+        """
+        With lazy=True an EdgeView over the checkpoint is returned instead of a list, columnar checkpoints only.
+        node_index may then be a NodeView, whose nodes are only created for the edges accessed.
+        """
+        if lazy and checkpoint_format != "columnar":
+            raise ValueError(f"Only columnar checkpoints can be loaded lazily, got {checkpoint_format}.")
+
+        if checkpoint_format == "columnar":
+            return cls.deserialize_columnar(path, node_index=node_index, lazy=lazy)
+        elif checkpoint_format in ("jsonl", "jsonl.gz"):
+            return cls.deserialize_json_lines(path, node_index=node_index)
+
+        return cls.deserialize_bunch(path, node_index=node_index)
+
+    @classmethod
+    def serialize_columnar(cls, edges: Iterable['Edge'], output_dir: str, nodes: List[Node]) -> None:
+        """
+        Writes the edges as a columnar checkpoint, see utils/checkpoint.py. Endpoints are stored as int32 rows of nodes,
+        which must be the nodes of the node checkpoint the edges go with, in the same order. Their number and the
+        digest of their keys are kept in the header so that the edges are only loaded against the same nodes. kind and
+        sources are dictionary-encoded.
+        """
+        rows = {n.key: i for i, n in enumerate(nodes)}
+        kinds = DictionaryEncoder()
+        sources = DictionaryEncoder()
+        source_rows, destination_rows, kind_codes, source_codes = [], [], [], []
+
+        try:
+            for e in edges:
+                source_rows.append(rows[e.source.key])
+                destination_rows.append(rows[e.destination.key])
+                kind_codes.append(kinds.encode(e.kind))
+                source_codes.append(sources.encode(e.sources))
+        except KeyError as error:
+            raise NodeIntegrityError(f"Edge refers to node {error.args[0]} that is not in the nodes.")
+
+        header = {
+            "count": len(source_rows),
+            "nodes": len(nodes),
+            "keys_digest": digest_keys([n.key for n in nodes]),
+            "kinds": kinds.vocabulary,
+            "sources": sources.vocabulary
+        }
+        arrays = {
+            "source": np.array(source_rows, dtype=np.int32),
+            "destination": np.array(destination_rows, dtype=np.int32),
+            "kind": np.array(kind_codes, dtype=code_dtype(len(kinds.vocabulary))),
+            "sources": np.array(source_codes, dtype=code_dtype(len(sources.vocabulary)))
+        }
+
+        write_columnar(output_dir, header, arrays)
+
+    @classmethod
+    def deserialize_columnar(cls,
+                             input_dir: str,
+                             nodes: Union[List[Node], NodeView] = None,
+                             node_index: Union[Dict[NodeKey, Node], NodeView] = None,
+                             lazy: bool = False) -> Union[List['Edge'], 'EdgeView']:
+        """
+        Same as deserialize_bunch, except that endpoints are rows of nodes, which must be the nodes the checkpoint was
+        written with, see serialize_columnar. A node index from Node.index_bunch, which keeps the order of the nodes,
+        may be given instead. With lazy=True an EdgeView is returned, which only creates the edges that are accessed.
+        """
+        if nodes is None:
+            nodes = node_index
+        if nodes is None:
+            raise ValueError("Either nodes or node_index is required to deserialize edges.")
+
+        if lazy:
+            return EdgeView.open(input_dir, nodes)
+
+        header, arrays = read_columnar(input_dir)
+        endpoint = endpoints(header, nodes, input_dir)
+        kinds = header["kinds"]
+        sources = header["sources"]
+
+        edges = [cls(endpoint(s), endpoint(d), kinds[k], sources[c])
+                 for s, d, k, c in zip(arrays["source"].tolist(),
+                                       arrays["destination"].tolist(),
+                                       arrays["kind"].tolist(),
+                                       arrays["sources"].tolist())]
+
+        assert len(edges) == header["count"]
+
+        return edges
+
+
+def endpoints(header: Dict[str, object],
+              nodes: Union[List[Node], Dict[NodeKey, Node], NodeView],
+              input_dir: str) -> Callable[[int], Node]:
+    """
+    Node of every row of the node table of the edge checkpoint at input_dir, whose header is given. nodes may be a
+    NodeView, whose nodes are then only created for the edges accessed, a list of nodes or a node index. They must be
+    the nodes the checkpoint was written with, or a NodeIntegrityError is raised.
+    """
+    if isinstance(nodes, NodeView):
+        num_nodes, keys_digest = nodes.num_rows, nodes.keys_digest
+        endpoint = nodes.node
+    else:
+        nodes = list(nodes.values()) if isinstance(nodes, dict) else nodes
+        num_nodes, keys_digest = len(nodes), None
+        endpoint = nodes.__getitem__
+
+    if num_nodes == header["nodes"] and keys_digest is None:
+        keys_digest = digest_keys([n.key for n in nodes])
+
+    if num_nodes != header["nodes"] or keys_digest != header["keys_digest"]:
+        log.error(f"Edges in {input_dir} refer to {header['nodes']} nodes, got {num_nodes} other nodes.")
+        raise NodeIntegrityError(f"Edges in {input_dir} were written against other nodes than the ones given.")
+
+    return endpoint
+
+
+class EdgeView(Sequence):
+    """
+    Read-only sequence of the edges of a columnar checkpoint (see Edge.serialize_columnar), or of a selection of its
+    rows, creating an Edge only when it is indexed or iterated over. Created edges are cached weakly, as by NodeView.
+
+    endpoint gives the Node of a row of the node table, see endpoints. filter selects edges by kind and by source on the
+    columns alone.
+    """
+
+    def __init__(self,
+                 header: Dict[str, object],
+                 arrays: Dict[str, np.ndarray],
+                 endpoint: Callable[[int], Node],
+                 rows: np.ndarray = None,
+                 cache: WeakValueDictionary = None):
+        self._header = header
+        self._arrays = arrays
+        self._endpoint = endpoint
+        self._rows = np.arange(header["count"], dtype=np.int64) if rows is None else rows
+        self._cache = WeakValueDictionary() if cache is None else cache
+
+    @classmethod
+    def open(cls, input_dir: str, nodes: Union[NodeView, List[Node], Dict[NodeKey, Node]]) -> 'EdgeView':
+        """
+        nodes must be the nodes the checkpoint was written with, see endpoints.
+        """
+        header, arrays = read_columnar(input_dir)
+
+        return cls(header, arrays, endpoints(header, nodes, input_dir))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[Edge, 'EdgeView']:
+        if isinstance(item, slice):
+            return self._select(self._rows[item])
+
+        return self.edge(int(self._rows[item]))
+
+    def __iter__(self) -> Iterator[Edge]:
+        for row in self._rows.tolist():
+            yield self.edge(row)
+
+    @property
+    def rows(self) -> np.ndarray:
+        """
+        Rows of the checkpoint in this view, in order.
+        """
+        return self._rows
+
+    def edge(self, row: int) -> Edge:
+        """
+        Edge of a row of the checkpoint, created unless it is still referenced from an earlier access.
+        """
+        edge = self._cache.get(row, None)
+
+        if edge is None:
+            edge = Edge(self._endpoint(int(self._arrays["source"][row])),
+                        self._endpoint(int(self._arrays["destination"][row])),
+                        self._header["kinds"][self._arrays["kind"][row]],
+                        self._header["sources"][self._arrays["sources"][row]])
+            self._cache[row] = edge
+
+        return edge
+
+    def filter(self, kinds: Iterable[str] = None, sources: Iterable[str] = None) -> 'EdgeView':
+        """
+        Edges of one of kinds, and listing one of sources, without creating any edge. None keeps every edge.
+        """
+        mask = np.ones(len(self._rows), dtype=bool)
+
+        if kinds is not None:
+            mask &= np.isin(self._arrays["kind"][self._rows], vocabulary_codes(self._header["kinds"], kinds))
+
+        if sources is not None:
+            mask &= np.isin(self._arrays["sources"][self._rows],
+                            vocabulary_codes(self._header["sources"], sources, True))
+
+        return self._select(self._rows[mask])
+
+    def kind_counts(self) -> Dict[str, int]:
+        counts = np.bincount(self._arrays["kind"][self._rows], minlength=len(self._header["kinds"]))
+
+        return {kind: int(count) for kind, count in zip(self._header["kinds"], counts) if count > 0}
+
+    def materialize(self) -> List[Edge]:
+        return list(self)
+
+    def _select(self, rows: np.ndarray) -> 'EdgeView':
+        return EdgeView(self._header, self._arrays, self._endpoint, rows, self._cache)
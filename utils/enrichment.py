@@ -0,0 +1,136 @@
+from typing import List, Dict, Tuple, Iterable, NamedTuple, Set, Union
+
+import pandas as pd
+from pronto import Ontology
+
+from utils.logger import log
+from utils.node import Node
+from utils.ontology import CompactOntology
+
+# Node fields that can be filled in from cross-references, and the name of the Node method adding to each, called on
+# the node so that subclasses such as NodeView's nodes see the change
+ENRICHABLE_FIELDS = {
+    "mesh_ids": "add_mesh_id",
+    "umls_cuis": "add_cui"
+}
+
+
+class EnrichmentSummary(NamedTuple):
+    """
+    Outcome of apply_ids for one kind of node. enriched counts the nodes that were given new IDs and unchanged those
+    that already had every ID found. missing_nodes are identifiers without a node of that kind, unmatched are
+    identifiers for which no cross-reference was found.
+    """
+    kind: str
+    total: int
+    enriched: int
+    missing_nodes: List[str]
+    unmatched: List[str]
+    unchanged: int = 0
+
+    def log(self, description: str = "cross-references") -> None:
+        log.info(f"Added {description} to {self.enriched}/{self.total} {self.kind} nodes.")
+
+        if self.unchanged > 0:
+            log.info(f"{self.unchanged}/{self.total} {self.kind} nodes already had their {description}.")
+
+        if len(self.unmatched) > 0:
+            log.info(f"{len(self.unmatched)}/{self.total} {self.kind} nodes do not have {description}, e.g. "
+                     f"{self.unmatched[:5]}.")
+        if len(self.missing_nodes) > 0:
+            log.warning(f"{len(self.missing_nodes)} {self.kind} identifiers have no matching node, e.g. "
+                        f"{self.missing_nodes[:5]}.")
+
+
+def index_nodes(nodes: Iterable[Node]) -> Dict[Tuple[str, str], Node]:
+    """
+    Lookup table from (kind, identifier) to node.
+    """
+    return {(n.kind, n.identifier): n for n in nodes}
+
+
+def ontology_xrefs(ontology: Union[Ontology, CompactOntology]) -> Tuple[Set[str], pd.DataFrame]:
+    """
+    Single pass over the terms of the ontology. Returns the IDs of all of its terms, and a table of their
+    cross-references with columns term, prefix and value, e.g. ("DOID:14227", "UMLS_CUI", "C0004509") for the xref
+    "UMLS_CUI:C0004509". Xrefs are read through term.xrefs, strings for a CompactOntology and the IDs of pronto Xref
+    objects for a pronto.Ontology.
+    """
+    terms = set()
+    rows = []
+
+    # iterating a pronto.Ontology yields term IDs, its terms come from terms()
+    for term in ontology.terms() if isinstance(ontology, Ontology) else ontology:
+        terms.add(term.id)
+        # pronto holds the xrefs of a term in a frozenset, sorted so that the table is the same on every run
+        xrefs = term.xrefs if isinstance(term.xrefs, list) else sorted(xref.id for xref in term.xrefs)
+        for xref in xrefs:
+            rows.append((term.id, xref))
+
+    table = pd.DataFrame(rows, columns=["term", "xref"])
+    if len(table) == 0:
+        return terms, pd.DataFrame(columns=["term", "prefix", "value"])
+
+    parts = table["xref"].str.split(":", n=1, expand=True)
+    if parts.shape[1] < 2:
+        return terms, pd.DataFrame(columns=["term", "prefix", "value"])
+
+    table["prefix"] = parts[0]
+    table["value"] = parts[1]
+
+    return terms, table.loc[table["value"].notna(), ["term", "prefix", "value"]]
+
+
+def group_ids(table: pd.DataFrame, key: str, value: str) -> Dict[str, List[str]]:
+    """
+    Maps every distinct key to the distinct values it appears with, in order of appearance. Categorical keys only map
+    the categories that appear in table.
+    """
+    table = table[[key, value]].drop_duplicates()
+    # grouped as objects, pandas cannot hold lists in e.g. a categorical column
+    values = table[value].astype(object)
+
+    return values.groupby(table[key], sort=False, observed=True).agg(list).to_dict()
+
+
+def apply_ids(node_index: Dict[Tuple[str, str], Node],
+              kind: str,
+              identifiers: Iterable[str],
+              mappings: Dict[str, Dict[str, List[str]]]) -> EnrichmentSummary:
+    """
+    For every identifier of the given kind, adds the IDs mapped to it in mappings, keyed by Node field (see
+    ENRICHABLE_FIELDS), to its node, skipping the IDs the node already has.
+    """
+    total = 0
+    enriched = 0
+    unchanged = 0
+    missing_nodes = []
+    unmatched = []
+
+    for identifier in identifiers:
+        total += 1
+        found = {field: mapping.get(identifier, []) for field, mapping in mappings.items()}
+
+        if sum(map(len, found.values())) == 0:
+            unmatched.append(identifier)
+            continue
+
+        node = node_index.get((kind, identifier), None)
+        if node is None:
+            missing_nodes.append(identifier)
+            continue
+
+        added = False
+        for field, ids in found.items():
+            existing = set(getattr(node, field))
+            ids = [i for i in ids if i not in existing]
+            if len(ids) > 0:
+                getattr(node, ENRICHABLE_FIELDS[field])(ids)
+                added = True
+
+        if added:
+            enriched += 1
+        else:
+            unchanged += 1
+
+    return EnrichmentSummary(kind, total, enriched, missing_nodes, unmatched, unchanged)
@@ -0,0 +1,253 @@
+import os
+import time
+from typing import List, Dict, Tuple, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from utils.alignment import align
+from utils.checkpoint import COLUMNAR_HEADER, write_columnar_header, read_columnar
+from utils.edge import Edge
+from utils.graph import GRAPH_CHECKPOINT, GraphStore
+from utils.hetero_graph import HeteroGraph
+from utils.instrumentation import instrumented
+from utils.logger import log
+from utils.metapath import MetapathQuery, Metapath, DWPC_DAMPING
+from utils.node import Node
+from utils.processes import process_pool, worker_state
+
+FEATURES_CHECKPOINT = "outputs/repodb_features.columnar"
+FEATURE_BATCH_SIZE = 100000
+
+# het.io metapaths from compounds to diseases, named by their abbreviations
+METAPATHS = {
+    "CbGaD": ["Compound", "binds", "Gene", "associates_inv", "Disease"],
+    "CrCtD": ["Compound", "resembles", "Compound", "treats", "Disease"],
+    "CtDrD": ["Compound", "treats", "Disease", "resembles", "Disease"],
+    "CbGbCtD": ["Compound", "binds", "Gene", "binds_inv", "Compound", "treats", "Disease"],
+    "CcSEcCtD": ["Compound", "causes", "Side Effect", "causes_inv", "Compound", "treats", "Disease"]
+}
+
+# Edge kinds holding the label of a (compound, disease) pair, removed between the scored pairs, see extract_features
+LABEL_KINDS = ["treats", "treats_inv"]
+
+
+class FeatureExtractor(object):
+    """
+    Computes the features of (source, target) node pairs of a graph, a batch of pairs at a time:
+
+    - source_degree and target_degree, the number of edges of any kind touching each node
+    - shared_neighbors, jaccard and adamic_adar, over the neighbors of any kind, ignoring edge directions
+    - <metapath>_count and <metapath>_dwpc for every metapath, see utils/metapath.MetapathQuery
+    """
+
+    def __init__(self, graph: HeteroGraph, metapaths: Dict[str, Metapath] = None, damping: float = DWPC_DAMPING):
+        self.graph = graph
+        self.metapaths = METAPATHS if metapaths is None else metapaths
+        self.damping = damping
+        self.query = MetapathQuery(graph)
+
+        source_ids, destination_ids = [], []
+        for kind in graph.kinds:
+            src, dst, _ = graph.edge_arrays(kind)
+            source_ids.append(src)
+            destination_ids.append(dst)
+        source_ids = np.concatenate(source_ids) if len(source_ids) > 0 else np.zeros(0, dtype=np.int32)
+        destination_ids = np.concatenate(destination_ids) if len(destination_ids) > 0 else np.zeros(0, dtype=np.int32)
+
+        adjacency = sparse.csr_matrix((np.ones(len(source_ids), dtype=np.float64), (source_ids, destination_ids)),
+                                      shape=(graph.num_nodes, graph.num_nodes))
+        adjacency = adjacency + adjacency.T
+        adjacency.data[:] = 1
+        self._neighbors = adjacency.tocsr()
+        self._num_neighbors = np.asarray(self._neighbors.sum(axis=1)).ravel()
+        self._degree = graph.degree(direction="both")
+
+        # a neighbor shared by two nodes has at least two neighbors itself
+        self._adamic_adar_weights = np.zeros(graph.num_nodes, dtype=np.float64)
+        shareable = self._num_neighbors > 1
+        self._adamic_adar_weights[shareable] = 1 / np.log(self._num_neighbors[shareable])
+
+    @property
+    def feature_names(self) -> List[str]:
+        return feature_names(self.metapaths)
+
+    def prepare(self) -> 'FeatureExtractor':
+        """
+        Computes the path count and DWPC matrices of every metapath ahead of compute, so that worker processes forked
+        afterwards share them instead of each building its own.
+        """
+        for metapath in self.metapaths.values():
+            self.query.path_count_matrix(metapath)
+            self.query.dwpc_matrix(metapath, self.damping)
+
+        return self
+
+    def compute(self, source_ids: np.ndarray, target_ids: np.ndarray) -> Dict[str, np.ndarray]:
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        target_ids = np.asarray(target_ids, dtype=np.int64)
+
+        # row-wise products of the neighbor sets, one row per pair
+        shared = self._neighbors[source_ids].multiply(self._neighbors[target_ids]).tocsr()
+        shared_neighbors = np.asarray(shared.sum(axis=1)).ravel()
+        union = self._num_neighbors[source_ids] + self._num_neighbors[target_ids] - shared_neighbors
+
+        features = {
+            "source_degree": self._degree[source_ids].astype(np.float64),
+            "target_degree": self._degree[target_ids].astype(np.float64),
+            "shared_neighbors": shared_neighbors,
+            "jaccard": np.divide(shared_neighbors, union, out=np.zeros(len(union)), where=union > 0),
+            "adamic_adar": shared @ self._adamic_adar_weights
+        }
+
+        for name, metapath in self.metapaths.items():
+            features[f"{name}_count"] = self.query.path_counts(metapath, source_ids, target_ids).astype(np.float64)
+            features[f"{name}_dwpc"] = self.query.dwpc(metapath, source_ids, target_ids, self.damping)
+
+        return features
+
+
+@instrumented(records=lambda features: features[1].shape[0])
+def extract_features(source_ids: Sequence[int], target_ids: Sequence[int], **kwargs) -> Tuple[List[str], np.ndarray]:
+    """
+    Computes the features of FeatureExtractor for every (source_ids[i], target_ids[i]) pair of nodes of the graph store
+    at store_path, batch_size pairs at a time, in a pool of processes if processes > 1. The extractor and its metapath
+    matrices are built once, and shared by the workers, see utils/processes.process_pool.
+
+    The edges of exclude_kinds (LABEL_KINDS by default) between the scored pairs are removed from the graph first, so
+    that neither the degrees nor the metapaths through e.g. CtD see the label of the pair being scored.
+
+    The features are written as a columnar checkpoint in output_dir, one float64 column per feature next to the
+    source_id and target_id columns, each batch being written in place as it completes. Returns the feature names and
+    the (pairs x features) matrix, see load_features.
+    """
+    store_path = kwargs.get("store_path", GRAPH_CHECKPOINT)
+    output_dir = kwargs.get("output_dir", FEATURES_CHECKPOINT)
+    metapaths = kwargs.get("metapaths", METAPATHS)
+    damping = kwargs.get("damping", DWPC_DAMPING)
+    batch_size = kwargs.get("batch_size", FEATURE_BATCH_SIZE)
+    processes = kwargs.get("processes", 1)
+    exclude_kinds = kwargs.get("exclude_kinds", LABEL_KINDS)
+
+    source_ids = np.asarray(source_ids, dtype=np.int32)
+    target_ids = np.asarray(target_ids, dtype=np.int32)
+    if len(source_ids) != len(target_ids):
+        raise ValueError(f"Got {len(source_ids)} source IDs and {len(target_ids)} target IDs, expecting as many of "
+                         f"each.")
+
+    start = time.time()
+    store = GraphStore(store_path)
+    batches = [(i, min(i + batch_size, len(source_ids))) for i in range(0, len(source_ids), batch_size)]
+
+    names = feature_names(metapaths)
+
+    os.makedirs(output_dir, exist_ok=True)
+    header_path = os.path.join(output_dir, COLUMNAR_HEADER)
+    if os.path.exists(header_path):
+        os.remove(header_path)
+
+    columns = {name: np.lib.format.open_memmap(os.path.join(output_dir, f"{name}.npy"), mode="w+", dtype=np.float64,
+                                               shape=(len(source_ids),))
+               for name in names}
+    np.save(os.path.join(output_dir, "source_id.npy"), source_ids)
+    np.save(os.path.join(output_dir, "target_id.npy"), target_ids)
+
+    def write(batch: Tuple[int, int], features: Dict[str, np.ndarray]) -> None:
+        for name, values in features.items():
+            columns[name][batch[0]:batch[1]] = values
+
+    graph = store.to_hetero_graph()
+    num_edges = graph.num_edges
+    graph = graph.without_pairs(source_ids, target_ids, [k for k in exclude_kinds if k in graph.kinds])
+    log.info(f"Removed {num_edges - graph.num_edges} {'/'.join(exclude_kinds)} edges between the scored pairs.")
+
+    extractor = FeatureExtractor(graph, metapaths, damping)
+
+    if processes > 1 and len(batches) > 1:
+        with process_pool(min(processes, len(batches)), extractor.prepare()) as pool:
+            futures = [(b, pool.submit(_compute_batch, source_ids[b[0]:b[1]], target_ids[b[0]:b[1]]))
+                       for b in batches]
+            for batch, future in futures:
+                write(batch, future.result())
+    else:
+        for batch in batches:
+            write(batch, extractor.compute(source_ids[batch[0]:batch[1]], target_ids[batch[0]:batch[1]]))
+
+    for column in columns.values():
+        column.flush()
+
+    write_columnar_header(output_dir, {
+        "count": len(source_ids),
+        "features": names,
+        "metapaths": metapaths,
+        "damping": damping,
+        "excluded_kinds": list(exclude_kinds),
+        "graph_fingerprint": store.fingerprint
+    }, ["source_id", "target_id"] + names)
+
+    log.info(f"Extracted {len(names)} features of {len(source_ids)} pairs in {time.time() - start:.2f}s.")
+
+    return load_features(output_dir)
+
+
+def feature_names(metapaths: Dict[str, Metapath]) -> List[str]:
+    names = ["source_degree", "target_degree", "shared_neighbors", "jaccard", "adamic_adar"]
+
+    for name in metapaths.keys():
+        names += [f"{name}_count", f"{name}_dwpc"]
+
+    return names
+
+
+def load_features(input_dir: str = FEATURES_CHECKPOINT) -> Tuple[List[str], np.ndarray]:
+    """
+    Feature names and (pairs x features) matrix of a checkpoint written by extract_features. The pairs are in the
+    source_id and target_id columns of read_columnar(input_dir).
+    """
+    header, arrays = read_columnar(input_dir)
+
+    return header["features"], np.column_stack([arrays[name] for name in header["features"]])
+
+
+def map_nodes(nodes: List[Node], graph_nodes: List[Node]) -> np.ndarray:
+    """
+    Graph node ID (position in graph_nodes) of the node of the same kind every node shares an identifier, MeSH ID or
+    UMLS CUI with, preferring identifier matches, or -1 for nodes without one.
+    """
+    ids = np.full(len(nodes), -1, dtype=np.int64)
+    best = np.full(len(nodes), 3, dtype=np.int64)
+    priority = {"identifier": 0, "mesh_id": 1, "umls_cui": 2}
+
+    for match in align(nodes, graph_nodes):
+        if nodes[match.left].kind != graph_nodes[match.right].kind:
+            continue
+
+        rank = max(priority[match.left_field], priority[match.right_field])
+        if rank < best[match.left] or (rank == best[match.left] and match.right < ids[match.left]):
+            best[match.left] = rank
+            ids[match.left] = match.right
+
+    return ids
+
+
+def edge_pairs(edges: List[Edge], graph_nodes: List[Node]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (source IDs, target IDs) in the graph of the endpoints of edges, e.g. the repoDB "treats" edges, dropping the edges
+    with an endpoint that is not in the graph.
+    """
+    endpoints = list({n.key: n for e in edges for n in (e.source, e.destination)}.values())
+    ids = map_nodes(endpoints, graph_nodes)
+    id_of = {n.key: i for n, i in zip(endpoints, ids.tolist())}
+
+    source_ids = np.array([id_of[e.source.key] for e in edges], dtype=np.int64)
+    target_ids = np.array([id_of[e.destination.key] for e in edges], dtype=np.int64)
+    found = (source_ids >= 0) & (target_ids >= 0)
+
+    if not found.all():
+        log.info(f"{(~found).sum()}/{len(edges)} edges have an endpoint that is not in the graph, dropping them.")
+
+    return source_ids[found], target_ids[found]
+
+
+def _compute_batch(source_ids: np.ndarray, target_ids: np.ndarray) -> Dict[str, np.ndarray]:
+    return worker_state().compute(source_ids, target_ids)
@@ -1,26 +1,91 @@
+import hashlib
+import json
 import os
-import pickle
-from typing import List
+import shutil
+from typing import List, Dict, Tuple, Union
 
+import numpy as np
 from networkx import MultiDiGraph
 
+from utils.build_cache import digest_inputs
+from utils.checkpoint import write_columnar, read_columnar, checkpoint_exists
 from utils.edge import Edge
+from utils.hetero_graph import HeteroGraph, encode_edges
+from utils.instrumentation import instrumented
 from utils.logger import log
 from utils.node import Node
 
-GRAPH_CHECKPOINT = "outputs/graph.checkpoint"
+GRAPH_CHECKPOINT = "outputs/graph.store"
+GRAPH_SCHEMA_VERSION = 1
 
 
-def build_graph(nodes: List[Node], edges: List[Edge], **kwargs) -> MultiDiGraph:
+@instrumented(records=lambda g: g.num_edges if isinstance(g, HeteroGraph) else g.number_of_edges())
+def build_graph(nodes: List[Node], edges: List[Edge], **kwargs) -> Union[MultiDiGraph, HeteroGraph]:
+    """
+    Builds the graph from nodes and edges, and writes it to the graph store at GRAPH_CHECKPOINT unless the store already
+    holds the same nodes and edges, as recorded by the fingerprint in its header. With engine="csr" an array-backed
+    HeteroGraph is returned instead of a MultiDiGraph.
+
+    With a BuildCache in cache, and the digests of the checkpoints the nodes and edges were loaded from in digests, the
+    store is known to be up to date without encoding the graph: its arrays are loaded instead, and the fingerprint is
+    only computed when the inputs changed. Both the fingerprint and the inputs of the cached stage cover the metadata
+    of the nodes, e.g. their UMLS CUIs, so re-enriched nodes rewrite the store's node table.
+    """
     force_rebuild = kwargs.get("force_rebuild", False)
     save_checkpoint = kwargs.get("save_checkpoint", True)
+    engine = kwargs.get("engine", "networkx")
+    cache = kwargs.get("cache", None)
+    digests = kwargs.get("digests", {})
+
+    inputs_digest = None
+    if cache is not None:
+        inputs_digest = digest_inputs({"schema_version": GRAPH_SCHEMA_VERSION, "inputs": digests,
+                                       "nodes": nodes_digest(nodes)})
+
+        if not force_rebuild and cache.is_fresh("graph", inputs_digest):
+            log.info("Graph checkpoint is up to date, loading its arrays.")
+            store = GraphStore(GRAPH_CHECKPOINT)
+            if store.num_nodes != len(nodes) or store.num_edges != len(edges):
+                raise ValueError(f"Graph checkpoint at {GRAPH_CHECKPOINT} has {store.num_nodes} nodes and "
+                                 f"{store.num_edges} edges, got {len(nodes)} nodes and {len(edges)} edges.")
+
+            if engine == "csr":
+                return HeteroGraph(nodes, store.kinds, store.header["sources"], store.arrays)
+            return _to_networkx(nodes, edges)
+
+    if engine != "csr" and not save_checkpoint:
+        return _to_networkx(nodes, edges)
+
+    header, arrays = encode_graph(nodes, edges)
+    up_to_date = False
 
     if not force_rebuild:
-        if os.path.exists(GRAPH_CHECKPOINT):
-            return load_graph()
+        if checkpoint_exists(GRAPH_CHECKPOINT, "columnar"):
+            up_to_date = GraphStore(GRAPH_CHECKPOINT).fingerprint == header["fingerprint"]
+            if not up_to_date:
+                log.info("Graph checkpoint does not match its inputs, rebuilding graph.")
+        else:
+            log.info("Graph checkpoint does not exist, building graph.")
+
+    if engine == "csr":
+        graph = HeteroGraph(nodes, header["kinds"], header["sources"], arrays)
     else:
-        log.info("Graph checkpoint does not exist, building graph.")
+        graph = _to_networkx(nodes, edges)
+
+    if save_checkpoint and not up_to_date:
+        log.info("Checkpointing graph...")
+        if os.path.exists(GRAPH_CHECKPOINT):
+            shutil.rmtree(GRAPH_CHECKPOINT)
+        Node.serialize_columnar(nodes, os.path.join(GRAPH_CHECKPOINT, "nodes"))
+        write_columnar(GRAPH_CHECKPOINT, header, arrays)
 
+    if cache is not None and save_checkpoint:
+        cache.record("graph", inputs_digest, [GRAPH_CHECKPOINT])
+
+    return graph
+
+
+def _to_networkx(nodes: List[Node], edges: List[Edge]) -> MultiDiGraph:
     graph = MultiDiGraph()
     graph.add_nodes_from(nodes)
 
@@ -30,18 +95,113 @@ def build_graph(nodes: List[Node], edges: List[Edge], **kwargs) -> MultiDiGraph:
     assert graph.number_of_nodes() == len(nodes)
     assert graph.number_of_edges() == len(edges)
 
-    if save_checkpoint:
-        log.info("Checkpointing graph...")
-        with open(GRAPH_CHECKPOINT, "wb") as file:
-            pickle.dump(graph, file)
-
     return graph
 
 
-def load_graph() -> MultiDiGraph:
-    if os.path.exists(GRAPH_CHECKPOINT):
+def load_graph(**kwargs) -> Union[MultiDiGraph, HeteroGraph, 'GraphStore']:
+    """
+    Rebuilds the graph from the graph store. With engine="csr" a HeteroGraph over the memory-mapped arrays is returned
+    instead of a MultiDiGraph. With lazy=True the GraphStore itself is returned, and the graph is only built by
+    GraphStore.to_networkx or GraphStore.to_hetero_graph. If a fingerprint is given, a store built from other inputs
+    raises a ValueError.
+    """
+    lazy = kwargs.get("lazy", False)
+    engine = kwargs.get("engine", "networkx")
+    fingerprint = kwargs.get("fingerprint", None)
+
+    if checkpoint_exists(GRAPH_CHECKPOINT, "columnar"):
         log.info("Loading graph from checkpoint.")
-        with open(GRAPH_CHECKPOINT, "rb") as file:
-            return pickle.load(file)
+        store = GraphStore(GRAPH_CHECKPOINT)
+
+        if fingerprint is not None and store.fingerprint != fingerprint:
+            raise ValueError(f"Graph checkpoint at {GRAPH_CHECKPOINT} was built from different inputs.")
+
+        if lazy:
+            return store
+
+        return store.to_hetero_graph() if engine == "csr" else store.to_networkx()
     else:
         log.info("No graph checkpoint found, run build_graph.py to generate a graph!")
+
+
+def encode_graph(nodes: List[Node], edges: List[Edge]) -> Tuple[Dict[str, object], Dict[str, np.ndarray]]:
+    """
+    Encodes the graph as in utils/hetero_graph.encode_edges, with the header of the graph store.
+    """
+    kinds, sources, arrays = encode_edges(nodes, edges)
+    header = {
+        "schema_version": GRAPH_SCHEMA_VERSION,
+        "num_nodes": len(nodes),
+        "num_edges": len(edges),
+        "kinds": kinds,
+        "sources": sources
+    }
+    header["fingerprint"] = graph_fingerprint(nodes_digest(nodes), header, arrays)
+
+    return header, arrays
+
+
+def nodes_digest(nodes: List[Node]) -> str:
+    """
+    Digest of the nodes with all of their metadata, which the node table of the graph store is written from.
+    """
+    return hashlib.sha1(json.dumps([dict(n.metadata_view) for n in nodes]).encode("utf-8")).hexdigest()
+
+
+def graph_fingerprint(node_digest: str, header: Dict[str, object], arrays: Dict[str, np.ndarray]) -> str:
+    digest = hashlib.sha1()
+    digest.update(json.dumps([GRAPH_SCHEMA_VERSION, node_digest, header["kinds"], header["sources"]]).encode("utf-8"))
+
+    for name in sorted(arrays.keys()):
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+
+    return digest.hexdigest()
+
+
+class GraphStore(object):
+    """
+    Graph checkpoint written by build_graph. The adjacency arrays are memory-mapped, the nodes are only deserialized
+    when first needed.
+    """
+
+    def __init__(self, path: str = GRAPH_CHECKPOINT):
+        self.path = path
+        self.header, self.arrays = read_columnar(path)
+
+        if self.header.get("schema_version", None) != GRAPH_SCHEMA_VERSION:
+            raise ValueError(f"Graph checkpoint at {path} has schema version {self.header.get('schema_version')}, "
+                             f"expecting {GRAPH_SCHEMA_VERSION}. Rebuild it with build_graph.py.")
+
+        self._nodes = None
+
+    @property
+    def fingerprint(self) -> str:
+        return self.header["fingerprint"]
+
+    @property
+    def kinds(self) -> List[str]:
+        return self.header["kinds"]
+
+    @property
+    def num_nodes(self) -> int:
+        return self.header["num_nodes"]
+
+    @property
+    def num_edges(self) -> int:
+        return self.header["num_edges"]
+
+    @property
+    def nodes(self) -> List[Node]:
+        if self._nodes is None:
+            self._nodes = Node.deserialize_columnar(os.path.join(self.path, "nodes"))
+
+        return self._nodes
+
+    def to_hetero_graph(self) -> HeteroGraph:
+        """
+        HeteroGraph backed by the memory-mapped arrays of the store.
+        """
+        return HeteroGraph(self.nodes, self.kinds, self.header["sources"], self.arrays)
+
+    def to_networkx(self) -> MultiDiGraph:
+        return self.to_hetero_graph().to_networkx()
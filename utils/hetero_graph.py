@@ -0,0 +1,278 @@
+from typing import List, Dict, Tuple, Iterable, Sequence
+
+import numpy as np
+from networkx import MultiDiGraph
+
+from utils.checkpoint import DictionaryEncoder, code_dtype
+from utils.edge import Edge
+from utils.node import Node, NodeIntegrityError
+
+
+def encode_edges(nodes: List[Node], edges: List[Edge]) -> Tuple[List[str], List[Tuple[str, ...]],
+                                                                  Dict[str, np.ndarray]]:
+    """
+    Encodes edges over the positions of their endpoints in nodes, see encode_arrays. Returns the edge kind vocabulary,
+    the sources vocabulary and the arrays.
+    """
+    node_ids = {n.key: i for i, n in enumerate(nodes)}
+    if len(node_ids) != len(nodes):
+        raise NodeIntegrityError(f"{len(nodes) - len(node_ids)} nodes share their key with another node.")
+
+    kinds = DictionaryEncoder()
+    sources = DictionaryEncoder()
+
+    try:
+        source_ids = np.fromiter((node_ids[e.source.key] for e in edges), dtype=np.int32, count=len(edges))
+        destination_ids = np.fromiter((node_ids[e.destination.key] for e in edges), dtype=np.int32, count=len(edges))
+    except KeyError as e:
+        raise NodeIntegrityError(f"Edge refers to node {e.args[0]} that is not in the graph.")
+
+    kind_codes = np.fromiter((kinds.encode(e.kind) for e in edges), dtype=np.int32, count=len(edges))
+    source_codes = np.array([sources.encode(e.sources) for e in edges], dtype=code_dtype(len(sources.vocabulary)))
+
+    arrays = encode_arrays(len(nodes), len(kinds.vocabulary), source_ids, destination_ids, kind_codes, source_codes)
+
+    return kinds.vocabulary, sources.vocabulary, arrays
+
+
+def encode_arrays(num_nodes: int,
+                  num_kinds: int,
+                  source_ids: np.ndarray,
+                  destination_ids: np.ndarray,
+                  kind_codes: np.ndarray,
+                  source_codes: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Lays the edges out as one CSR adjacency per edge kind. Edges are sorted by kind, then by source node, so for kind k
+    the edges leaving node i are indices[kind_ptr[k] + indptr[k, i]:kind_ptr[k] + indptr[k, i + 1]].
+    """
+    order = np.lexsort((source_ids, kind_codes))
+    kind_ptr = np.searchsorted(kind_codes[order], np.arange(num_kinds + 1)).astype(np.int64)
+    indptr = np.zeros((num_kinds, num_nodes + 1), dtype=np.int64)
+
+    for k in range(num_kinds):
+        counts = np.bincount(source_ids[order[kind_ptr[k]:kind_ptr[k + 1]]], minlength=num_nodes)
+        indptr[k, 1:] = np.cumsum(counts)
+
+    return {
+        "kind_ptr": kind_ptr,
+        "indptr": indptr,
+        "indices": destination_ids[order].astype(np.int32),
+        "sources": source_codes[order]
+    }
+
+
+class HeteroGraph(object):
+    """
+    Array-backed heterogeneous graph. Nodes are referred to by their integer ID, their position in nodes. Each edge kind
+    is stored as a CSR adjacency (out-edges), the CSC adjacency (in-edges) is built on first use. The arrays may be
+    memory-mapped, e.g. from a GraphStore.
+    """
+
+    def __init__(self,
+                 nodes: List[Node],
+                 kinds: List[str],
+                 sources: List[Tuple[str, ...]],
+                 arrays: Dict[str, np.ndarray]):
+        self.nodes = nodes
+        self.kinds = list(kinds)
+        self.sources = sources
+        self.arrays = arrays
+
+        self._kind_codes = {kind: k for k, kind in enumerate(self.kinds)}
+        self._node_ids = None
+        self._csc = {}
+
+    @classmethod
+    def from_edges(cls, nodes: List[Node], edges: List[Edge]) -> 'HeteroGraph':
+        kinds, sources, arrays = encode_edges(nodes, edges)
+
+        return cls(nodes, kinds, sources, arrays)
+
+    @classmethod
+    def from_networkx(cls, graph: MultiDiGraph) -> 'HeteroGraph':
+        nodes = list(graph.nodes)
+        edges = [edge for _, _, edge in graph.edges(keys=True)]
+
+        return cls.from_edges(nodes, edges)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def num_edges(self) -> int:
+        return int(self.arrays["kind_ptr"][-1])
+
+    def node_id(self, node: Node) -> int:
+        if self._node_ids is None:
+            self._node_ids = {n.key: i for i, n in enumerate(self.nodes)}
+
+        return self._node_ids[node.key]
+
+    def node_ids(self, node_kind: str) -> np.ndarray:
+        """
+        IDs of the nodes of the given kind, e.g. "Compound".
+        """
+        return np.array([i for i, n in enumerate(self.nodes) if n.kind == node_kind], dtype=np.int32)
+
+    def adjacency(self, kind: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        CSR (indptr, indices) of the edges of one kind, indices holding destination node IDs.
+        """
+        k = self._kind_codes[kind]
+        start, end = self.arrays["kind_ptr"][k], self.arrays["kind_ptr"][k + 1]
+
+        return self.arrays["indptr"][k], self.arrays["indices"][start:end]
+
+    def reverse_adjacency(self, kind: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        CSC (indptr, indices) of the edges of one kind, indices holding source node IDs.
+        """
+        if kind not in self._csc:
+            indptr, indices = self.adjacency(kind)
+            source_ids = np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(indptr))
+            order = np.argsort(indices, kind="stable")
+
+            reverse_indptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            reverse_indptr[1:] = np.cumsum(np.bincount(indices, minlength=self.num_nodes))
+            self._csc[kind] = (reverse_indptr, source_ids[order])
+
+        return self._csc[kind]
+
+    def edge_arrays(self, kind: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (source IDs, destination IDs, sources codes) of the edges of one kind.
+        """
+        k = self._kind_codes[kind]
+        start, end = self.arrays["kind_ptr"][k], self.arrays["kind_ptr"][k + 1]
+        indptr, indices = self.adjacency(kind)
+        source_ids = np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(indptr))
+
+        return source_ids, np.asarray(indices), np.asarray(self.arrays["sources"][start:end])
+
+    def neighbors(self, node_id: int, kind: str = None, direction: str = "out") -> np.ndarray:
+        """
+        IDs of the nodes one edge of the given kind (any kind if None) away, following edges out of node_id, into
+        node_id, or both.
+        """
+        kinds = self.kinds if kind is None else [kind]
+        found = []
+
+        for k in kinds:
+            if direction in ("out", "both"):
+                indptr, indices = self.adjacency(k)
+                found.append(indices[indptr[node_id]:indptr[node_id + 1]])
+            if direction in ("in", "both"):
+                indptr, indices = self.reverse_adjacency(k)
+                found.append(indices[indptr[node_id]:indptr[node_id + 1]])
+
+        if len(found) == 0:
+            return np.zeros(0, dtype=np.int32)
+
+        return np.concatenate(found)
+
+    def degree(self, kind: str = None, direction: str = "out") -> np.ndarray:
+        """
+        Degree of every node, counting edges of the given kind (any kind if None).
+        """
+        kinds = self.kinds if kind is None else [kind]
+        degree = np.zeros(self.num_nodes, dtype=np.int64)
+
+        for k in kinds:
+            if direction in ("out", "both"):
+                degree += np.diff(self.adjacency(k)[0])
+            if direction in ("in", "both"):
+                degree += np.diff(self.reverse_adjacency(k)[0])
+
+        return degree
+
+    def subgraph(self, edge_kinds: Iterable[str] = None, node_kinds: Iterable[str] = None) -> 'HeteroGraph':
+        """
+        Keeps only the edges of edge_kinds and the nodes of node_kinds (everything if None). Node IDs are renumbered
+        when nodes are dropped.
+        """
+        edge_kinds = self.kinds if edge_kinds is None else list(edge_kinds)
+
+        if node_kinds is None:
+            nodes = self.nodes
+            new_ids = np.arange(self.num_nodes, dtype=np.int32)
+        else:
+            node_kinds = set(node_kinds)
+            keep = np.array([n.kind in node_kinds for n in self.nodes], dtype=bool)
+            new_ids = np.full(self.num_nodes, -1, dtype=np.int32)
+            new_ids[keep] = np.arange(keep.sum(), dtype=np.int32)
+            nodes = [n for n, k in zip(self.nodes, keep) if k]
+
+        source_ids, destination_ids, kind_codes, source_codes = [], [], [], []
+
+        for k, kind in enumerate(edge_kinds):
+            src, dst, codes = self.edge_arrays(kind)
+            src, dst = new_ids[src], new_ids[dst]
+            mask = (src >= 0) & (dst >= 0)
+
+            source_ids.append(src[mask])
+            destination_ids.append(dst[mask])
+            kind_codes.append(np.full(mask.sum(), k, dtype=np.int32))
+            source_codes.append(codes[mask])
+
+        if len(edge_kinds) == 0:
+            source_ids = destination_ids = kind_codes = source_codes = [np.zeros(0, dtype=np.int32)]
+
+        arrays = encode_arrays(len(nodes), len(edge_kinds), np.concatenate(source_ids), np.concatenate(destination_ids),
+                               np.concatenate(kind_codes), np.concatenate(source_codes))
+
+        return HeteroGraph(nodes, edge_kinds, self.sources, arrays)
+
+    def without_pairs(self,
+                      source_ids: Sequence[int],
+                      target_ids: Sequence[int],
+                      edge_kinds: Iterable[str]) -> 'HeteroGraph':
+        """
+        Drops the edges of edge_kinds between source_ids[i] and target_ids[i], in either direction, e.g. the "treats"
+        edges of pairs whose features must not see their label. Node IDs are unchanged.
+        """
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        target_ids = np.asarray(target_ids, dtype=np.int64)
+        # one int64 per ordered pair, both orders of every pair
+        pairs = np.concatenate([source_ids * self.num_nodes + target_ids, target_ids * self.num_nodes + source_ids])
+        edge_kinds = set(edge_kinds)
+
+        source_ids, destination_ids, kind_codes, source_codes = [], [], [], []
+
+        for k, kind in enumerate(self.kinds):
+            src, dst, codes = self.edge_arrays(kind)
+            if kind in edge_kinds:
+                mask = ~np.isin(src.astype(np.int64) * self.num_nodes + dst, pairs)
+                src, dst, codes = src[mask], dst[mask], codes[mask]
+
+            source_ids.append(src)
+            destination_ids.append(dst)
+            kind_codes.append(np.full(len(src), k, dtype=np.int32))
+            source_codes.append(codes)
+
+        if len(self.kinds) == 0:
+            return self
+
+        arrays = encode_arrays(self.num_nodes, len(self.kinds), np.concatenate(source_ids),
+                               np.concatenate(destination_ids), np.concatenate(kind_codes),
+                               np.concatenate(source_codes))
+
+        return HeteroGraph(self.nodes, self.kinds, self.sources, arrays)
+
+    def to_networkx(self) -> MultiDiGraph:
+        graph = MultiDiGraph()
+        graph.add_nodes_from(self.nodes)
+
+        for kind in self.kinds:
+            source_ids, destination_ids, source_codes = self.edge_arrays(kind)
+
+            ebunch = []
+            for s, d, c in zip(source_ids.tolist(), destination_ids.tolist(), source_codes.tolist()):
+                edge = Edge(self.nodes[s], self.nodes[d], kind, self.sources[c])
+                ebunch.append((edge.source, edge.destination, edge))
+            graph.add_edges_from(ebunch)
+
+        assert graph.number_of_nodes() == self.num_nodes
+        assert graph.number_of_edges() == self.num_edges
+
+        return graph
@@ -1,27 +1,79 @@
+import json
 import os
-from typing import List, Dict
-
+import shutil
+import tempfile
+import time
+from collections import deque
+from itertools import islice
+from typing import List, Dict, Union, Iterable, Tuple
+
+import numpy as np
 import pandas as pd
 from pronto import Ontology
 from tqdm import tqdm
 
-from utils.edge import Edge
+from utils.build_cache import BuildCache, digest_inputs, digest_keys, function_digest
+from utils.checkpoint import checkpoint_path, checkpoint_exists, write_columnar, read_columnar, DictionaryEncoder, \
+    code_dtype
+from utils.edge import Edge, EdgeView
+from utils.enrichment import group_ids, ontology_xrefs
+from utils.instrumentation import instrumented
 from utils.logger import log
-from utils.node import Node
+from utils.node import Node, intern_sources
+from utils.ontology import CompactOntology
+from utils.pipeline import Enricher, Mappings, enrich_nodes, group_records, runnable_enrichers, run_enrichers, \
+    apply_mappings
+from utils.processes import process_pool, worker_state
 
 NODES_CHECKPOINT = "outputs/hetio_nodes.checkpoint.json"
 EDGES_CHECKPOINT = "outputs/hetio_edges.checkpoint.json"
+ENRICHMENT_CHECKPOINT = "outputs/hetio_enrichment.{}.json"
+EDGE_SHARD_SIZE = 250000
+
+# UMLS sources the enrichers look codes up in, see compound_xrefs and pharmacologic_class_xrefs
+PHARMACOLOGIC_CLASS_SABS = ["NDFRT", "MED-RT"]
+UMLS_SABS = ["DRUGBANK"] + PHARMACOLOGIC_CLASS_SABS
 
 
+@instrumented("hetio.build_nodes")
 def build_nodes(hetio: Dict, **kwargs) -> List[Node]:
+    """
+    hetio["nodes"] may be any iterable of het.io node records, e.g. the HetioRecords returned by
+    load_hetio(..., stream=True). The metadata enrichers iterate over it again, so it cannot be a one-shot generator.
+
+    Nodes are enriched by every Enricher in enrichers (ENRICHERS by default, see OPTIONAL_ENRICHERS for the others)
+    whose sources, the umls and do keyword arguments, are given. A source may also be given as a function loading it.
+    With processes > 1 the enrichers run in a process pool.
+
+    With a BuildCache in cache, and the file digests of the sources in digests (keys "hetio", "umls" and "do"), the
+    checkpoint is only loaded if it was built from the same inputs, and only the enrichers whose inputs changed are run
+    again, the others reusing their cached mappings.
+    """
     force_rebuild = kwargs.get("force_rebuild", False)
     save_checkpoint = kwargs.get("save_checkpoint", True)
+    checkpoint_format = kwargs.get("checkpoint_format", "json")
+    nodes_checkpoint = checkpoint_path(NODES_CHECKPOINT, checkpoint_format)
+    cache = kwargs.get("cache", None)
+    digests = kwargs.get("digests", {})
+
+    sources = {"umls": kwargs.get("umls", None), "do": kwargs.get("do", None)}
+    enrichers = kwargs.get("enrichers", ENRICHERS)
+    processes = kwargs.get("processes", 1)
+
+    inputs_digest = None
+    if cache is not None:
+        inputs_digest = digest_inputs({
+            "hetio": digests["hetio"],
+            "format": checkpoint_format,
+            "enrichers": [_enricher_inputs(e, sources, digests) for e in enrichers]
+        })
 
     if not force_rebuild:
-        if os.path.exists(NODES_CHECKPOINT):
-            return Node.deserialize_bunch(NODES_CHECKPOINT)
+        if checkpoint_exists(nodes_checkpoint, checkpoint_format) and \
+                (cache is None or cache.is_fresh("hetio_nodes", inputs_digest)):
+            return Node.load_checkpoint(nodes_checkpoint, checkpoint_format)
         else:
-            log.info("Node checkpoint does not exist, building nodes.")
+            log.info("Node checkpoint does not exist or is stale, building nodes.")
 
     nodes = [Node(h["identifier"], h["name"], h["kind"],
                   h["data"].get("source", None) or h["data"].get("sources", []),
@@ -29,39 +81,86 @@ def build_nodes(hetio: Dict, **kwargs) -> List[Node]:
                   h["data"].get("url", None))
              for h in hetio["nodes"]]
 
-    assert len(nodes) == len(hetio["nodes"])
-
-    umls = kwargs.get("umls", None)
-    do = kwargs.get("do", None)
+    assert len(nodes) > 0
 
-    if umls is not None:
-        nodes = add_compound_metadata(hetio, nodes, umls)
-
-    if do is not None:
-        nodes = add_disease_metadata(hetio, nodes, do)
+    if cache is None:
+        nodes = enrich_nodes(hetio["nodes"], nodes, enrichers, sources, processes=processes)
+    else:
+        nodes = _enrich_nodes_cached(hetio, nodes, enrichers, sources, processes, cache, digests)
 
     if save_checkpoint:
         log.info("Checkpointing nodes...")
-        Node.serialize_bunch(nodes, NODES_CHECKPOINT)
+        Node.save_checkpoint(nodes, nodes_checkpoint, checkpoint_format)
+
+        if cache is not None:
+            cache.record("hetio_nodes", inputs_digest, [nodes_checkpoint])
 
     return nodes
 
 
+@instrumented("hetio.build_edges")
 def build_edges(hetio: Dict, nodes: List[Node], **kwargs) -> List[Edge]:
+    """
+    hetio["edges"] may be any iterable of het.io edge records, including a generator, and is only iterated once.
+
+    With processes > 1 the records are split into shards of shard_size records, built in a pool of processes, see
+    _build_edges_sharded. The edges are the same, in the same order, as with a single process, but are returned as an
+    EdgeView that creates them as they are accessed.
+    """
     force_rebuild = kwargs.get("force_rebuild", False)
     save_checkpoint = kwargs.get("save_checkpoint", True)
+    checkpoint_format = kwargs.get("checkpoint_format", "json")
+    edges_checkpoint = checkpoint_path(EDGES_CHECKPOINT, checkpoint_format)
+    cache = kwargs.get("cache", None)
+    digests = kwargs.get("digests", {})
+    processes = kwargs.get("processes", 1)
+    shard_size = kwargs.get("shard_size", EDGE_SHARD_SIZE)
+    columnar_checkpoint = None
+
+    inputs_digest = None
+    if cache is not None:
+        # edges only depend on which nodes exist, not on their metadata
+        inputs_digest = digest_inputs({
+            "hetio": digests["hetio"],
+            "nodes": digest_keys([n.key for n in nodes]),
+            "format": checkpoint_format
+        })
 
     if not force_rebuild:
-        if os.path.exists(EDGES_CHECKPOINT):
-            return Edge.deserialize_bunch(EDGES_CHECKPOINT, nodes)
+        if checkpoint_exists(edges_checkpoint, checkpoint_format) and \
+                (cache is None or cache.is_fresh("hetio_edges", inputs_digest)):
+            return Edge.load_checkpoint(edges_checkpoint, Node.index_bunch(nodes), checkpoint_format)
         else:
-            log.info("Edge checkpoint does not exist, building edges.")
+            log.info("Edge checkpoint does not exist or is stale, building edges.")
+
+    if processes > 1:
+        # a columnar checkpoint is written straight from the merged shard arrays
+        columnar_checkpoint = edges_checkpoint if save_checkpoint and checkpoint_format == "columnar" else None
+        edges, num_records = _build_edges_sharded(hetio["edges"], nodes, processes, shard_size, columnar_checkpoint)
+    else:
+        edges, num_records = _build_edges_serial(hetio["edges"], nodes)
+
+    if save_checkpoint:
+        log.info("Checkpointing edges...")
+        if columnar_checkpoint is None:
+            Edge.save_checkpoint(edges, edges_checkpoint, checkpoint_format, nodes)
+
+        if cache is not None:
+            cache.record("hetio_edges", inputs_digest, [edges_checkpoint])
+
+    assert len(edges) > num_records
+
+    return edges
+
 
+def _build_edges_serial(records: Iterable[Dict], nodes: List[Node]) -> Tuple[List[Edge], int]:
     edges = []
+    num_records = 0
 
     node_dict = {(n.kind, n.identifier): n for n in nodes}
 
-    for hetio_edge in tqdm(hetio["edges"]):
+    for hetio_edge in tqdm(records):
+        num_records += 1
         src_id = hetio_edge["source_id"]
         dst_id = hetio_edge["target_id"]
         src_node = node_dict[(src_id[0], src_id[1])]
@@ -79,16 +178,185 @@ def build_edges(hetio: Dict, nodes: List[Node], **kwargs) -> List[Edge]:
             edges.append(forward)
             edges.append(backward)
 
-    if save_checkpoint:
-        log.info("Checkpointing edges...")
-        Edge.serialize_bunch(edges, EDGES_CHECKPOINT)
+    return edges, num_records
 
-    assert len(edges) > len(hetio["edges"])
 
-    return edges
+def _build_edges_sharded(records: Iterable[Dict],
+                         nodes: List[Node],
+                         processes: int,
+                         shard_size: int,
+                         columnar_checkpoint: str = None) -> Tuple[EdgeView, int]:
+    """
+    Every worker resolves the endpoints of a shard of records to node IDs, positions in nodes, and writes the shard's
+    edges as a columnar checkpoint in a directory of its own to this run. At most two shards per process are in flight
+    at a time, so records may be a stream. The shards are merged in order once they are all written, as arrays, and
+    returned as an EdgeView over them, which only creates the Edge objects that are accessed.
+
+    If columnar_checkpoint is given, the merged arrays are also written there as an Edge columnar checkpoint.
+    """
+    start = time.time()
+    shards_dir = tempfile.mkdtemp(prefix="hetio_edges.shards.", dir=os.path.dirname(EDGES_CHECKPOINT) or ".")
+    # (kind, identifier) -> node ID, shared with the workers
+    node_ids = {(n.kind, n.identifier): i for i, n in enumerate(nodes)}
+    shard_dirs = []
+    num_records = 0
+
+    try:
+        with process_pool(processes, node_ids) as pool:
+            pending = deque()
+            iterator = iter(records)
+
+            while True:
+                shard = list(islice(iterator, shard_size))
+                if len(shard) == 0:
+                    break
+
+                num_records += len(shard)
+                output_dir = os.path.join(shards_dir, f"shard.{len(shard_dirs) + len(pending):05d}")
+                pending.append(pool.submit(_build_shard, shard, output_dir))
+
+                if len(pending) >= 2 * processes:
+                    shard_dirs.append(pending.popleft().result())
+
+            shard_dirs += [future.result() for future in pending]
+
+        log.info(f"Built {len(shard_dirs)} edge shards from {num_records} records in {time.time() - start:.2f}s.")
+
+        header, arrays = _merge_shards(shard_dirs, nodes)
+    finally:
+        shutil.rmtree(shards_dir, ignore_errors=True)
+
+    if columnar_checkpoint is not None:
+        write_columnar(columnar_checkpoint, header, arrays)
+
+    return EdgeView(header, arrays, nodes.__getitem__), num_records
+
+
+def _merge_shards(shard_dirs: List[str], nodes: List[Node]) -> Tuple[Dict[str, object], Dict[str, np.ndarray]]:
+    """
+    Concatenates the shards in order, re-encoding their kinds and sources against shared vocabularies. The header and
+    arrays are those of Edge.serialize_columnar, with nodes as the node table.
+    """
+    kinds = DictionaryEncoder()
+    sources = DictionaryEncoder()
+    columns = {"source": [], "destination": [], "kind": [], "sources": []}
+
+    for shard_dir in shard_dirs:
+        header, arrays = read_columnar(shard_dir, mmap=False)
+        kind_codes = np.array([kinds.encode(k) for k in header["kinds"]], dtype=np.int32)
+        source_codes = np.array([sources.encode(intern_sources(s)) for s in header["sources"]], dtype=np.int32)
+
+        columns["source"].append(arrays["source"])
+        columns["destination"].append(arrays["destination"])
+        columns["kind"].append(kind_codes[arrays["kind"]] if len(kind_codes) > 0 else arrays["kind"])
+        columns["sources"].append(source_codes[arrays["sources"]] if len(source_codes) > 0 else arrays["sources"])
+
+    arrays = {name: np.concatenate(parts) if len(parts) > 0 else np.zeros(0, dtype=np.int32)
+              for name, parts in columns.items()}
+    arrays["kind"] = arrays["kind"].astype(code_dtype(len(kinds.vocabulary)))
+    arrays["sources"] = arrays["sources"].astype(code_dtype(len(sources.vocabulary)))
+
+    header = {
+        "count": len(arrays["source"]),
+        "nodes": len(nodes),
+        "keys_digest": digest_keys([n.key for n in nodes]),
+        "kinds": kinds.vocabulary,
+        "sources": sources.vocabulary
+    }
+
+    return header, arrays
+
+
+def _build_shard(records: List[Dict], output_dir: str) -> str:
+    """
+    Same as _build_edges_serial for one shard of records, with node IDs for endpoints. Returns output_dir.
+    """
+    node_ids = worker_state()
+    kinds = DictionaryEncoder()
+    sources = DictionaryEncoder()
+    source_ids, destination_ids, kind_codes, source_codes = [], [], [], []
+
+    for hetio_edge in records:
+        src_id = hetio_edge["source_id"]
+        dst_id = hetio_edge["target_id"]
+        src = node_ids[(src_id[0], src_id[1])]
+        dst = node_ids[(dst_id[0], dst_id[1])]
+        kind = hetio_edge["kind"]
+        direction = hetio_edge["direction"]
+        code = sources.encode(intern_sources(hetio_edge["data"].get("source", None) or
+                                             hetio_edge["data"].get("sources", [])))
+
+        if direction == "forward":
+            source_ids.append(src)
+            destination_ids.append(dst)
+            kind_codes.append(kinds.encode(kind))
+            source_codes.append(code)
+        elif direction == "both":
+            source_ids += [src, dst]
+            destination_ids += [dst, src]
+            kind_codes += [kinds.encode(kind), kinds.encode(kind + "_inv")]
+            source_codes += [code, code]
+
+    write_columnar(output_dir, {"count": len(source_ids), "kinds": kinds.vocabulary, "sources": sources.vocabulary}, {
+        "source": np.array(source_ids, dtype=np.int32),
+        "destination": np.array(destination_ids, dtype=np.int32),
+        "kind": np.array(kind_codes, dtype=np.int32),
+        "sources": np.array(source_codes, dtype=np.int32)
+    })
+
+    return output_dir
+
+
+def _enricher_inputs(enricher: Enricher, sources: Dict[str, object], digests: Dict[str, str]) -> Dict[str, object]:
+    return {
+        "kind": enricher.kind,
+        "function": function_digest(enricher.function),
+        "sources": {s: digests.get(s, None) if sources.get(s, None) is not None else None for s in enricher.sources}
+    }
+
+
+def _enrich_nodes_cached(hetio: Dict,
+                         nodes: List[Node],
+                         enrichers: List[Enricher],
+                         sources: Dict[str, object],
+                         processes: int,
+                         cache: BuildCache,
+                         digests: Dict[str, str]) -> List[Node]:
+    """
+    Same as utils/pipeline.enrich_nodes, except that the mappings of every enricher are checkpointed and reused for as
+    long as its inputs do not change, so e.g. a new MRCONSO only re-runs the enrichers using UMLS.
+    """
+    records_by_kind = group_records(hetio["nodes"], enrichers)
+    runnable = runnable_enrichers(enrichers, records_by_kind, sources)
+    results = {}
+    stale = []
+
+    for enricher in runnable:
+        stage = f"hetio_enrichment:{enricher.kind}"
+        mappings_path = ENRICHMENT_CHECKPOINT.format(enricher.kind.lower().replace(" ", "_"))
+        inputs_digest = digest_inputs(dict(_enricher_inputs(enricher, sources, digests), hetio=digests["hetio"]))
+
+        if os.path.exists(mappings_path) and cache.is_fresh(stage, inputs_digest):
+            log.info(f"Reusing {enricher.kind} cross-references from {mappings_path}.")
+            with open(mappings_path, "r") as file:
+                cached = json.load(file)
+            results[enricher.kind] = {field: dict(map(tuple, pairs)) for field, pairs in cached.items()}
+        else:
+            stale.append((enricher, stage, mappings_path, inputs_digest))
+
+    computed = run_enrichers([s[0] for s in stale], records_by_kind, sources, processes)
+
+    for (enricher, stage, mappings_path, inputs_digest), mappings in zip(stale, computed):
+        # stored as [identifier, IDs] pairs since JSON would turn integer identifiers into strings
+        with open(mappings_path, "w") as file:
+            json.dump({field: list(mapping.items()) for field, mapping in mappings.items()}, file)
+        cache.record(stage, inputs_digest, [mappings_path])
+        results[enricher.kind] = mappings
+
+    return apply_mappings(nodes, runnable, records_by_kind, [results[e.kind] for e in runnable])
 
 
-def add_anatomy_metadata(hetio: Dict, nodes: List[Node]) -> List[Node]:
+def anatomy_xrefs(anatomies: List[Dict]) -> Mappings:
     """
     Anatomy (source: Uberon)
 
@@ -105,25 +373,10 @@ def add_anatomy_metadata(hetio: Dict, nodes: List[Node]) -> List[Node]:
         'url': 'http://purl.obolibrary.org/obo/UBERON_0001533',
         'mesh_id': 'D013348'}
     """
-    log.info("Loading anatomy metadata.")
+    return {"mesh_ids": {a["identifier"]: [a["data"]["mesh_id"]] for a in anatomies if a["data"].get("mesh_id")}}
 
-    anatomies = list(filter(lambda x: x["kind"] == "Anatomy", hetio["nodes"]))
-    assert len(anatomies) > 0
 
-    for a in tqdm(anatomies):
-        matching_nodes = list(filter(lambda x: x.identifier == a["identifier"], nodes))
-        assert len(matching_nodes) == 1
-
-        node = matching_nodes[0]
-        node.add_mesh_id(a["data"]["mesh_id"])
-        assert node.mesh_ids == [a["data"]["mesh_id"]]
-
-    log.info("Finished loading anatomy metadata.")
-
-    return nodes
-
-
-def add_compound_metadata(hetio: Dict, nodes: List[Node], umls: pd.DataFrame) -> List[Node]:
+def compound_xrefs(compounds: List[Dict], umls: pd.DataFrame) -> Mappings:
     """
     Compound (source: DrugBank)
 
@@ -138,37 +391,16 @@ def add_compound_metadata(hetio: Dict, nodes: List[Node], umls: pd.DataFrame) ->
         'inchi': 'InChI=1S/C8H10N4O2/c1-10-4-9-6-5(10)7(13)12(3)8(14)11(6)2/h4H,1-3H3',
         'url': 'http://www.drugbank.ca/drugs/DB00201'}}
     """
-    log.info("Loading compounds metadata.")
-
-    compounds = list(filter(lambda x: x["kind"] == "Compound", hetio["nodes"]))
-    assert len(compounds) > 0
+    start = time.time()
+    code_to_cuis = group_ids(umls.loc[umls["SAB"] == "DRUGBANK"], "CODE", "CUI")
+    log.info(f"Mapped {len(code_to_cuis)} DrugBank codes to UMLS CUIs in {time.time() - start:.2f}s.")
 
-    counter = 0
+    identifiers = set(c["identifier"] for c in compounds)
 
-    for compound in tqdm(compounds):
-        compound_id = compound["identifier"]
-        umls_records = umls[(umls["CODE"] == compound_id) & (umls["SAB"] == "DRUGBANK")]
-        umls_cuis = list(umls_records["CUI"].unique())
-        # assert len(umls_cuis) > 0  # some compounds do not have UMLS CUI
+    return {"umls_cuis": {code: cuis for code, cuis in code_to_cuis.items() if code in identifiers}}
 
-        if len(umls_cuis) > 0:
-            matching_nodes = list(filter(lambda x: x.identifier == compound_id, nodes))
-            assert len(matching_nodes) == 1
 
-            node = matching_nodes[0]
-            node.add_cui(umls_cuis)
-            assert len(node.umls_cuis) == len(umls_cuis)
-        else:
-            counter += 1
-
-    log.info(f"{counter}/{len(compounds)} compounds do not have matching records in UMLS.")
-
-    log.info("Finished loading compounds metadata.")
-
-    return nodes
-
-
-def add_disease_metadata(hetio: Dict, nodes: List[Node], do: Ontology) -> List[Node]:
+def disease_xrefs(diseases: List[Dict], do: Union[Ontology, CompactOntology]) -> Mappings:
     """
     Disease (source: Disease Ontology)
 
@@ -180,45 +412,91 @@ def add_disease_metadata(hetio: Dict, nodes: List[Node], do: Ontology) -> List[N
         'license': 'CC BY 3.0',
         'url': 'http://purl.obolibrary.org/obo/DOID_14227'}}
     """
-    log.info("Loading diseases metadata.")
+    start = time.time()
+    terms, xrefs = ontology_xrefs(do)
+    umls_cuis = group_ids(xrefs[xrefs["prefix"] == "UMLS_CUI"], "term", "value")
+    mesh_ids = group_ids(xrefs[xrefs["prefix"] == "MESH"], "term", "value")
+    log.info(f"Extracted {len(xrefs)} cross-references from {len(terms)} Disease Ontology terms in "
+             f"{time.time() - start:.2f}s.")
 
-    diseases = list(filter(lambda x: x["kind"] == "Disease", hetio["nodes"]))
-    assert len(diseases) > 0
+    not_in_ontology = [d["identifier"] for d in diseases if d["identifier"] not in terms]
+    if len(not_in_ontology) > 0:
+        log.info(f"{len(not_in_ontology)}/{len(diseases)} diseases are not in the Disease Ontology, e.g. "
+                 f"{not_in_ontology[:5]}.")
 
-    counter = 0
+    return {"umls_cuis": umls_cuis, "mesh_ids": mesh_ids}
 
-    for disease in tqdm(diseases):
-        disease_id = disease["identifier"]
 
-        try:
-            xref = do[disease_id].other["xref"]
-        except Exception as e:
-            log.info(f"Error looking up {disease_id}, skipping.")
-            continue
+def pharmacologic_class_xrefs(classes: List[Dict], umls: pd.DataFrame) -> Mappings:
+    """
+    Pharmacologic Class (source: FDA via DrugCentral)
 
-        umls_cuis = list(filter(lambda x: x[:8] == "UMLS_CUI", xref))
-        umls_cuis = list(map(lambda x: x[9:], umls_cuis))
+        The identifiers are NDF-RT codes, which UMLS lists under the NDFRT source, and under MED-RT since NDF-RT was
+        retired.
 
-        mesh_ids = list(filter(lambda x: x[:4] == "MESH", xref))
-        mesh_ids = list(map(lambda x: x[5:], mesh_ids))
+        Structure from het.io looks like this,
+        {'kind': 'Pharmacologic Class',
+        'identifier': 'N0000007632',
+        'name': 'Thyroxine',
+        'data': {'class_type': 'Chemical/Ingredient',
+        'source': 'FDA via DrugCentral',
+        'license': 'CC BY 4.0',
+        'url': 'http://purl.bioontology.org/ontology/NDFRT/N0000007632'}}
+    """
+    code_to_cuis = group_ids(umls.loc[umls["SAB"].isin(PHARMACOLOGIC_CLASS_SABS)], "CODE", "CUI")
+    identifiers = set(c["identifier"] for c in classes)
 
-        if len(umls_cuis) + len(mesh_ids) > 0:
-            matching_nodes = list(filter(lambda x: x.identifier == disease_id, nodes))
-            assert len(matching_nodes) == 1
+    return {"umls_cuis": {code: cuis for code, cuis in code_to_cuis.items() if code in identifiers}}
 
-            node = matching_nodes[0]
-            node.add_cui(umls_cuis)
-            node.add_mesh_id(mesh_ids)
-            assert len(node.umls_cuis) == len(umls_cuis)
-            assert len(node.mesh_ids) == len(mesh_ids)
-        else:
-            counter += 1
 
-    print(f"{counter}/{len(diseases)} diseases do not have UMLS CUI or MeSH ID.")
+def side_effect_xrefs(side_effects: List[Dict]) -> Mappings:
+    """
+    Side Effect (source: UMLS via SIDER 4.1)
 
-    log.info("Finished loading diseases  metadata.")
+        The identifiers are UMLS CUIs.
 
-    return nodes
+        Structure from het.io looks like this,
+        {'kind': 'Side Effect',
+        'identifier': 'C0023448',
+        'name': 'Lymphocytic leukaemia',
+        'data': {'source': 'UMLS via SIDER 4.1',
+        'license': 'CC BY-NC-SA 4.0',
+        'url': 'http://identifiers.org/umls/C0023448'}}
+    """
+    return {"umls_cuis": {s["identifier"]: [s["identifier"]] for s in side_effects}}
+
+
+def symptom_xrefs(symptoms: List[Dict]) -> Mappings:
+    """
+    Symptom (source: MeSH)
+
+        The identifiers are MeSH IDs.
+
+        Structure from het.io looks like this,
+        {'kind': 'Symptom',
+        'identifier': 'D020150',
+        'name': 'Chorea Gravidarum',
+        'data': {'source': 'MeSH',
+        'license': 'CC0 1.0',
+        'url': 'http://identifiers.org/mesh/D020150'}}
+    """
+    return {"mesh_ids": {s["identifier"]: [s["identifier"]] for s in symptoms}}
+
+
+# Enrichers run by build_nodes, results are applied in this order
+ENRICHERS = [
+    Enricher("Compound", compound_xrefs, ["umls"], "UMLS CUIs"),
+    Enricher("Disease", disease_xrefs, ["do"], "UMLS CUI or MeSH ID")
+]
+
+# Enrichers of the other kinds with MeSH IDs or UMLS CUIs, opted into with enrichers=ENRICHERS + OPTIONAL_ENRICHERS.
+# They change the nodes built, and so the overlap with repoDB.
+OPTIONAL_ENRICHERS = [
+    Enricher("Anatomy", anatomy_xrefs, [], "MeSH IDs"),
+    Enricher("Pharmacologic Class", pharmacologic_class_xrefs, ["umls"], "UMLS CUIs"),
+    Enricher("Side Effect", side_effect_xrefs, [], "UMLS CUIs"),
+    Enricher("Symptom", symptom_xrefs, [], "MeSH IDs")
+]
 
 # TODO: Metadata to be added
 
@@ -285,40 +563,3 @@ def add_disease_metadata(hetio: Dict, nodes: List[Node], do: Ontology) -> List[N
 #   'name': 'FCERI mediated Ca+2 mobilization',
 #   'data': {'license': 'CC BY 4.0', 'source': 'Reactome via Pathway Commons'}}
 # ==================================================================================================================
-
-# ==================================================================================================================
-# Pharmacologic Class (source: FDA via DrugCentral)
-#
-#   Structure from het.io looks like this,
-#   {'kind': 'Pharmacologic Class',
-#   'identifier': 'N0000007632',
-#   'name': 'Thyroxine',
-#   'data': {'class_type': 'Chemical/Ingredient',
-#    'source': 'FDA via DrugCentral',
-#    'license': 'CC BY 4.0',
-#    'url': 'http://purl.bioontology.org/ontology/NDFRT/N0000007632'}}
-# ==================================================================================================================
-
-# ==================================================================================================================
-# Side Effect (source: UMLS via SIDER 4.1)
-#
-#   Structure from het.io looks like this,
-#   {'kind': 'Side Effect',
-#   'identifier': 'C0023448',
-#   'name': 'Lymphocytic leukaemia',
-#   'data': {'source': 'UMLS via SIDER 4.1',
-#    'license': 'CC BY-NC-SA 4.0',
-#    'url': 'http://identifiers.org/umls/C0023448'}}
-# ==================================================================================================================
-
-# ==================================================================================================================
-# Symptom (source: MeSH)
-#
-#   Structure from het.io looks like this,
-#   {'kind': 'Symptom',
-#   'identifier': 'D020150',
-#   'name': 'Chorea Gravidarum',
-#   'data': {'source': 'MeSH',
-#    'license': 'CC0 1.0',
-#    'url': 'http://identifiers.org/mesh/D020150'}}
-# ==================================================================================================================
@@ -0,0 +1,255 @@
+import cProfile
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Callable, Iterator, NamedTuple, Optional
+
+from utils.logger import log
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+INSTRUMENTATION_DIR = "outputs/instrumentation"
+PROFILE_MODES = ["cprofile", "tracemalloc"]
+# e.g. PROFILE_STAGE=hetio.build_nodes or PROFILE_STAGE=repodb.build_nodes:tracemalloc, any stage name of a report
+PROFILE_ENV = "PROFILE_STAGE"
+
+
+class StageRecord(NamedTuple):
+    """
+    Measurements of one run of a stage. cpu_time is the CPU time of the process the stage ran in. A stage run in a
+    worker process is measured there and added to the stages of this process, see Instrumentation.add, but the CPU
+    time of workers is not included in the stages around it. peak_rss is the peak resident set size of the process at
+    the end of the stage and peak_rss_increase how much the stage raised it, in bytes. records is the number of records
+    the stage produced, if known.
+    """
+    name: str
+    parent: Optional[str]
+    started: float
+    wall_time: float
+    cpu_time: float
+    peak_rss: Optional[int]
+    peak_rss_increase: Optional[int]
+    records: Optional[int]
+    records_per_second: Optional[float]
+    profile: Optional[str]
+
+
+class Stage(object):
+    """
+    Handle of a running stage, the stage's body may set records.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.records = None
+
+
+class Instrumentation(object):
+    """
+    Records a StageRecord for every stage run through stage() or @instrumented, and writes them as a JSON report. A
+    stage can be profiled with cProfile or tracemalloc, see profile_stage.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = []
+        self._profiled = {}
+        # stages nest per thread, e.g. sources loaded by load_sources run in threads of their own
+        self._local = threading.local()
+
+        spec = os.environ.get(PROFILE_ENV, None)
+        if spec:
+            name, _, mode = spec.partition(":")
+            self.profile_stage(name, mode or "cprofile")
+
+    def profile_stage(self, name: str, mode: str = "cprofile", output_dir: str = INSTRUMENTATION_DIR) -> None:
+        """
+        Profiles every run of the stage called name, with cProfile (a .prof file for pstats or snakeviz) or tracemalloc
+        (a text file with the top allocations).
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode}, expecting one of {PROFILE_MODES}.")
+
+        self._profiled[name] = (mode, output_dir)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Stage]:
+        handle = Stage(name)
+        stack = self._stack()
+        parent = stack[-1] if len(stack) > 0 else None
+        profiler, profile_path = self._start_profile(name)
+        stack.append(name)
+
+        rss_before = _peak_rss()
+        started = time.time()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        try:
+            yield handle
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.process_time() - cpu_start
+            stack.pop()
+            self._stop_profile(profiler, profile_path)
+
+            rss_after = _peak_rss()
+            records_per_second = handle.records / wall_time if handle.records is not None and wall_time > 0 else None
+
+            record = StageRecord(name, parent, started, wall_time, cpu_time, rss_after,
+                                 rss_after - rss_before if rss_after is not None else None,
+                                 handle.records, records_per_second, profile_path)
+            self.stages.append(record)
+
+            log.debug(f"Stage {name} took {wall_time:.2f}s ({cpu_time:.2f}s CPU).")
+
+    def add(self, record: StageRecord) -> None:
+        """
+        Adds a stage measured elsewhere, e.g. returned by a worker process, as a child of the current stage.
+        """
+        stack = self._stack()
+        self.stages.append(record._replace(parent=stack[-1] if len(stack) > 0 else None))
+
+    def report(self) -> Dict[str, object]:
+        return {
+            "started": datetime.fromtimestamp(self.started).isoformat(),
+            "argv": sys.argv,
+            "python": sys.version.split()[0],
+            "commit": _git_commit(),
+            "stages": [record._asdict() for record in self.stages]
+        }
+
+    def write_report(self, output_path: str = None) -> str:
+        """
+        Writes the report of this run, by default to INSTRUMENTATION_DIR/run.<start time>.<pid>.json. Returns its path.
+        """
+        if output_path is None:
+            stamp = datetime.fromtimestamp(self.started).strftime("%Y%m%d-%H%M%S")
+            output_path = os.path.join(INSTRUMENTATION_DIR, f"run.{stamp}.{os.getpid()}.json")
+
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "w") as file:
+            json.dump(self.report(), file, indent=2)
+
+        log.info(f"Wrote instrumentation report of {len(self.stages)} stages to {output_path}.")
+
+        return output_path
+
+    def _stack(self) -> List[str]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+
+        return self._local.stack
+
+    def _start_profile(self, name: str):
+        if name not in self._profiled:
+            return None, None
+
+        mode, output_dir = self._profiled[name]
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler, os.path.join(output_dir, f"{name}.{stamp}.prof")
+
+        tracemalloc.start()
+        return tracemalloc, os.path.join(output_dir, f"{name}.{stamp}.tracemalloc.txt")
+
+    @staticmethod
+    def _stop_profile(profiler, profile_path: str) -> None:
+        if profiler is None:
+            return
+
+        if profiler is tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            with open(profile_path, "w") as file:
+                file.write(f"current {current} bytes, peak {peak} bytes\n")
+                for statistic in snapshot.statistics("lineno")[:50]:
+                    file.write(f"{statistic}\n")
+        else:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+
+        log.info(f"Wrote profile to {profile_path}.")
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+def stage(name: str):
+    """
+    Context manager recording a stage in INSTRUMENTATION, e.g.
+
+        with stage("load_sources") as s:
+            ...
+            s.records = len(records)
+    """
+    return INSTRUMENTATION.stage(name)
+
+
+def instrumented(name: str = None, records: Callable[[object], Optional[int]] = None):
+    """
+    Decorator recording every call of a function as a stage, named after the function by default. records computes the
+    number of records from the function's result, by default its len() when it has one.
+    """
+    def decorator(function: Callable) -> Callable:
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with INSTRUMENTATION.stage(stage_name) as handle:
+                result = function(*args, **kwargs)
+                handle.records = records(result) if records is not None else _default_records(result)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def write_report(output_path: str = None) -> str:
+    return INSTRUMENTATION.write_report(output_path)
+
+
+def _default_records(result: object) -> Optional[int]:
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def _peak_rss() -> Optional[int]:
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
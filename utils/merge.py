@@ -0,0 +1,211 @@
+from itertools import islice
+from typing import List, Dict, Tuple, Iterable, Iterator, NamedTuple
+
+from utils.alignment import node_attributes
+from utils.checkpoint import dump_json_records
+from utils.edge import Edge
+from utils.instrumentation import instrumented
+from utils.logger import log
+from utils.node import Node, NodeKey, NodeIntegrityError
+
+MERGE_PROVENANCE = "outputs/merge_provenance.json"
+MERGE_BATCH_SIZE = 100000
+
+# Preference among the attributes an incoming node shares with several merged nodes
+_FIELD_PRIORITY = {"identifier": 0, "mesh_id": 1, "umls_cui": 2}
+
+EdgeKey = Tuple[NodeKey, NodeKey, str]
+
+
+class GraphSource(NamedTuple):
+    """
+    One graph to merge, e.g. GraphSource("hetio", hetio_nodes, hetio_edges). nodes and edges may be any iterables,
+    they are read once, in batches.
+    """
+    name: str
+    nodes: Iterable[Node]
+    edges: Iterable[Edge]
+
+
+class MergedGraph(NamedTuple):
+    """
+    Result of merge_graphs. node_provenance maps the key of every merged node to the (source name, original key) of the
+    nodes it was merged from, and edge_provenance maps every merged edge, as (source key, destination key, kind), to the
+    names of the graphs it was found in.
+    """
+    nodes: List[Node]
+    edges: List[Edge]
+    node_provenance: Dict[NodeKey, List[Tuple[str, NodeKey]]]
+    edge_provenance: Dict[EdgeKey, List[str]]
+
+    def save_provenance(self, output_path: str = MERGE_PROVENANCE) -> None:
+        """
+        Writes node_provenance as one {"node": key, "merged_from": [[source name, key], ...]} record per merged node.
+        Edge provenance can be recovered from the sources of the merged edges.
+        """
+        dump_json_records(({"node": list(key), "merged_from": [[name, list(k)] for name, k in origins]}
+                           for key, origins in self.node_provenance.items()), output_path)
+
+
+@instrumented(records=lambda merged: len(merged.nodes) + len(merged.edges))
+def merge_graphs(sources: List[GraphSource], **kwargs) -> MergedGraph:
+    """
+    Unifies the nodes of several graphs and collapses their duplicate edges. The first graph's nodes are kept as they
+    are. A node of a later graph is merged into the node of the same kind it shares an identifier, MeSH ID or UMLS CUI
+    with (preferring identifiers, then MeSH IDs, then the earliest node), and added as a new node otherwise. Nodes of
+    one graph are only matched against the graphs before it, never against each other, and nodes of one graph sharing
+    their key are reported and raised as a NodeIntegrityError, as in Node.index_bunch.
+
+    Merged nodes keep the identifier, name and kind of the first node, and the union of the sources, MeSH IDs and UMLS
+    CUIs of all of them. Edges with the same merged endpoints and kind are collapsed, keeping the union of their
+    sources.
+
+    Lookups go through a hash index on (kind, attribute) and every graph is read in batches of batch_size, so the run
+    time is linear in the total size of the graphs.
+    """
+    batch_size = kwargs.get("batch_size", MERGE_BATCH_SIZE)
+
+    merged = []
+    origins = []
+    attribute_index = {}
+
+    edge_index = {}
+    edge_endpoints = []
+    edge_sources = []
+    edge_origins = []
+
+    for source in sources:
+        key_map = {}
+        new_attributes = []
+        num_nodes = 0
+        num_matched = 0
+        num_ambiguous = 0
+        duplicates = []
+
+        for batch in _batches(source.nodes, batch_size):
+            for node in batch:
+                num_nodes += 1
+                if node.key in key_map:
+                    duplicates.append(node.key)
+                    continue
+
+                candidates = _candidates(attribute_index, node)
+
+                if len(candidates) == 0:
+                    position = len(merged)
+                    record = node.metadata_view
+                    merged.append([node.identifier, node.name, node.kind, list(node.sources or []), record["license"],
+                                   record["source_url"], list(node.mesh_ids), list(node.umls_cuis)])
+                    origins.append([])
+                else:
+                    position = candidates[0][1]
+                    num_matched += 1
+                    num_ambiguous += len(set(c[1] for c in candidates)) > 1
+                    _union(merged[position], node)
+
+                key_map[node.key] = position
+                origins[position].append((source.name, node.key))
+                new_attributes.append((node, position))
+
+        if len(duplicates) > 0:
+            log.error(f"Found {len(duplicates)} duplicate node keys in {source.name}, e.g. {duplicates[:5]}.")
+            raise NodeIntegrityError(f"{len(duplicates)} {source.name} nodes share their (identifier, name, kind) with "
+                                     f"another node.")
+
+        # indexed after the whole graph was read, so that its nodes are not matched with each other
+        for node, position in new_attributes:
+            for field, value in node_attributes(node):
+                attribute_index.setdefault((node.kind, value), (_FIELD_PRIORITY[field], position))
+
+        log.info(f"Merged {num_matched}/{num_nodes} {source.name} nodes into existing nodes, {num_ambiguous} of them "
+                 f"matched more than one node.")
+
+        num_edges = 0
+        num_collapsed = 0
+        missing = set()
+
+        for batch in _batches(source.edges, batch_size):
+            for edge in batch:
+                num_edges += 1
+                src = key_map.get(edge.source.key, None)
+                dst = key_map.get(edge.destination.key, None)
+
+                if src is None or dst is None:
+                    missing.update(k for k, p in ((edge.source.key, src), (edge.destination.key, dst)) if p is None)
+                    continue
+
+                key = (src, dst, edge.kind)
+                position = edge_index.get(key, None)
+
+                if position is None:
+                    edge_index[key] = len(edge_endpoints)
+                    edge_endpoints.append(key)
+                    edge_sources.append(list(edge.sources or []))
+                    edge_origins.append([source.name])
+                else:
+                    num_collapsed += 1
+                    _extend_unique(edge_sources[position], edge.sources or [])
+                    _extend_unique(edge_origins[position], [source.name])
+
+        if len(missing) > 0:
+            log.error(f"{len(missing)} nodes referenced by {source.name} edges are missing, e.g. {list(missing)[:5]}.")
+            raise NodeIntegrityError(f"Edges of {source.name} refer to {len(missing)} nodes that are not in its nodes.")
+
+        log.info(f"Collapsed {num_collapsed}/{num_edges} {source.name} edges into existing edges.")
+
+    nodes = [_build_node(fields) for fields in merged]
+    edges = [Edge(nodes[src], nodes[dst], kind, sources)
+             for (src, dst, kind), sources in zip(edge_endpoints, edge_sources)]
+
+    node_provenance = {node.key: node_origins for node, node_origins in zip(nodes, origins)}
+    edge_provenance = {(e.source.key, e.destination.key, e.kind): edge_origin
+                       for e, edge_origin in zip(edges, edge_origins)}
+
+    log.info(f"Merged {len(sources)} graphs into {len(nodes)} nodes and {len(edges)} edges.")
+
+    return MergedGraph(nodes, edges, node_provenance, edge_provenance)
+
+
+def _batches(items: Iterable[object], batch_size: int) -> Iterator[List[object]]:
+    iterator = iter(items)
+
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def _candidates(attribute_index: Dict[Tuple[str, str], Tuple[int, int]], node: Node) -> List[Tuple[int, int]]:
+    """
+    (priority, position) of the merged nodes sharing an attribute with node, best first.
+    """
+    candidates = []
+
+    for field, value in node_attributes(node):
+        match = attribute_index.get((node.kind, value), None)
+        if match is not None:
+            candidates.append((max(match[0], _FIELD_PRIORITY[field]), match[1]))
+
+    return sorted(candidates)
+
+
+def _union(fields: List[object], node: Node) -> None:
+    _extend_unique(fields[3], node.sources or [])
+    _extend_unique(fields[6], node.mesh_ids)
+    _extend_unique(fields[7], node.umls_cuis)
+
+
+def _extend_unique(values: List[str], new_values: Iterable[str]) -> None:
+    for value in new_values:
+        if value not in values:
+            values.append(value)
+
+
+def _build_node(fields: List[object]) -> Node:
+    identifier, name, kind, sources, license, source_url, mesh_ids, umls_cuis = fields
+    node = Node(identifier, name, kind, sources, license, source_url)
+    node.add_mesh_id(mesh_ids)
+    node.add_cui(umls_cuis)
+
+    return node
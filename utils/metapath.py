@@ -0,0 +1,203 @@
+from collections import OrderedDict
+from typing import Tuple, Union, Sequence, Hashable
+
+import numpy as np
+from networkx import MultiDiGraph
+from scipy import sparse
+
+from utils.checkpoint import DictionaryEncoder
+from utils.hetero_graph import HeteroGraph
+
+# Alternating node and edge kinds, e.g. ["Compound", "binds", "Gene", "associates_inv", "Disease"]
+Metapath = Sequence[str]
+
+DWPC_DAMPING = 0.4
+METAPATH_CACHE_SIZE = 64
+
+
+class MetapathQuery(object):
+    """
+    Metapath queries over a HeteroGraph (or a MultiDiGraph, which is converted), as products of one sparse matrix per
+    relation. The relation (source kind, edge kind, target kind) is the adjacency matrix from the nodes of the source
+    kind to those of the target kind, rows and columns being in the order of HeteroGraph.node_ids of each kind. An
+    "_inv" edge kind missing from the graph is the transpose of the relation it inverts.
+
+    Relation matrices and the products of every metapath prefix are cached, up to cache_size of them, so metapaths
+    sharing a prefix, or queried again for other nodes, reuse them.
+
+    Counts are of walks, i.e. paths that may visit a node more than once. They equal path counts for metapaths whose
+    node kinds are all distinct.
+    """
+
+    def __init__(self, graph: Union[HeteroGraph, MultiDiGraph], cache_size: int = METAPATH_CACHE_SIZE):
+        if isinstance(graph, MultiDiGraph):
+            graph = HeteroGraph.from_networkx(graph)
+
+        self.graph = graph
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+        kinds = DictionaryEncoder()
+        self._node_kinds = np.fromiter((kinds.encode(n.kind) for n in graph.nodes), dtype=np.int32,
+                                       count=graph.num_nodes)
+        self._kind_codes = {kind: k for k, kind in enumerate(kinds.vocabulary)}
+        self._kind_ids = {kind: np.flatnonzero(self._node_kinds == k).astype(np.int32)
+                          for kind, k in self._kind_codes.items()}
+
+        # position of every node among the nodes of its kind
+        self._local_ids = np.zeros(graph.num_nodes, dtype=np.int64)
+        for ids in self._kind_ids.values():
+            self._local_ids[ids] = np.arange(len(ids))
+
+    def node_ids(self, node_kind: str) -> np.ndarray:
+        """
+        Graph IDs of the nodes of one kind, in the order of the rows or columns of the matrices for that kind.
+        """
+        return self._kind_ids.get(node_kind, np.zeros(0, dtype=np.int32))
+
+    def relation(self, source_kind: str, edge_kind: str, target_kind: str) -> sparse.csr_matrix:
+        """
+        0/1 adjacency matrix of the edges of edge_kind from nodes of source_kind to nodes of target_kind.
+        """
+        return self._cached(("relation", source_kind, edge_kind, target_kind),
+                            lambda: self._build_relation(source_kind, edge_kind, target_kind))
+
+    def path_count_matrix(self, metapath: Metapath) -> sparse.csr_matrix:
+        """
+        Number of walks following metapath between every node of its first kind and every node of its last kind.
+        """
+        return self._product(_steps(metapath), None)
+
+    def dwpc_matrix(self, metapath: Metapath, damping: float = DWPC_DAMPING) -> sparse.csr_matrix:
+        """
+        Degree-weighted path count (Himmelstein & Baranzini, 2015) between every node of the first kind and every node
+        of the last kind of metapath. Every walk is weighted by the product, over its edges, of the degrees of both
+        endpoints raised to -damping, the degrees counting the edges of that relation only.
+        """
+        return self._product(_steps(metapath), damping)
+
+    def path_counts(self, metapath: Metapath, source_ids: Sequence[int], target_ids: Sequence[int]) -> np.ndarray:
+        """
+        Walk counts for many (source, target) pairs at once, given as two arrays of graph node IDs.
+        """
+        return self._pairs(self.path_count_matrix(metapath), metapath, source_ids, target_ids)
+
+    def dwpc(self,
+             metapath: Metapath,
+             source_ids: Sequence[int],
+             target_ids: Sequence[int],
+             damping: float = DWPC_DAMPING) -> np.ndarray:
+        """
+        DWPC for many (source, target) pairs at once, given as two arrays of graph node IDs.
+        """
+        return self._pairs(self.dwpc_matrix(metapath, damping), metapath, source_ids, target_ids)
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+
+    def _pairs(self,
+               matrix: sparse.csr_matrix,
+               metapath: Metapath,
+               source_ids: Sequence[int],
+               target_ids: Sequence[int]) -> np.ndarray:
+        rows = self._local(source_ids, metapath[0])
+        columns = self._local(target_ids, metapath[-1])
+
+        if len(rows) != len(columns):
+            raise ValueError(f"Got {len(rows)} source IDs and {len(columns)} target IDs, expecting as many of each.")
+
+        return np.asarray(matrix[rows, columns]).ravel()
+
+    def _local(self, node_ids: Sequence[int], node_kind: str) -> np.ndarray:
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+
+        if (self._node_kinds[node_ids] != self._kind_codes.get(node_kind, -1)).any():
+            raise ValueError(f"Node IDs must all be of {node_kind} nodes.")
+
+        return self._local_ids[node_ids]
+
+    def _product(self, steps: Tuple[Tuple[str, str, str], ...], damping: float) -> sparse.csr_matrix:
+        """
+        Product of the (weighted) relation matrices of steps, extending the longest cached prefix.
+        """
+        key = ("product", steps, damping)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        if len(steps) == 1:
+            product = self._weighted(steps[0], damping)
+        else:
+            product = (self._product(steps[:-1], damping) @ self._weighted(steps[-1], damping)).tocsr()
+
+        return self._store(key, product)
+
+    def _weighted(self, step: Tuple[str, str, str], damping: float) -> sparse.csr_matrix:
+        if damping is None:
+            return self.relation(*step)
+
+        def build() -> sparse.csr_matrix:
+            adjacency = self.relation(*step).astype(np.float64)
+            out_degree = np.asarray(adjacency.sum(axis=1)).ravel()
+            in_degree = np.asarray(adjacency.sum(axis=0)).ravel()
+
+            return (sparse.diags(_inverse_power(out_degree, damping)) @ adjacency @
+                    sparse.diags(_inverse_power(in_degree, damping))).tocsr()
+
+        return self._cached(("weighted", step, damping), build)
+
+    def _build_relation(self, source_kind: str, edge_kind: str, target_kind: str) -> sparse.csr_matrix:
+        shape = (len(self.node_ids(source_kind)), len(self.node_ids(target_kind)))
+
+        if edge_kind not in self.graph.kinds:
+            if edge_kind.endswith("_inv") and edge_kind[:-len("_inv")] in self.graph.kinds:
+                return self.relation(target_kind, edge_kind[:-len("_inv")], source_kind).T.tocsr()
+            raise ValueError(f"Unknown edge kind {edge_kind}, expecting one of {self.graph.kinds}.")
+
+        source_ids, destination_ids, _ = self.graph.edge_arrays(edge_kind)
+
+        # keep the edges between nodes of the requested kinds, e.g. "resembles" links both compounds and diseases
+        mask = (self._node_kinds[source_ids] == self._kind_codes.get(source_kind, -1)) & \
+            (self._node_kinds[destination_ids] == self._kind_codes.get(target_kind, -1))
+
+        adjacency = sparse.csr_matrix((np.ones(mask.sum(), dtype=np.int64),
+                                       (self._local_ids[source_ids[mask]], self._local_ids[destination_ids[mask]])),
+                                      shape=shape)
+        # parallel edges count once
+        adjacency.data[:] = 1
+
+        return adjacency
+
+    def _cached(self, key: Hashable, build) -> sparse.csr_matrix:
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        return self._store(key, build())
+
+    def _store(self, key: Hashable, matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+        self._cache[key] = matrix
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return matrix
+
+
+def _steps(metapath: Metapath) -> Tuple[Tuple[str, str, str], ...]:
+    """
+    Splits ["Compound", "binds", "Gene", "associates_inv", "Disease"] into its relations
+    (("Compound", "binds", "Gene"), ("Gene", "associates_inv", "Disease")).
+    """
+    if len(metapath) < 3 or len(metapath) % 2 == 0:
+        raise ValueError(f"Metapath {metapath} must alternate node and edge kinds, starting and ending with node "
+                         f"kinds.")
+
+    return tuple((metapath[i], metapath[i + 1], metapath[i + 2]) for i in range(0, len(metapath) - 1, 2))
+
+
+def _inverse_power(degree: np.ndarray, damping: float) -> np.ndarray:
+    weights = np.zeros(len(degree), dtype=np.float64)
+    nonzero = degree > 0
+    weights[nonzero] = degree[nonzero] ** -damping
+
+    return weights
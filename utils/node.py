@@ -1,10 +1,60 @@
 import json
 import os
-from copy import deepcopy
-from typing import List, Union, Set, Dict
+import sys
+from collections.abc import Sequence
+from types import MappingProxyType
+from typing import List, Union, Set, Dict, Tuple, Optional, Iterable, Iterator, Mapping
+from weakref import WeakValueDictionary
+
+import numpy as np
+
+from utils.build_cache import digest_keys
+from utils.checkpoint import dump_json_records, dump_json_lines, read_json_lines, write_columnar, read_columnar, \
+    DictionaryEncoder, code_dtype, vocabulary_codes, string_arrays, string_list_arrays, StringColumn, StringListColumn
+from utils.instrumentation import instrumented
+from utils.logger import log
+
+NodeKey = Tuple[str, str, str]
+
+# One shared tuple per distinct list of sources, millions of edges only carry a handful of them
+_SOURCES_TABLE = {}
+
+
+def intern_string(value: Optional[str]) -> Optional[str]:
+    if type(value) == str:
+        return sys.intern(value)
+
+    return value
+
+
+def intern_sources(sources: Union[None, str, List[str], Tuple[str, ...]]) -> Optional[Tuple[str, ...]]:
+    if sources is None:
+        return None
+
+    if type(sources) == str:
+        sources = (sources,)
+
+    key = tuple(sources)
+    interned = _SOURCES_TABLE.get(key, None)
+    if interned is None:
+        interned = _SOURCES_TABLE.setdefault(key, tuple(map(intern_string, key)))
+
+    return interned
+
+
+class NodeIntegrityError(Exception):
+    """
+    Raised when a bunch of nodes cannot be indexed unambiguously, or when an edge refers to a node that is not in the
+    bunch.
+    """
+    pass
 
 
 class Node(object):
+    # __weakref__ lets NodeView cache the nodes it creates weakly
+    __slots__ = ["_identifier", "_name", "_kind", "_sources", "_license", "_source_url", "_mesh_ids", "_umls_cuis",
+                 "__weakref__"]
+
     def __init__(self,
                  identifier: str = "",
                  name: str = "",
@@ -13,22 +63,22 @@ class Node(object):
                  license: str = "",
                  source_url: str = "",
                  metadata: Dict[str, object] = None):
-        if type(sources) == str:
-            sources = [sources]
-
         if metadata is not None:
-            self._metadata = metadata
-        else:
-            self._metadata = {
-                "identifier": identifier,
-                "name": name,
-                "kind": kind,
-                "sources": sources,
-                "license": license,
-                "source_url": source_url,
-                "mesh_ids": [],
-                "umls_cuis": []
-            }
+            identifier = metadata["identifier"]
+            name = metadata["name"]
+            kind = metadata["kind"]
+            sources = metadata.get("sources", None)
+            license = metadata.get("license", None)
+            source_url = metadata.get("source_url", None)
+
+        self._identifier = identifier
+        self._name = name
+        self._kind = intern_string(kind)
+        self._sources = intern_sources(sources)
+        self._license = intern_string(license)
+        self._source_url = source_url
+        self._mesh_ids = list(metadata.get("mesh_ids", [])) if metadata is not None else []
+        self._umls_cuis = list(metadata.get("umls_cuis", [])) if metadata is not None else []
 
     def __eq__(self, other: 'Node') -> bool:
         intersection = self.attributes.intersection(other.attributes)
@@ -39,15 +89,49 @@ class Node(object):
         return len(intersection) <= 0
 
     def __hash__(self) -> int:
-        key = (self._metadata["name"], self._metadata["identifier"], self._metadata["kind"])
+        key = (self._name, self._identifier, self._kind)
         return hash(key)
 
     def __str__(self) -> str:
-        return self._metadata["name"]
+        return self._name
 
     @property
     def metadata(self) -> Dict[str, object]:
-        return deepcopy(self._metadata)
+        """
+        Defensive copy of the node's metadata, safe to modify.
+        """
+        metadata = self._record()
+        metadata["sources"] = list(self._sources) if self._sources is not None else None
+        metadata["mesh_ids"] = list(self._mesh_ids)
+        metadata["umls_cuis"] = list(self._umls_cuis)
+
+        return metadata
+
+    @property
+    def metadata_view(self) -> Mapping[str, object]:
+        """
+        Read-only view of the node's metadata that shares the node's lists instead of copying them.
+        """
+        return MappingProxyType(self._record())
+
+    def _record(self) -> Dict[str, object]:
+        return {
+            "identifier": self._identifier,
+            "name": self._name,
+            "kind": self._kind,
+            "sources": self._sources,
+            "license": self._license,
+            "source_url": self._source_url,
+            "mesh_ids": self._mesh_ids,
+            "umls_cuis": self._umls_cuis
+        }
+
+    @property
+    def key(self) -> NodeKey:
+        """
+        (identifier, name, kind) triple, in the same order edges use to refer to their endpoints when serialized.
+        """
+        return self._identifier, self._name, self._kind
 
     @property
     def attributes(self) -> Set[str]:
@@ -55,50 +139,102 @@ class Node(object):
 
     @property
     def identifier(self) -> str:
-        return self._metadata["identifier"]
+        return self._identifier
 
     @property
     def name(self) -> str:
-        return self._metadata["name"]
+        return self._name
 
     @property
     def kind(self) -> str:
-        return self._metadata["kind"]
+        return self._kind
+
+    @property
+    def sources(self) -> Tuple[str, ...]:
+        return self._sources
 
     @property
     def mesh_ids(self) -> List[str]:
-        return self._metadata["mesh_ids"]
+        return self._mesh_ids
 
     @property
     def umls_cuis(self) -> List[str]:
-        return self._metadata["umls_cuis"]
+        return self._umls_cuis
 
     def add_mesh_id(self, mesh_id_or_ids: Union[str, List[str]]):
         if type(mesh_id_or_ids) == list:
-            self._metadata["mesh_ids"] += mesh_id_or_ids
+            self._mesh_ids += mesh_id_or_ids
         else:
-            self._metadata["mesh_ids"].append(mesh_id_or_ids)
+            self._mesh_ids.append(mesh_id_or_ids)
 
     def add_cui(self, cui_or_cuis: Union[str, List[str]]):
         if type(cui_or_cuis) == list:
-            self._metadata["umls_cuis"] += cui_or_cuis
+            self._umls_cuis += cui_or_cuis
         else:
-            self._metadata["umls_cuis"].append(cui_or_cuis)
+            self._umls_cuis.append(cui_or_cuis)
 
     @classmethod
-    def serialize_bunch(cls, nodes: List['Node'], output_path: str) -> None:
-        metadata_set = list(map(lambda x: x.metadata, nodes))
+    def index_bunch(cls, nodes: List['Node']) -> Dict[NodeKey, 'Node']:
+        """
+        Builds a lookup table from Node.key to node, so that edges can be resolved to their endpoints in constant time.
+        The same key appearing more than once is reported and raised as a NodeIntegrityError.
+        """
+        index = {}
+        duplicates = []
 
-        with open(output_path, "w") as file:
-            json.dump(metadata_set, file)
+        for node in nodes:
+            key = node.key
+            if key in index:
+                duplicates.append(key)
+            else:
+                index[key] = node
+
+        if len(duplicates) > 0:
+            log.error(f"Found {len(duplicates)} duplicate node keys, e.g. {duplicates[:5]}.")
+            raise NodeIntegrityError(f"{len(duplicates)} nodes share their (identifier, name, kind) with another node.")
+
+        return index
+
+    @classmethod
+    @instrumented("Node.serialize_bunch")
+    def serialize_bunch(cls, nodes: Iterable['Node'], output_path: str, stream: bool = True) -> int:
+        """
+        Writes the nodes' records straight from their internal state, one at a time unless stream is False. Returns
+        the number of records written.
+        """
+        return dump_json_records(map(lambda x: x._record(), nodes), output_path, stream=stream)
 
     @classmethod
+    @instrumented("Node.deserialize_bunch")
     def deserialize_bunch(cls, json_path: str) -> List['Node']:
         if not os.path.exists(json_path):
             raise FileNotFoundError(f"Node file at {json_path} does not exist!")
 
         with open(json_path, "r") as file:
             metadata_set = json.load(file)
+
+        return cls._from_records(metadata_set)
+
+    @classmethod
+    def serialize_json_lines(cls, nodes: Iterable['Node'], output_path: str, append: bool = False) -> int:
+        """
+        Writes the nodes as a JSON-lines checkpoint, compressed if output_path ends with .gz, see
+        utils/checkpoint.JsonLinesWriter. With append=True they are added to an existing checkpoint.
+        """
+        return dump_json_lines(map(lambda x: x._record(), nodes), output_path, append=append)
+
+    @classmethod
+    def deserialize_json_lines(cls, input_path: str, kinds: Iterable[str] = None) -> List['Node']:
+        """
+        Reads a JSON-lines checkpoint, only the nodes of the given kinds if kinds is not None, e.g. kinds=["Compound"].
+        """
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Node file at {input_path} does not exist!")
+
+        return cls._from_records(read_json_lines(input_path, kinds=kinds))
+
+    @classmethod
+    def _from_records(cls, metadata_set: Iterable[Dict[str, object]]) -> List['Node']:
         nodes = []
 
         for metadata in metadata_set:
@@ -111,3 +247,253 @@ class Node(object):
             nodes.append(node)
 
         return nodes
+
+    @classmethod
+    @instrumented("Node.save_checkpoint")
+    def save_checkpoint(cls, nodes: List['Node'], path: str, checkpoint_format: str = "json") -> None:
+        if checkpoint_format == "columnar":
+            cls.serialize_columnar(nodes, path)
+        elif checkpoint_format in ("jsonl", "jsonl.gz"):
+            cls.serialize_json_lines(nodes, path)
+        else:
+            cls.serialize_bunch(nodes, path)
+
+    @classmethod
+    @instrumented("Node.load_checkpoint")
+    def load_checkpoint(cls,
+                        path: str,
+                        checkpoint_format: str = "json",
+                        lazy: bool = False) -> Union[List['Node'], 'NodeView']:
+        """
+        With lazy=True a NodeView over the checkpoint is returned instead of a list, columnar checkpoints only.
+        """
+        if lazy and checkpoint_format != "columnar":
+            raise ValueError(f"Only columnar checkpoints can be loaded lazily, got {checkpoint_format}.")
+
+        if checkpoint_format == "columnar":
+            return cls.deserialize_columnar(path, lazy=lazy)
+        elif checkpoint_format in ("jsonl", "jsonl.gz"):
+            return cls.deserialize_json_lines(path)
+
+        return cls.deserialize_bunch(path)
+
+    @classmethod
+    def serialize_columnar(cls, nodes: List['Node'], output_dir: str) -> None:
+        """
+        Writes the nodes as a columnar checkpoint, see utils/checkpoint.py. A node's integer ID is its position in
+        nodes. kind, sources and license are dictionary-encoded, identifier, name and source_url are string columns and
+        mesh_ids and umls_cuis string list columns, see utils/checkpoint.string_arrays. The header holds the digest of
+        the node keys, which edge checkpoints refer to, see Edge.serialize_columnar.
+        """
+        kinds = DictionaryEncoder()
+        sources = DictionaryEncoder()
+        licenses = DictionaryEncoder()
+
+        kind_codes = [kinds.encode(n.kind) for n in nodes]
+        source_codes = [sources.encode(n.sources) for n in nodes]
+        license_codes = [licenses.encode(n._license) for n in nodes]
+
+        header = {
+            "count": len(nodes),
+            "keys_digest": digest_keys([n.key for n in nodes]),
+            "kinds": kinds.vocabulary,
+            "sources": sources.vocabulary,
+            "licenses": licenses.vocabulary
+        }
+        arrays = {
+            "kind": np.array(kind_codes, dtype=code_dtype(len(kinds.vocabulary))),
+            "sources": np.array(source_codes, dtype=code_dtype(len(sources.vocabulary))),
+            "license": np.array(license_codes, dtype=code_dtype(len(licenses.vocabulary)))
+        }
+        arrays.update(string_arrays("identifier", (n.identifier for n in nodes)))
+        arrays.update(string_arrays("name", (n.name for n in nodes)))
+        arrays.update(string_arrays("source_url", (n._source_url for n in nodes)))
+        arrays.update(string_list_arrays("mesh_ids", (n.mesh_ids for n in nodes)))
+        arrays.update(string_list_arrays("umls_cuis", (n.umls_cuis for n in nodes)))
+
+        write_columnar(output_dir, header, arrays)
+
+    @classmethod
+    def deserialize_columnar(cls, input_dir: str, lazy: bool = False) -> Union[List['Node'], 'NodeView']:
+        """
+        With lazy=True a NodeView is returned, which only creates the nodes that are accessed.
+        """
+        if lazy:
+            return NodeView.open(input_dir)
+
+        header, arrays = read_columnar(input_dir)
+        columns = {name: StringColumn(arrays, name).tolist() for name in ["identifier", "name", "source_url"]}
+        columns.update({name: StringListColumn(arrays, name).tolist() for name in ["mesh_ids", "umls_cuis"]})
+        kinds = header["kinds"]
+        sources = header["sources"]
+        licenses = header["licenses"]
+        nodes = []
+
+        for i, (kind, source, license) in enumerate(zip(arrays["kind"].tolist(),
+                                                         arrays["sources"].tolist(),
+                                                         arrays["license"].tolist())):
+            node = cls(columns["identifier"][i], columns["name"][i], kinds[kind], sources[source], licenses[license],
+                       columns["source_url"][i])
+            node.add_mesh_id(columns["mesh_ids"][i])
+            node.add_cui(columns["umls_cuis"][i])
+            nodes.append(node)
+
+        assert len(nodes) == header["count"]
+
+        return nodes
+
+
+class NodeView(Sequence):
+    """
+    Read-only sequence of the nodes of a columnar checkpoint (see Node.serialize_columnar), or of a selection of its
+    rows. The columns are memory-mapped, and a Node is only created, and its strings decoded, when it is indexed or
+    iterated over. Created nodes are cached weakly: a row gives the same Node for as long as it is referenced, e.g. by
+    an Edge, and the Node is freed with its last reference. A node changed through add_mesh_id or add_cui is held by
+    the view from then on, so that its changes are not lost.
+
+    filter selects nodes by kind and by source on the columns alone, the views it returns share the cache.
+    """
+
+    def __init__(self,
+                 header: Dict[str, object],
+                 arrays: Dict[str, np.ndarray],
+                 rows: np.ndarray = None,
+                 cache: WeakValueDictionary = None,
+                 edited: Dict[int, Node] = None):
+        self._header = header
+        self._arrays = arrays
+        self._rows = np.arange(header["count"], dtype=np.int64) if rows is None else rows
+        self._cache = WeakValueDictionary() if cache is None else cache
+        self._edited = {} if edited is None else edited
+
+        self._columns = {name: StringColumn(arrays, name) for name in ["identifier", "name", "source_url"]}
+        self._columns.update({name: StringListColumn(arrays, name) for name in ["mesh_ids", "umls_cuis"]})
+
+    @classmethod
+    def open(cls, input_dir: str) -> 'NodeView':
+        return cls(*read_columnar(input_dir))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[Node, 'NodeView']:
+        if isinstance(item, slice):
+            return self._select(self._rows[item])
+
+        return self.node(int(self._rows[item]))
+
+    def __iter__(self) -> Iterator[Node]:
+        for row in self._rows.tolist():
+            yield self.node(row)
+
+    @property
+    def rows(self) -> np.ndarray:
+        """
+        Rows of the checkpoint in this view, in order.
+        """
+        return self._rows
+
+    @property
+    def keys_digest(self) -> str:
+        """
+        Digest of the keys of all nodes of the checkpoint, see Node.serialize_columnar.
+        """
+        return self._header["keys_digest"]
+
+    @property
+    def num_rows(self) -> int:
+        """
+        Number of nodes of the checkpoint, whichever rows are in this view.
+        """
+        return self._header["count"]
+
+    def node(self, row: int) -> Node:
+        """
+        Node of a row of the checkpoint, created unless it is still referenced from an earlier access or was changed.
+        """
+        node = self._cache.get(row, None)
+
+        if node is None:
+            columns = self._columns
+            node = _ViewNode(columns["identifier"][row], columns["name"][row],
+                             self._header["kinds"][self._arrays["kind"][row]],
+                             self._header["sources"][self._arrays["sources"][row]],
+                             self._header["licenses"][self._arrays["license"][row]],
+                             columns["source_url"][row])
+            node.add_mesh_id(columns["mesh_ids"][row])
+            node.add_cui(columns["umls_cuis"][row])
+            node._edited = self._edited
+            node._row = row
+            self._cache[row] = node
+
+        return node
+
+    @property
+    def edited(self) -> List[Node]:
+        """
+        Nodes of the checkpoint changed since it was opened, in the order of their rows.
+        """
+        return [self._edited[row] for row in sorted(self._edited)]
+
+    def filter(self, kinds: Iterable[str] = None, sources: Iterable[str] = None) -> 'NodeView':
+        """
+        Nodes of one of kinds, and listing one of sources, without creating any node. None keeps every node.
+        """
+        mask = np.ones(len(self._rows), dtype=bool)
+
+        if kinds is not None:
+            mask &= np.isin(self._arrays["kind"][self._rows], vocabulary_codes(self._header["kinds"], kinds))
+
+        if sources is not None:
+            mask &= np.isin(self._arrays["sources"][self._rows],
+                            vocabulary_codes(self._header["sources"], sources, True))
+
+        return self._select(self._rows[mask])
+
+    def kind_counts(self) -> Dict[str, int]:
+        counts = np.bincount(self._arrays["kind"][self._rows], minlength=len(self._header["kinds"]))
+
+        return {kind: int(count) for kind, count in zip(self._header["kinds"], counts) if count > 0}
+
+    def key_rows(self) -> Dict[NodeKey, int]:
+        """
+        Row of the checkpoint of every node key of this view, without creating any node.
+        """
+        identifiers = self._columns["identifier"]
+        names = self._columns["name"]
+        kinds = self._header["kinds"]
+
+        return {(identifiers[row], names[row], kinds[kind]): row
+                for row, kind in zip(self._rows.tolist(), self._arrays["kind"][self._rows].tolist())}
+
+    def materialize(self) -> List[Node]:
+        return list(self)
+
+    def _select(self, rows: np.ndarray) -> 'NodeView':
+        return NodeView(self._header, self._arrays, rows, self._cache, self._edited)
+
+
+class _ViewNode(Node):
+    """
+    Node created by a NodeView, which adds itself to the view's edited nodes when it is changed so that it outlives
+    its last outside reference.
+    """
+    __slots__ = ["_edited", "_row"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._edited = None
+        self._row = None
+
+    def add_mesh_id(self, mesh_id_or_ids: Union[str, List[str]]):
+        super().add_mesh_id(mesh_id_or_ids)
+        self._pin()
+
+    def add_cui(self, cui_or_cuis: Union[str, List[str]]):
+        super().add_cui(cui_or_cuis)
+        self._pin()
+
+    def _pin(self) -> None:
+        if self._edited is not None:
+            self._edited[self._row] = self
+
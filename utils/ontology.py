@@ -0,0 +1,157 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+import urllib.request
+from typing import List, Dict, Iterator, NamedTuple
+
+from utils.logger import log
+
+ONTOLOGY_CACHE_DIR = "outputs"
+ONTOLOGY_CACHE_VERSION = 1
+
+
+class CompactTerm(NamedTuple):
+    """
+    The parts of an OBO term used by the pipeline. other holds the xrefs under "xref", and xrefs returns them as strings
+    where pronto's Term.xrefs returns Xref objects.
+    """
+    id: str
+    name: str
+    other: Dict[str, List[str]]
+    parents: List[str]
+
+    @property
+    def xrefs(self) -> List[str]:
+        return self.other.get("xref", [])
+
+
+class CompactOntology(object):
+    """
+    Terms, xrefs and is_a edges of an ontology, iterable over its terms and indexable by term ID like pronto.Ontology.
+    """
+
+    def __init__(self, terms: List[CompactTerm], digest: str = None):
+        self.terms = {term.id: term for term in terms}
+        self.digest = digest
+
+    def __iter__(self) -> Iterator[CompactTerm]:
+        return iter(self.terms.values())
+
+    def __getitem__(self, term_id: str) -> CompactTerm:
+        return self.terms[term_id]
+
+    def __contains__(self, term_id: str) -> bool:
+        return term_id in self.terms
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+
+def load_ontology(source: str, **kwargs) -> CompactOntology:
+    """
+    Loads an OBO ontology from a local file, or from a URL that is downloaded once to download_path. The parsed terms
+    are cached in cache_dir, keyed by the SHA-1 of the OBO file, so a warm start only hashes the file.
+    """
+    cache_dir = kwargs.get("cache_dir", ONTOLOGY_CACHE_DIR)
+    use_cache = kwargs.get("use_cache", True)
+
+    file_path = fetch_ontology(source, **kwargs)
+    digest = file_digest(file_path)
+    cache_path = os.path.join(cache_dir, f"ontology.{digest}.json.gz")
+
+    if use_cache and os.path.exists(cache_path):
+        log.info(f"Loading ontology from cache at {cache_path}.")
+        with gzip.open(cache_path, "rt", encoding="utf-8") as file:
+            cached = json.load(file)
+
+        if cached["version"] == ONTOLOGY_CACHE_VERSION:
+            terms = [CompactTerm(t[0], t[1], {"xref": t[2]}, t[3]) for t in cached["terms"]]
+            return CompactOntology(terms, digest)
+
+    start = time.time()
+    terms = parse_obo(file_path)
+    log.info(f"Parsed {len(terms)} terms from {file_path} in {time.time() - start:.2f}s.")
+
+    if use_cache:
+        with gzip.open(cache_path, "wt", encoding="utf-8") as file:
+            json.dump({
+                "version": ONTOLOGY_CACHE_VERSION,
+                "source": source,
+                "terms": [[t.id, t.name, t.xrefs, t.parents] for t in terms]
+            }, file)
+        log.info(f"Cached ontology at {cache_path}.")
+
+    return CompactOntology(terms, digest)
+
+
+def fetch_ontology(source: str, **kwargs) -> str:
+    """
+    Local path of an OBO file. A URL is downloaded once to download_path, by default its file name in cache_dir.
+    """
+    download_path = kwargs.get("download_path", None)
+    cache_dir = kwargs.get("cache_dir", ONTOLOGY_CACHE_DIR)
+
+    file_path = source
+    if source.startswith("http://") or source.startswith("https://"):
+        file_path = download_path or os.path.join(cache_dir, os.path.basename(source))
+        if not os.path.exists(file_path):
+            log.info(f"Downloading {source} to {file_path}.")
+            with urllib.request.urlopen(source) as response, open(file_path, "wb") as file:
+                shutil.copyfileobj(response, file)
+
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Ontology file at {file_path} does not exist!")
+
+    return file_path
+
+
+def file_digest(file_path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha1()
+
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def parse_obo(file_path: str) -> List[CompactTerm]:
+    """
+    Reads the id, name, xref and is_a tags of every [Term] stanza of an OBO file. Trailing qualifiers, descriptions and
+    comments are dropped, e.g. "is_a: DOID:4 ! disease" gives the parent "DOID:4".
+    """
+    terms = []
+    stanza = None
+
+    def close(tags: Dict) -> None:
+        if tags is not None and tags["id"] is not None:
+            terms.append(CompactTerm(tags["id"], tags["name"], {"xref": tags["xref"]}, tags["is_a"]))
+
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+
+            if line.startswith("["):
+                close(stanza)
+                stanza = {"id": None, "name": None, "xref": [], "is_a": []} if line == "[Term]" else None
+                continue
+
+            if stanza is None or ":" not in line:
+                continue
+
+            tag, value = line.split(":", 1)
+            value = value.strip()
+
+            if tag == "id":
+                stanza["id"] = value
+            elif tag == "name":
+                stanza["name"] = value
+            elif tag in ("xref", "is_a") and len(value) > 0:
+                stanza[tag].append(value.split()[0])
+
+    close(stanza)
+
+    return terms
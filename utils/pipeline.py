@@ -0,0 +1,144 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Callable, NamedTuple, Iterable, Tuple
+
+from utils.enrichment import apply_ids, index_nodes
+from utils.instrumentation import INSTRUMENTATION, StageRecord, instrumented, stage
+from utils.logger import log
+from utils.node import Node
+from utils.processes import process_pool, worker_state
+
+# Mappings returned by an enricher, keyed by Node field (see utils/enrichment.ENRICHABLE_FIELDS), then by identifier
+Mappings = Dict[str, Dict[str, List[str]]]
+
+
+class Enricher(NamedTuple):
+    """
+    Computes the cross-references of the nodes of one kind. function is called with the het.io records of that kind
+    and, as keyword arguments, the sources named in sources, and returns Mappings. It must be a module-level function
+    so that it can run in a worker process.
+    """
+    kind: str
+    function: Callable[..., Mappings]
+    sources: List[str]
+    description: str
+
+
+@instrumented(records=lambda sources: None)
+def load_sources(loaders: Dict[str, Callable[[], object]], max_workers: int = None) -> Dict[str, object]:
+    """
+    Runs independent loaders concurrently and returns their results under the same names. Threads are used so that the
+    loaded objects do not have to be copied between processes, file reads and pandas parsing release the GIL.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or len(loaders)) as pool:
+        futures = {name: pool.submit(loader) for name, loader in loaders.items()}
+
+        return {name: future.result() for name, future in futures.items()}
+
+
+def enrich_nodes(records: Iterable[Dict],
+                 nodes: List[Node],
+                 enrichers: List[Enricher],
+                 sources: Dict[str, object],
+                 processes: int = 1) -> List[Node]:
+    """
+    Runs every enricher whose sources are available, in a pool of processes if processes > 1, then applies the
+    results to nodes one enricher at a time in the order of enrichers, so the outcome does not depend on scheduling.
+    """
+    records_by_kind = group_records(records, enrichers)
+    runnable = runnable_enrichers(enrichers, records_by_kind, sources)
+    results = run_enrichers(runnable, records_by_kind, sources, processes)
+
+    return apply_mappings(nodes, runnable, records_by_kind, results)
+
+
+def group_records(records: Iterable[Dict], enrichers: List[Enricher]) -> Dict[str, List[Dict]]:
+    kinds = set(e.kind for e in enrichers)
+    records_by_kind = defaultdict(list)
+
+    for record in records:
+        if record["kind"] in kinds:
+            records_by_kind[record["kind"]].append(record)
+
+    return records_by_kind
+
+
+def runnable_enrichers(enrichers: List[Enricher],
+                       records_by_kind: Dict[str, List[Dict]],
+                       sources: Dict[str, object]) -> List[Enricher]:
+    runnable = []
+
+    for enricher in enrichers:
+        missing = [s for s in enricher.sources if sources.get(s, None) is None]
+        if len(missing) > 0:
+            log.info(f"Skipping {enricher.kind} enricher, missing {missing}.")
+        elif len(records_by_kind[enricher.kind]) == 0:
+            log.info(f"Skipping {enricher.kind} enricher, there are no {enricher.kind} nodes.")
+        else:
+            runnable.append(enricher)
+
+    return runnable
+
+
+@instrumented(records=lambda results: None)
+def run_enrichers(enrichers: List[Enricher],
+                  records_by_kind: Dict[str, List[Dict]],
+                  sources: Dict[str, object],
+                  processes: int = 1) -> List[Mappings]:
+    """
+    Returns the mappings of every enricher, in the order of enrichers. A source may be given as a function without
+    arguments, which is only called if an enricher needs it. Such loaders run concurrently, see load_sources.
+    """
+    loaders = {}
+    for enricher in enrichers:
+        for name in enricher.sources:
+            source = sources[name]
+            loaders[name] = source if callable(source) else (lambda loaded=source: loaded)
+    needed = load_sources(loaders) if len(loaders) > 0 else {}
+
+    if processes > 1 and len(enrichers) > 1:
+        with process_pool(min(processes, len(enrichers)), needed) as pool:
+            futures = [pool.submit(_run_enricher, e, records_by_kind[e.kind]) for e in enrichers]
+            results = []
+            for future in futures:
+                mappings, record = future.result()
+                INSTRUMENTATION.add(record)
+                results.append(mappings)
+            return results
+
+    results = []
+    for enricher in enrichers:
+        with stage(f"enricher.{enricher.kind}") as handle:
+            results.append(enricher.function(records_by_kind[enricher.kind],
+                                             **{s: needed[s] for s in enricher.sources}))
+            handle.records = len(records_by_kind[enricher.kind])
+
+    return results
+
+
+@instrumented()
+def apply_mappings(nodes: List[Node],
+                   enrichers: List[Enricher],
+                   records_by_kind: Dict[str, List[Dict]],
+                   results: List[Mappings]) -> List[Node]:
+    node_index = index_nodes(nodes)
+
+    for enricher, mappings in zip(enrichers, results):
+        identifiers = [r["identifier"] for r in records_by_kind[enricher.kind]]
+        summary = apply_ids(node_index, enricher.kind, identifiers, mappings)
+        summary.log(enricher.description)
+
+    return nodes
+
+
+def _run_enricher(enricher: Enricher, records: List[Dict]) -> Tuple[Mappings, StageRecord]:
+    """
+    Runs an enricher in a worker process, with the sources shared by the pool, returning its mappings and the
+    StageRecord of its run, which the worker does not keep.
+    """
+    sources = worker_state()
+    with stage(f"enricher.{enricher.kind}") as handle:
+        mappings = enricher.function(records, **{s: sources[s] for s in enricher.sources})
+        handle.records = len(records)
+
+    return mappings, INSTRUMENTATION.stages.pop()
@@ -0,0 +1,41 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
+
+# State shared with the workers of the current process_pool, see worker_state
+_STATE = None
+
+
+@contextmanager
+def process_pool(max_workers: int, state: object = None) -> Iterator[ProcessPoolExecutor]:
+    """
+    ProcessPoolExecutor whose workers read state through worker_state. Where processes can be forked, state is set in
+    this process and the workers inherit it copy-on-write, so large objects such as the UMLS frame are neither pickled
+    nor rebuilt per worker. Elsewhere it is pickled to every worker once. The previous state is restored in this process
+    once the pool is shut down.
+    """
+    global _STATE
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        previous, _STATE = _STATE, state
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                yield pool
+        finally:
+            _STATE = previous
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_set_state, initargs=(state,)) as pool:
+            yield pool
+
+
+def worker_state() -> object:
+    """
+    State of the process_pool that runs the calling worker.
+    """
+    return _STATE
+
+
+def _set_state(state: object) -> None:
+    global _STATE
+    _STATE = state
@@ -1,86 +1,118 @@
-import os
-import pickle
-from typing import List
+from typing import List, Tuple
 
 import pandas as pd
 from tqdm import tqdm
 
+from utils.build_cache import digest_inputs, digest_keys
+from utils.checkpoint import checkpoint_path, checkpoint_exists
 from utils.edge import Edge
+from utils.instrumentation import instrumented
 from utils.logger import log
 from utils.node import Node
 
 NODES_CHECKPOINT = "outputs/repodb_nodes.checkpoint.json"
 EDGES_CHECKPOINT = "outputs/repodb_edges.checkpoint.json"
 
+# Namespace of the identifiers of every kind of repoDB node, for Crosswalk.enrich_nodes
+REPODB_NAMESPACES = {"Compound": "DRUGBANK", "Disease": "UMLS_CUI"}
 
+
+@instrumented("repodb.build_nodes")
 def build_nodes(repodb: pd.DataFrame, **kwargs) -> List[Node]:
+    """
+    With a Crosswalk in crosswalk (see utils/crosswalk.py), the UMLS CUIs and MeSH IDs of the drugs and indications are
+    looked up in it, drugs being DrugBank IDs and indications UMLS CUIs.
+
+    With a BuildCache in cache, the checkpoint is only loaded if it was built from the same repoDB file, whose digest
+    is given in digests["repodb"], and the same crosswalk sources.
+    """
     force_rebuild = kwargs.get("force_rebuild", False)
     save_checkpoint = kwargs.get("save_checkpoint", True)
+    checkpoint_format = kwargs.get("checkpoint_format", "json")
+    nodes_checkpoint = checkpoint_path(NODES_CHECKPOINT, checkpoint_format)
+    cache = kwargs.get("cache", None)
+    digests = kwargs.get("digests", {})
+    crosswalk = kwargs.get("crosswalk", None)
+
+    inputs_digest = None
+    if cache is not None:
+        inputs_digest = digest_inputs({
+            "repodb": digests["repodb"],
+            "format": checkpoint_format,
+            "crosswalk": crosswalk.digest() if crosswalk is not None else None
+        })
 
     if not force_rebuild:
-        if os.path.exists(NODES_CHECKPOINT):
-            return Node.deserialize_bunch(NODES_CHECKPOINT)
+        if checkpoint_exists(nodes_checkpoint, checkpoint_format) and \
+                (cache is None or cache.is_fresh("repodb_nodes", inputs_digest)):
+            return Node.load_checkpoint(nodes_checkpoint, checkpoint_format)
         else:
-            log.info("Node checkpoint does not exist, building nodes.")
-
-    nodes = []
+            log.info("Node checkpoint does not exist or is stale, building nodes.")
 
-    drug_ids = repodb["drug_id"].unique()
-    disease_ids = repodb["ind_id"].unique()
+    drugs = unique_names(repodb, "drug_id", "drug_name")
+    diseases = unique_names(repodb, "ind_id", "ind_name")
 
-    for drug_id in drug_ids:
-        match = repodb[repodb["drug_id"] == drug_id]
-        drug_names = match["drug_name"].unique()
-        assert len(drug_names) == 1
-
-        node = Node(drug_id, drug_names[0], kind="Compound", sources=["RepoDB"])
-        nodes.append(node)
-
-    for disease_id in disease_ids:
-        match = repodb[repodb["ind_id"] == disease_id]
-        disease_names = match["ind_name"].unique()
-        assert len(disease_names) == 1
-
-        node = Node(disease_id, disease_names[0], kind="Disease", sources=["RepoDB"])
-        nodes.append(node)
+    nodes = [Node(drug_id, drug_name, kind="Compound", sources=["RepoDB"]) for drug_id, drug_name in drugs]
+    nodes += [Node(ind_id, ind_name, kind="Disease", sources=["RepoDB"]) for ind_id, ind_name in diseases]
 
     log.info(f"Built {len(nodes)} nodes from RepoDB.")
 
+    if crosswalk is not None:
+        crosswalk.enrich_nodes(nodes, REPODB_NAMESPACES)
+
     if save_checkpoint:
         log.info("Checkpointing nodes...")
-        Node.serialize_bunch(nodes, NODES_CHECKPOINT)
+        Node.save_checkpoint(nodes, nodes_checkpoint, checkpoint_format)
+
+        if cache is not None:
+            cache.record("repodb_nodes", inputs_digest, [nodes_checkpoint])
 
     return nodes
 
 
+@instrumented("repodb.build_edges")
 def build_edges(repodb: pd.DataFrame, nodes: List[Node], **kwargs) -> List[Edge]:
     """
     According to https://prsinfo.clinicaltrials.gov/definitions.html, we cannot assume that Suspended, Terminated, or
     Withdrawn implies failed trial.
+
+    With a BuildCache in cache, the checkpoint is only loaded if it was built from the same repoDB file (see
+    build_nodes), the same node keys and the same include_inverse.
     """
     include_inverse = kwargs.get("include_inverse", False)
     force_rebuild = kwargs.get("force_rebuild", False)
     save_checkpoint = kwargs.get("save_checkpoint", True)
+    checkpoint_format = kwargs.get("checkpoint_format", "json")
+    edges_checkpoint = checkpoint_path(EDGES_CHECKPOINT, checkpoint_format)
+    cache = kwargs.get("cache", None)
+    digests = kwargs.get("digests", {})
+
+    inputs_digest = None
+    if cache is not None:
+        inputs_digest = digest_inputs({
+            "repodb": digests["repodb"],
+            "nodes": digest_keys([n.key for n in nodes]),
+            "include_inverse": include_inverse,
+            "format": checkpoint_format
+        })
 
     if not force_rebuild:
-        if os.path.exists(EDGES_CHECKPOINT):
-            return Edge.deserialize_bunch(EDGES_CHECKPOINT, nodes)
+        if checkpoint_exists(edges_checkpoint, checkpoint_format) and \
+                (cache is None or cache.is_fresh("repodb_edges", inputs_digest)):
+            return Edge.load_checkpoint(edges_checkpoint, Node.index_bunch(nodes), checkpoint_format)
         else:
-            log.info("Edge checkpoint does not exist, building edges.")
+            log.info("Edge checkpoint does not exist or is stale, building edges.")
 
     edges = []
 
     node_dict = {n.identifier: n for n in nodes}
 
-    for repodb_edge in tqdm(repodb.iterrows()):
-        kind = repodb_edge[1]["status"]
-
-        # skip the non-"Approved" ones
-        if kind != "Approved":
-            continue
+    # skip the non-"Approved" ones
+    approved = repodb.loc[repodb["status"] == "Approved", ["drug_id", "ind_id"]]
 
-        src_node = node_dict[repodb_edge[1]["drug_id"]]
-        dst_node = node_dict[repodb_edge[1]["ind_id"]]
+    for drug_id, ind_id in tqdm(zip(approved["drug_id"].tolist(), approved["ind_id"].tolist()), total=len(approved)):
+        src_node = node_dict[drug_id]
+        dst_node = node_dict[ind_id]
         forward_edge = Edge(src_node, dst_node, kind="treats", sources=["RepoDB"])
         edges.append(forward_edge)
 
@@ -90,6 +122,25 @@ def build_edges(repodb: pd.DataFrame, nodes: List[Node], **kwargs) -> List[Edge]
 
     if save_checkpoint:
         log.info("Checkpointing edges...")
-        Edge.serialize_bunch(edges, EDGES_CHECKPOINT)
+        Edge.save_checkpoint(edges, edges_checkpoint, checkpoint_format, nodes)
+
+        if cache is not None:
+            cache.record("repodb_edges", inputs_digest, [edges_checkpoint])
 
     return edges
+
+
+def unique_names(repodb: pd.DataFrame, id_column: str, name_column: str) -> List[Tuple[str, str]]:
+    """
+    (id, name) pairs in order of first appearance. An ID that appears with more than one name is a conflict and raises
+    a ValueError.
+    """
+    pairs = repodb[[id_column, name_column]].drop_duplicates()
+    conflicts = pairs[pairs[id_column].duplicated(keep=False)]
+
+    if len(conflicts) > 0:
+        log.error(f"{conflicts[id_column].nunique()} values of {id_column} have more than one {name_column}, e.g. "
+                  f"{conflicts.head(5).values.tolist()}.")
+        raise ValueError(f"Conflicting {name_column} for {conflicts[id_column].nunique()} values of {id_column}.")
+
+    return list(zip(pairs[id_column].tolist(), pairs[name_column].tolist()))
@@ -0,0 +1,278 @@
+import os
+from typing import List, Iterable, Iterator, NamedTuple, Tuple, Union
+
+import numpy as np
+from networkx import MultiDiGraph
+
+from utils.checkpoint import COLUMNAR_HEADER, write_columnar_header, read_columnar
+from utils.hetero_graph import HeteroGraph
+from utils.logger import log
+
+SAMPLES_CHECKPOINT = "outputs/samples.columnar"
+SAMPLE_BATCH_SIZE = 100000
+
+
+class Triples(NamedTuple):
+    """
+    Edges as parallel arrays of source node IDs, destination node IDs and edge kind codes (positions in the graph's
+    kinds).
+    """
+    source: np.ndarray
+    destination: np.ndarray
+    kind: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+    def take(self, positions: np.ndarray) -> 'Triples':
+        return Triples(self.source[positions], self.destination[positions], self.kind[positions])
+
+    @classmethod
+    def concatenate(cls, triples: List['Triples']) -> 'Triples':
+        return cls(np.concatenate([t.source for t in triples]),
+                   np.concatenate([t.destination for t in triples]),
+                   np.concatenate([t.kind for t in triples]))
+
+
+class EdgeSplit(NamedTuple):
+    train: Triples
+    validation: Triples
+    test: Triples
+
+
+class NegativeSampler(object):
+    """
+    Samples corrupted triples from the edges of a HeteroGraph (or a MultiDiGraph, which is converted). A negative
+    replaces the source or the destination of a true edge, with equal probability, by a random node of the same kind,
+    and is rejected if it is itself an edge of the graph, of any split.
+
+    Edges are hashed to integer keys, (kind * num_nodes + source) * num_nodes + destination, kept in a sorted array so
+    that a whole batch of candidates is checked against the true edges at once.
+    """
+
+    def __init__(self, graph: Union[HeteroGraph, MultiDiGraph], seed: int = 0):
+        if isinstance(graph, MultiDiGraph):
+            graph = HeteroGraph.from_networkx(graph)
+
+        if len(graph.kinds) * graph.num_nodes ** 2 >= np.iinfo(np.int64).max:
+            raise ValueError(f"Graph with {graph.num_nodes} nodes and {len(graph.kinds)} edge kinds is too large for "
+                             f"64-bit edge keys.")
+
+        self.graph = graph
+        self.rng = np.random.default_rng(seed)
+
+        node_kinds = {}
+        self._node_kinds = np.fromiter((node_kinds.setdefault(n.kind, len(node_kinds)) for n in graph.nodes),
+                                       dtype=np.int32, count=graph.num_nodes)
+        self._pools = [np.flatnonzero(self._node_kinds == k) for k in range(len(node_kinds))]
+        self._keys = np.unique(edge_keys(graph, graph_triples(graph)))
+
+    def triples(self, kinds: Iterable[str] = None) -> Triples:
+        return graph_triples(self.graph, kinds)
+
+    def contains(self, triples: Triples) -> np.ndarray:
+        """
+        Whether each triple is an edge of the graph.
+        """
+        keys = edge_keys(self.graph, triples)
+        positions = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+
+        return self._keys[positions] == keys if len(self._keys) > 0 else np.zeros(len(keys), dtype=bool)
+
+    def corrupt(self, positives: Triples, num_negatives: int = 1, max_attempts: int = 10) -> Triples:
+        """
+        num_negatives negatives per positive, in the order of positives. Candidates that are true edges are sampled
+        again, up to max_attempts times, and dropped if they still are, e.g. for a node connected to every node of the
+        other kind.
+        """
+        repeated = positives.take(np.repeat(np.arange(len(positives)), num_negatives))
+        source = repeated.source.copy()
+        destination = repeated.destination.copy()
+        pending = np.arange(len(repeated))
+
+        for _ in range(max_attempts):
+            if len(pending) == 0:
+                break
+
+            replace_source = self.rng.random(len(pending)) < 0.5
+            replaced = np.where(replace_source, repeated.source[pending], repeated.destination[pending])
+            candidates = self._sample_like(replaced)
+
+            source[pending] = np.where(replace_source, candidates, repeated.source[pending])
+            destination[pending] = np.where(replace_source, repeated.destination[pending], candidates)
+
+            sampled = Triples(source[pending], destination[pending], repeated.kind[pending])
+            pending = pending[self.contains(sampled)]
+
+        keep = np.ones(len(repeated), dtype=bool)
+        keep[pending] = False
+        if len(pending) > 0:
+            log.info(f"Dropped {len(pending)}/{len(repeated)} negatives that were still true edges after "
+                     f"{max_attempts} attempts.")
+
+        return Triples(source[keep], destination[keep], repeated.kind[keep])
+
+    def minibatches(self,
+                    positives: Triples,
+                    batch_size: int = SAMPLE_BATCH_SIZE,
+                    num_negatives: int = 1,
+                    shuffle: bool = True) -> Iterator[Tuple[Triples, np.ndarray]]:
+        """
+        Streams (triples, labels) minibatches of batch_size positives each, followed by their negatives, labels being 1
+        for positives and 0 for negatives. Only one minibatch is held in memory at a time.
+        """
+        order = self.rng.permutation(len(positives)) if shuffle else np.arange(len(positives))
+
+        for start in range(0, len(positives), batch_size):
+            batch = positives.take(order[start:start + batch_size])
+            negatives = self.corrupt(batch, num_negatives)
+            labels = np.concatenate([np.ones(len(batch), dtype=np.int8), np.zeros(len(negatives), dtype=np.int8)])
+
+            yield Triples.concatenate([batch, negatives]), labels
+
+    def write_minibatches(self, positives: Triples, output_dir: str = SAMPLES_CHECKPOINT, **kwargs) -> int:
+        """
+        Writes the minibatches of minibatches(positives, **kwargs) one after the other as a columnar checkpoint with
+        source, destination, kind, label and batch columns, each minibatch being written as soon as it is sampled.
+        Returns the number of triples written.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        header_path = os.path.join(output_dir, COLUMNAR_HEADER)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+
+        # negatives dropped by corrupt make the exact size unknown up front, this is an upper bound
+        capacity = len(positives) * (1 + kwargs.get("num_negatives", 1))
+        columns = {name: np.lib.format.open_memmap(os.path.join(output_dir, f"{name}.tmp.npy"), mode="w+",
+                                                   dtype=dtype, shape=(capacity,))
+                   for name, dtype in [("source", np.int32), ("destination", np.int32), ("kind", np.int32),
+                                       ("label", np.int8), ("batch", np.int32)]}
+        count = 0
+
+        for b, (triples, labels) in enumerate(self.minibatches(positives, **kwargs)):
+            end = count + len(labels)
+            columns["source"][count:end] = triples.source
+            columns["destination"][count:end] = triples.destination
+            columns["kind"][count:end] = triples.kind
+            columns["label"][count:end] = labels
+            columns["batch"][count:end] = b
+            count = end
+
+        for name, column in columns.items():
+            np.save(os.path.join(output_dir, f"{name}.npy"), column[:count])
+            os.remove(os.path.join(output_dir, f"{name}.tmp.npy"))
+
+        write_columnar_header(output_dir, {"count": count, "kinds": self.graph.kinds}, list(columns.keys()))
+
+        return count
+
+    def _sample_like(self, node_ids: np.ndarray) -> np.ndarray:
+        """
+        A random node of the same kind as each of node_ids, so that negatives keep the node kinds of their relation.
+        """
+        kinds = self._node_kinds[node_ids]
+        sampled = np.empty(len(node_ids), dtype=np.int64)
+
+        for k in np.unique(kinds):
+            mask = kinds == k
+            pool = self._pools[k]
+            sampled[mask] = pool[self.rng.integers(0, len(pool), mask.sum())]
+
+        return sampled
+
+
+def graph_triples(graph: HeteroGraph, kinds: Iterable[str] = None) -> Triples:
+    """
+    All edges of the graph, or only those of the given kinds.
+    """
+    kinds = graph.kinds if kinds is None else list(kinds)
+    triples = []
+
+    for kind in kinds:
+        source_ids, destination_ids, _ = graph.edge_arrays(kind)
+        triples.append(Triples(source_ids.astype(np.int64), destination_ids.astype(np.int64),
+                               np.full(len(source_ids), graph.kinds.index(kind), dtype=np.int64)))
+
+    if len(triples) == 0:
+        return Triples(*(np.zeros(0, dtype=np.int64) for _ in range(3)))
+
+    return Triples.concatenate(triples)
+
+
+def edge_keys(graph: HeteroGraph, triples: Triples) -> np.ndarray:
+    """
+    Integer key of every triple, (kind * num_nodes + source) * num_nodes + destination.
+    """
+    num_nodes = graph.num_nodes
+
+    return (triples.kind.astype(np.int64) * num_nodes + triples.source) * num_nodes + triples.destination
+
+
+def load_minibatches(input_dir: str = SAMPLES_CHECKPOINT) -> Iterator[Tuple[Triples, np.ndarray]]:
+    """
+    Streams back the minibatches written by NegativeSampler.write_minibatches from the memory-mapped columns.
+    """
+    header, arrays = read_columnar(input_dir)
+    boundaries = np.flatnonzero(np.diff(arrays["batch"])) + 1
+    starts = np.concatenate([[0], boundaries]) if header["count"] > 0 else []
+    ends = np.concatenate([boundaries, [header["count"]]]) if header["count"] > 0 else []
+
+    for start, end in zip(starts, ends):
+        yield (Triples(arrays["source"][start:end], arrays["destination"][start:end], arrays["kind"][start:end]),
+               arrays["label"][start:end])
+
+
+def split_edges(graph: HeteroGraph, **kwargs) -> EdgeSplit:
+    """
+    Splits the edges into train, validation and test triples without leaks between them: an edge and its "_inv"
+    partner, e.g. (compound, disease, "treats") and (disease, compound, "treats_inv"), always end up in the same split.
+
+    Only the edges of relations (all kinds if None), together with their "_inv" kinds, are withheld, validation_fraction
+    and test_fraction of them going to the validation and test splits. Every other edge is for training.
+    """
+    relations = kwargs.get("relations", None)
+    validation_fraction = kwargs.get("validation_fraction", 0.0)
+    test_fraction = kwargs.get("test_fraction", 0.1)
+    seed = kwargs.get("seed", 0)
+
+    kinds = graph.kinds
+    kind_codes = {kind: k for k, kind in enumerate(kinds)}
+    # code of the kind every kind is grouped under, "treats_inv" edges being grouped with "treats" ones
+    canonical = np.array([kind_codes.get(kind[:-len("_inv")], k) if kind.endswith("_inv") else k
+                          for k, kind in enumerate(kinds)], dtype=np.int64)
+    inverted = np.array([kind.endswith("_inv") and kind[:-len("_inv")] in kind_codes for kind in kinds], dtype=bool)
+
+    if relations is None:
+        withheld_codes = np.arange(len(kinds))
+    else:
+        relation_codes = set(canonical[kind_codes[r]] for r in relations if r in kind_codes)
+        withheld_codes = np.flatnonzero(np.isin(canonical, list(relation_codes)))
+
+    triples = graph_triples(graph)
+
+    # an edge's group is the key of its non-inverted orientation
+    flip = inverted[triples.kind]
+    groups = edge_keys(graph, Triples(np.where(flip, triples.destination, triples.source),
+                                      np.where(flip, triples.source, triples.destination),
+                                      canonical[triples.kind]))
+
+    withheld = np.isin(triples.kind, withheld_codes)
+    unique_groups, group_of = np.unique(groups[withheld], return_inverse=True)
+
+    rng = np.random.default_rng(seed)
+    rank = rng.permutation(len(unique_groups))
+    num_test = int(round(test_fraction * len(unique_groups)))
+    num_validation = int(round(validation_fraction * len(unique_groups)))
+
+    split = np.zeros(len(triples), dtype=np.int8)
+    withheld_split = np.zeros(len(unique_groups), dtype=np.int8)
+    withheld_split[rank < num_test] = 2
+    withheld_split[(rank >= num_test) & (rank < num_test + num_validation)] = 1
+    split[np.flatnonzero(withheld)] = withheld_split[group_of]
+
+    log.info(f"Split {len(triples)} edges into {(split == 0).sum()} train, {(split == 1).sum()} validation and "
+             f"{(split == 2).sum()} test edges.")
+
+    return EdgeSplit(triples.take(np.flatnonzero(split == 0)),
+                     triples.take(np.flatnonzero(split == 1)),
+                     triples.take(np.flatnonzero(split == 2)))
@@ -1,37 +1,292 @@
 import bz2
+import csv
+import hashlib
 import json
-from typing import Dict
+import os
+import time
+from typing import Dict, List, Iterator, IO
 
 import pandas as pd
-from pronto import Ontology
 
+from utils.instrumentation import instrumented
 from utils.logger import log
+from utils.ontology import CompactOntology, load_ontology
 
+UMLS_CACHE_DIR = "outputs"
+# Changes whenever the cached frame does, e.g. its dtypes, so that older caches are not loaded
+UMLS_CACHE_VERSION = 3
+DISEASE_ONTOLOGY_URL = "http://purl.obolibrary.org/obo/doid.obo"
+GENE_ONTOLOGY_URL = "http://purl.obolibrary.org/obo/go.obo"
+# Only the MRCONSO columns used downstream are kept in memory
+UMLS_COLUMNS = ["CUI", "LAT", "SAB", "CODE", "STR"]
+
+
+@instrumented()
+def load_umls(file_path: str, **kwargs) -> pd.DataFrame:
+    """
+    Streams MRCONSO.RRF in chunks, keeping only the UMLS_COLUMNS and the rows whose LAT is in languages and, if an
+    allow-list is given, whose SAB is in sabs. The result is cached as Parquet in cache_dir, keyed by the size and mtime
+    of the source file and the filters, so later runs skip parsing the RRF file altogether.
+    """
+    languages = kwargs.get("languages", ["ENG"])
+    sabs = kwargs.get("sabs", None)
+    chunk_size = kwargs.get("chunk_size", 1000000)
+    use_cache = kwargs.get("use_cache", True)
+    cache_dir = kwargs.get("cache_dir", UMLS_CACHE_DIR)
+
+    cache_path = _umls_cache_path(file_path, cache_dir, languages, sabs)
+
+    if use_cache and os.path.exists(cache_path):
+        log.info(f"Loading UMLS from cache at {cache_path}.")
+        return pd.read_parquet(cache_path)
 
-def load_umls(file_path: str) -> pd.DataFrame:
     log.info("Loading UMLS file.")
+    start = time.time()
     columns = ["CUI", "LAT", "TS", "LUI", "STT", "SUI", "ISPREF", "AUI", "SAUI", "SCUI", "SDUI", "SAB", "TTY", "CODE",
                "STR", "SRL", "SUPPRESS", "CVF", "MISC"]
+    use_columns = [columns.index(c) for c in UMLS_COLUMNS]
+
+    # values such as "NA" are codes or strings, not missing values
+    reader = pd.read_csv(file_path, delimiter="|", header=None, usecols=use_columns, dtype=str,
+                         quoting=csv.QUOTE_NONE, keep_default_na=False, na_filter=False, chunksize=chunk_size)
+    chunks = []
+    total = 0
+
+    for chunk in reader:
+        chunk.columns = [columns[i] for i in chunk.columns]
+        total += len(chunk)
+        mask = chunk["LAT"].isin(languages)
+        if sabs is not None:
+            mask &= chunk["SAB"].isin(sabs)
+        chunks.append(compact_umls(chunk.loc[mask, UMLS_COLUMNS].reset_index(drop=True)))
+
+    umls = _concat_umls(chunks) if len(chunks) > 0 else compact_umls(pd.DataFrame(columns=UMLS_COLUMNS))
 
-    umls = pd.read_csv(file_path, delimiter="|", names=columns)
+    log.info(f"Kept {len(umls)}/{total} UMLS records in {time.time() - start:.2f}s.")
+
+    if use_cache:
+        try:
+            umls.to_parquet(cache_path, index=False)
+            log.info(f"Cached UMLS records at {cache_path}.")
+        except ImportError:
+            log.warning("pyarrow or fastparquet is required to cache UMLS, skipping.")
 
     log.info("Finished loading UMLS file.")
-    # Only return the English records
-    return umls[umls["LAT"] == "ENG"]
 
+    return umls
+
+
+def compact_umls(umls: pd.DataFrame) -> pd.DataFrame:
+    """
+    Stores LAT, SAB, CUI and CODE, whose values repeat across rows, as categoricals, and STR, whose values are mostly
+    distinct, as Arrow strings if pyarrow is installed, instead of one Python string object per value.
+    """
+    for column in ["LAT", "SAB", "CUI", "CODE"]:
+        umls[column] = umls[column].astype("category")
+
+    try:
+        umls["STR"] = umls["STR"].astype("string[pyarrow]")
+    except ImportError:
+        log.warning("pyarrow is required to store UMLS strings compactly, keeping them as objects.")
+
+    return umls
+
+
+def _concat_umls(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates compacted chunks, merging the categories of their categoricals rather than falling back to objects.
+    """
+    columns = {}
+    for column in UMLS_COLUMNS:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            columns[column] = pd.api.types.union_categoricals([chunk[column] for chunk in chunks])
+        else:
+            columns[column] = pd.concat([chunk[column] for chunk in chunks], ignore_index=True)
+
+    return pd.DataFrame(columns)
+
+
+def _umls_cache_path(file_path: str, cache_dir: str, languages: List[str], sabs: List[str] = None) -> str:
+    stat = os.stat(file_path)
+    key = json.dumps([UMLS_CACHE_VERSION, os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns,
+                      sorted(languages), sorted(sabs) if sabs is not None else None])
+    digest = hashlib.md5(key.encode("utf-8")).hexdigest()
+
+    return os.path.join(cache_dir, f"umls.{digest}.parquet")
+
+
+@instrumented(records=lambda h: None if isinstance(h["nodes"], HetioRecords) else
+              len(h["nodes"]) + len(h["edges"]))
+def load_hetio(file_path: str, **kwargs) -> Dict:
+    """
+    With stream=True, "nodes" and "edges" are HetioRecords that decode one record at a time from the compressed file
+    each time they are iterated, instead of lists holding the whole JSON tree.
+    """
+    stream = kwargs.get("stream", False)
+
+    if stream:
+        return {
+            "nodes": HetioRecords(file_path, "nodes"),
+            "edges": HetioRecords(file_path, "edges")
+        }
 
-def load_hetio(file_path: str) -> Dict:
     with bz2.open(file_path) as file:
         return json.load(file)
 
 
+class HetioRecords(object):
+    """
+    Re-iterable view over one of the top-level arrays of a het.io JSON file. Every iteration re-opens the file and
+    yields the records of the array as they are decoded, so only one record is held in memory at a time.
+    """
+
+    def __init__(self, file_path: str, key: str):
+        self.file_path = file_path
+        self.key = key
+
+    def __iter__(self) -> Iterator[Dict]:
+        with bz2.open(self.file_path, "rt", encoding="utf-8") as file:
+            yield from _JsonArrayStream(file).iter_array(self.key)
+
+
+class _JsonArrayStream(object):
+    """
+    Minimal incremental decoder for a top-level JSON object, yielding the elements of one of its array values. Other
+    values are decoded and discarded one element at a time.
+    """
+    WHITESPACE = " \t\n\r"
+    NUMBER_CHARS = "0123456789+-.eE"
+
+    def __init__(self, file: IO[str], chunk_size: int = 1 << 20):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+
+    def iter_array(self, key: str) -> Iterator[object]:
+        self._expect("{")
+
+        if self._peek() == "}":
+            return
+
+        while True:
+            name = self._decode()
+            self._expect(":")
+
+            if name == key:
+                self._expect("[")
+                yield from self._iter_elements()
+                return
+
+            if self._peek() == "[":
+                self._expect("[")
+                for _ in self._iter_elements():
+                    pass
+            else:
+                self._decode()
+
+            if self._next() == "}":
+                break
+
+        raise KeyError(f"Top-level key \"{key}\" not found.")
+
+    def _iter_elements(self) -> Iterator[object]:
+        if self._peek() == "]":
+            self._position += 1
+            return
+
+        while True:
+            yield self._decode()
+
+            if self._next() == "]":
+                return
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+
+        chunk = self._file.read(self._chunk_size)
+        if len(chunk) == 0:
+            self._eof = True
+            return False
+
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in self.WHITESPACE:
+                self._position += 1
+
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream.")
+
+    def _next(self) -> str:
+        char = self._peek()
+        if char not in ",}]":
+            raise ValueError(f"Expecting delimiter at position {self._position}, found \"{char}\".")
+        self._position += 1
+
+        return char
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expecting \"{char}\" at position {self._position}, found \"{found}\".")
+        self._position += 1
+
+    def _decode(self) -> object:
+        self._peek()
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+
+            # a number running up to the end of the buffer, possibly with a dangling ".", "e" or sign the decoder
+            # stopped before, may continue in the next chunk
+            if self._number_may_continue(value, end) and self._fill():
+                continue
+
+            self._position = end
+
+            return value
+
+    def _number_may_continue(self, value: object, end: int) -> bool:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+
+        return all(char in self.NUMBER_CHARS for char in self._buffer[end:])
+
+
+@instrumented()
 def load_repodb(file_path: str) -> pd.DataFrame:
     return pd.read_csv(file_path)
 
 
-def load_disease_ontology() -> Ontology:
-    return Ontology("http://purl.obolibrary.org/obo/doid.obo")
+@instrumented()
+def load_disease_ontology(file_path: str = DISEASE_ONTOLOGY_URL, **kwargs) -> CompactOntology:
+    """
+    file_path may be a local OBO file, which is what build hosts without internet access should pass. See
+    utils/ontology.load_ontology for caching.
+    """
+    return load_ontology(file_path, **kwargs)
 
 
-def load_gene_ontology() -> Ontology:
-    return Ontology("http://purl.obolibrary.org/obo/go.obo")
+@instrumented()
+def load_gene_ontology(file_path: str = GENE_ONTOLOGY_URL, **kwargs) -> CompactOntology:
+    """
+    file_path may be a local OBO file, which is what build hosts without internet access should pass. See
+    utils/ontology.load_ontology for caching.
+    """
+    return load_ontology(file_path, **kwargs)